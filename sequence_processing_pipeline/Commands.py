@@ -1,10 +1,16 @@
 import glob
 import gzip
 import os
+from sequence_processing_pipeline.FastqStats import FastqStats
 from sequence_processing_pipeline.util import (iter_paired_files,
                                                determine_orientation)
 
 
+# the number of records buffered for each output file before they are added
+# to its QC statistics.
+QC_STATS_BATCH_SIZE = 10000
+
+
 def split_similar_size_bins(data_location_path, max_file_list_size_in_gb,
                             batch_prefix):
     '''Partitions input fastqs to coarse bins
@@ -72,7 +78,7 @@ def split_similar_size_bins(data_location_path, max_file_list_size_in_gb,
     return split_offset, max_bucket_size
 
 
-def demux_cmd(id_map_fp, fp_fp, out_d, task, maxtask):
+def demux_cmd(id_map_fp, fp_fp, out_d, task, maxtask, stats_dir=None):
     with open(id_map_fp, 'r') as f:
         id_map = f.readlines()
         id_map = [line.strip().split('\t') for line in id_map]
@@ -80,11 +86,16 @@ def demux_cmd(id_map_fp, fp_fp, out_d, task, maxtask):
     # fp needs to be an open file handle.
     # ensure task and maxtask are proper ints when coming from cmd-line.
     with open(fp_fp, 'r') as fp:
-        demux(id_map, fp, out_d, int(task), int(maxtask))
+        demux(id_map, fp, out_d, int(task), int(maxtask), stats_dir=stats_dir)
+
 
+def demux(id_map, fp, out_d, task, maxtask, stats_dir=None):
+    """Split infile data based in provided map
 
-def demux(id_map, fp, out_d, task, maxtask):
-    """Split infile data based in provided map"""
+    If stats_dir is given, FastQC-compatible QC statistics are collected for
+    each output file as its records are written, and a report is written to
+    stats_dir/<outbase> for each output file w/at least one record.
+    """
     delimiter = '::MUX::'
     mode = 'wt'
     ext = '.fastq.gz'
@@ -92,6 +103,8 @@ def demux(id_map, fp, out_d, task, maxtask):
     rec = '@'
 
     openfps = {}
+    stats = {}
+    buffers = {}
 
     for offset, (idx, r1, r2, outbase) in enumerate(id_map):
         if offset % maxtask == task:
@@ -108,6 +121,11 @@ def demux(id_map, fp, out_d, task, maxtask):
             current_fp = {'1': current_fp_r1, '2': current_fp_r2}
             openfps[idx] = current_fp
 
+            if stats_dir is not None:
+                stats[idx] = {'1': (outbase, r1 + ext, FastqStats()),
+                              '2': (outbase, r2 + ext, FastqStats())}
+                buffers[idx] = {'1': [], '2': []}
+
     # setup a parser
     seq_id = iter(fp)
     seq = iter(fp)
@@ -153,6 +171,30 @@ def demux(id_map, fp, out_d, task, maxtask):
         current_fp[orientation].write(d)
         current_fp[orientation].write(q)
 
+        if stats_dir is not None:
+            buffer = buffers[fname_encoded][orientation]
+            buffer.append(sid + s + d + q)
+            if len(buffer) >= QC_STATS_BATCH_SIZE:
+                _add_to_stats(stats[fname_encoded][orientation][2], buffer)
+
     for d in openfps.values():
         for f in d.values():
             f.close()
+
+    for idx, d in stats.items():
+        for orientation, (outbase, file_name, qc_stats) in d.items():
+            _add_to_stats(qc_stats, buffers[idx][orientation])
+            if qc_stats.read_count:
+                qc_stats.write(os.path.join(stats_dir, outbase), file_name)
+
+
+def _add_to_stats(qc_stats, buffer):
+    block = ''.join(buffer)
+    if block and not block.endswith('\n'):
+        # the last record in the input may not end w/a newline.
+        block += '\n'
+
+    if qc_stats.add_block(block.encode()):
+        raise ValueError("demux records are malformed")
+
+    buffer.clear()
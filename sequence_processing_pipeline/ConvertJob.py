@@ -1,7 +1,6 @@
 from os.path import join, exists, split
 from sequence_processing_pipeline.Job import Job
-from sequence_processing_pipeline.PipelineError import (PipelineError,
-                                                        JobFailedError)
+from sequence_processing_pipeline.PipelineError import PipelineError
 import logging
 import re
 from metapool import load_sample_sheet, sheet_needs_demuxing, \
@@ -143,36 +142,34 @@ class ConvertJob(Job):
                 line = re.sub(r'\s+', ' ', line)
                 f.write(f"{line}\n")
 
-    def run(self, callback=None):
+    def submit(self, callback=None):
         """
-        Run BCL2Fastq/BCLConvert conversion
+        Submit BCL2Fastq/BCLConvert conversion w/out waiting for it to finish.
         :param callback: optional function taking two parameters (id, status)
                          that is called when a running process's status is
                          changed.
-        :return:
+        :return: The Slurm job-id of the submitted job.
         """
-        try:
-            job_info = self.submit_job(self.job_script_path,
-                                       exec_from=self.log_path,
-                                       callback=callback)
-
-            # ConvertJob() is used to process Amplicon as well as Meta*Omic
-            # runs. Amplicon runs use a dummy sample-sheet generated by
-            # Pipeline(). For these types of sheets we can't copy controls
-            # between projects because demuxing is not performed here.
-            _, sheet_name = split(self.sample_sheet_path)
-            if sheet_name != 'dummy_sample_sheet.csv':
-                self.copy_controls_between_projects()
-
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            info = self.parse_logs()
-            # prepend just the message component of the Error.
-            info.insert(0, str(e))
-            raise JobFailedError('\n'.join(info))
-
-        self. mark_job_completed()
+        return self.submit_job(self.job_script_path,
+                               exec_from=self.log_path,
+                               wait=False,
+                               callback=callback)
+
+    def finalize(self, job_info):
+        """
+        Post-process the results of a successful conversion.
+        :param job_info: The dictionary returned by wait().
+        :return: None
+        """
+        # ConvertJob() is used to process Amplicon as well as Meta*Omic
+        # runs. Amplicon runs use a dummy sample-sheet generated by
+        # Pipeline(). For these types of sheets we can't copy controls
+        # between projects because demuxing is not performed here.
+        _, sheet_name = split(self.sample_sheet_path)
+        if sheet_name != 'dummy_sample_sheet.csv':
+            self.copy_controls_between_projects()
+
+        self.mark_job_completed()
 
         logging.info(f'Successful job: {job_info}')
 
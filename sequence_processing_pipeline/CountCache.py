@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from os import stat
+from os.path import abspath
+import sqlite3
+
+
+class CountCache:
+    # seconds to wait on another process holding a lock on the database.
+    timeout = 60
+
+    # the number of paths looked up in a single query.
+    query_size = 500
+
+    def __init__(self, path):
+        """
+        Persists the read and base counts of files between runs.
+        Counts are keyed on a file's path and are only returned while the
+        file's size, mtime and inode are unchanged, hence a file that is
+        rewritten or replaced is counted again.
+        :param path: The path to a SQLite database. Created if it doesn't
+                     exist.
+        """
+        self.path = path
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS counts ('
+                         'path TEXT PRIMARY KEY, '
+                         'size INTEGER NOT NULL, '
+                         'mtime_ns INTEGER NOT NULL, '
+                         'inode INTEGER NOT NULL, '
+                         'seq_counts INTEGER NOT NULL, '
+                         'base_pairs INTEGER NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        # commit on success and close the connection either way.
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _identity(file_path):
+        st = stat(file_path)
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def get(self, file_path):
+        """
+        Returns the counts for a file, if they are known.
+        :param file_path: The path to a file.
+        :return: A tuple of sequence and base-pair counts, or None if the
+                 file hasn't been counted or has changed since.
+        """
+        return self.get_many([file_path]).get(file_path)
+
+    def get_many(self, file_paths):
+        """
+        Returns the known counts for many files.
+        :param file_paths: A list of paths to files.
+        :return: A dictionary of (sequence, base-pair) count tuples, keyed on
+                 path. Files that haven't been counted, have changed or don't
+                 exist are absent.
+        """
+        keys = sorted(set([abspath(x) for x in file_paths]))
+        rows = {}
+
+        with self._connect() as conn:
+            for i in range(0, len(keys), self.query_size):
+                chunk = keys[i:i + self.query_size]
+                query = ('SELECT path, size, mtime_ns, inode, seq_counts, '
+                         'base_pairs FROM counts WHERE path IN (%s)' %
+                         ', '.join(['?'] * len(chunk)))
+                for row in conn.execute(query, chunk):
+                    rows[row[0]] = row[1:]
+
+        results = {}
+        for file_path in file_paths:
+            row = rows.get(abspath(file_path))
+            if row is None:
+                continue
+
+            try:
+                identity = self._identity(file_path)
+            except FileNotFoundError:
+                continue
+
+            if tuple(row[:3]) == identity:
+                results[file_path] = tuple(row[3:])
+
+        return results
+
+    def put_many(self, counts):
+        """
+        Record the counts of many files.
+        :param counts: A dictionary of (sequence, base-pair) count tuples,
+                       keyed on path.
+        :return: None
+        """
+        rows = []
+        for file_path, (seq_counts, base_pairs) in counts.items():
+            rows.append((abspath(file_path),) + self._identity(file_path) +
+                        (seq_counts, base_pairs))
+
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO counts VALUES '
+                             '(?, ?, ?, ?, ?, ?)', rows)
@@ -0,0 +1,383 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from os import environ, cpu_count, makedirs
+from os.path import join, dirname, abspath
+from socket import gethostname
+from subprocess import Popen, TimeoutExpired
+from sequence_processing_pipeline.PipelineError import (PipelineError,
+                                                        ExecFailedError)
+from threading import Lock
+from time import sleep
+import logging
+import re
+import shlex
+
+
+class Executor:
+    # the number of seconds Job.wait_on_job_ids() should sleep between
+    # queries. None defers to Job.polling_interval_in_seconds.
+    polling_interval_in_seconds = None
+
+    def submit(self, job, script_path, job_parameters=None,
+               script_parameters=None, exec_from=None):
+        """
+        Submit a job script for execution.
+        :param job: The Job object submitting the script.
+        :param script_path: The path to a Slurm job (bash) script.
+        :param job_parameters: Optional parameters for scheduler submission.
+        :param script_parameters: Optional parameters for your job script.
+        :param exec_from: Set working directory to execute command from.
+        :return: The id of the submitted job as a string.
+        """
+        raise PipelineError("Base class submit() method not implemented.")
+
+    def query(self, job, job_ids):
+        """
+        Query the state of submitted jobs.
+        :param job: The Job object querying the state.
+        :param job_ids: A list of job-ids returned by submit().
+        :return: A dictionary of job-ids (or array-ids for array jobs) and
+                 their Slurm-compatible states.
+        """
+        raise PipelineError("Base class query() method not implemented.")
+
+
+class SlurmExecutor(Executor):
+    # give some time for everything to be set up properly after submission.
+    submission_delay_in_seconds = 10
+
+    def submit(self, job, script_path, job_parameters=None,
+               script_parameters=None, exec_from=None):
+        if job_parameters:
+            cmd = 'sbatch %s %s' % (job_parameters, script_path)
+        else:
+            cmd = 'sbatch %s' % (script_path)
+
+        if script_parameters:
+            cmd += ' %s' % script_parameters
+
+        if exec_from:
+            cmd = f'cd {exec_from};' + cmd
+
+        logging.debug("job scheduler call: %s" % cmd)
+
+        # if system_call does not raise a PipelineError(), then the scheduler
+        # successfully submitted the job. In this case, it should return
+        # the id of the job in stdout.
+        results = job._system_call(cmd)
+        stdout = results['stdout']
+
+        job_id = stdout.strip().split()[-1]
+
+        # Just to give some time for everything to be set up properly
+        sleep(self.submission_delay_in_seconds)
+
+        return job_id
+
+    def query(self, job, job_ids):
+        # query encapsulates the handling of squeue.
+        count = 0
+        while True:
+            result = job._system_call("squeue -t all -j "
+                                      f"{','.join(job_ids)} "
+                                      "-o '%i,%T'")
+
+            if result['return_code'] == 0:
+                # there was no issue w/squeue, break this loop and
+                # continue.
+                break
+            else:
+                # there was likely an intermittent issue w/squeue. Pause
+                # and wait before trying a few more times. If the problem
+                # persists then report the error and exit.
+                count += 1
+
+                if count > 3:
+                    raise ExecFailedError(result['stderr'])
+
+                sleep(job.squeue_retry_in_seconds)
+
+        lines = result['stdout'].split('\n')
+        lines.pop(0)  # remove header
+        lines = [x.split(',') for x in lines if x != '']
+
+        jobs = {}
+        for job_id, state in lines:
+            # ensure unique_id is of type string for downstream use.
+            job_id = str(job_id)
+            jobs[job_id] = state
+
+        return jobs
+
+
+def parse_sbatch_options(tokens):
+    """
+    Parses sbatch command-line options into a dictionary.
+    :param tokens: A list of tokens e.g.: ['-J', 'foo', '--array=1-4'].
+    :return: A dictionary of option names (w/out leading dashes) and values.
+             Options w/out a value e.g. --parsable are set to True.
+    """
+    options = {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+
+        if not token.startswith('-'):
+            continue
+
+        name = token.lstrip('-')
+
+        if '=' in name:
+            name, value = name.split('=', 1)
+        elif i < len(tokens) and not tokens[i].startswith('-'):
+            value = tokens[i]
+            i += 1
+        else:
+            value = True
+
+        options[name] = value
+
+    return options
+
+
+def parse_array_spec(array_spec):
+    """
+    Parses the value of sbatch's --array option.
+    :param array_spec: A string e.g.: '1-10%2', '1,3,5', '0-15:4'.
+    :return: A list of task-ids and the maximum number of tasks to run at
+             the same time, or None if unlimited.
+    """
+    throttle = None
+    if '%' in array_spec:
+        array_spec, throttle = array_spec.split('%')
+        throttle = int(throttle)
+
+    task_ids = []
+    for item in array_spec.split(','):
+        m = re.match(r'^(\d+)(?:-(\d+)(?::(\d+))?)?$', item)
+        if m is None:
+            raise ValueError(f"'{array_spec}' is not a valid array spec")
+        start, stop, step = m.groups()
+        start = int(start)
+        stop = start if stop is None else int(stop)
+        step = 1 if step is None else int(step)
+        task_ids += list(range(start, stop + 1, step))
+
+    return sorted(set(task_ids)), throttle
+
+
+def parse_time_limit(time_limit):
+    """
+    Parses the value of sbatch's --time option.
+    :param time_limit: A string e.g.: '60', '1:00:00', '2-00:00:00'.
+    :return: The time limit in seconds.
+    """
+    days = 0
+    if '-' in time_limit:
+        days, time_limit = time_limit.split('-', 1)
+        days = int(days)
+        units = [int(x) for x in time_limit.split(':')]
+        # days-hours[:minutes[:seconds]]
+        units += [0] * (3 - len(units))
+        hours, minutes, seconds = units
+    else:
+        units = [int(x) for x in time_limit.split(':')]
+        if len(units) == 1:
+            hours, minutes, seconds = 0, units[0], 0
+        elif len(units) == 2:
+            hours, minutes, seconds = 0, units[0], units[1]
+        else:
+            hours, minutes, seconds = units
+
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+class LocalExecutor(Executor):
+    # jobs running locally are not subject to squeue rate-limits.
+    polling_interval_in_seconds = 1
+
+    _job_ids = count(1)
+    _job_ids_lock = Lock()
+
+    def __init__(self, max_workers=None):
+        """
+        Runs job scripts on the local machine instead of submitting them to
+        Slurm. Array jobs are run once for each task w/SLURM_ARRAY_TASK_ID
+        set accordingly. At most max_workers scripts are run at the same
+        time across all submitted jobs. States are reported using the same
+        names Slurm uses.
+        :param max_workers: The maximum number of scripts to run at the same
+                            time. Defaults to the number of CPUs.
+        """
+        self.max_workers = max_workers if max_workers else cpu_count()
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.lock = Lock()
+        self.states = {}
+        self.queued = {}
+
+    def submit(self, job, script_path, job_parameters=None,
+               script_parameters=None, exec_from=None):
+        script_path = abspath(script_path)
+        cwd = exec_from if exec_from else abspath('.')
+
+        # as w/sbatch, command-line options override #SBATCH directives.
+        options = self._parse_directives(script_path)
+        if job_parameters:
+            options.update(parse_sbatch_options(shlex.split(job_parameters)))
+
+        with LocalExecutor._job_ids_lock:
+            job_id = str(next(LocalExecutor._job_ids))
+
+        logging.debug(f"local execution of {script_path} as job {job_id}")
+
+        if 'chdir' in options:
+            cwd = options['chdir']
+        elif 'D' in options:
+            cwd = options['D']
+
+        cmd = self._get_interpreter(script_path) + [script_path]
+        if script_parameters:
+            cmd += shlex.split(script_parameters)
+
+        job_name = options.get('job-name', options.get('J', 'sbatch'))
+
+        env = dict(environ)
+        env.update({'SLURM_JOB_ID': job_id,
+                    'SLURM_JOBID': job_id,
+                    'SLURM_JOB_NAME': job_name,
+                    'SLURM_SUBMIT_DIR': cwd,
+                    'SLURMD_NODENAME': gethostname(),
+                    'SLURM_CPUS_PER_TASK': str(
+                        options.get('cpus-per-task', options.get('c', 1)))})
+
+        export = options.get('export', 'ALL')
+        if export not in ['ALL', 'NONE']:
+            # unlike Slurm, the local environment is always passed along.
+            for item in export.split(','):
+                if '=' in item:
+                    name, value = item.split('=', 1)
+                    env[name] = value
+
+        time_limit = options.get('time', options.get('t', None))
+        if time_limit is not None:
+            time_limit = parse_time_limit(str(time_limit))
+
+        array_spec = options.get('array', options.get('a', None))
+
+        tasks = []
+        if array_spec is None:
+            stdout = options.get('output', options.get('o', 'slurm-%j.out'))
+            stderr = options.get('error', options.get('e', None))
+            tasks.append((job_id, None, stdout, stderr))
+            throttle = None
+        else:
+            task_ids, throttle = parse_array_spec(array_spec)
+            env['SLURM_ARRAY_JOB_ID'] = job_id
+            env['SLURM_ARRAY_TASK_COUNT'] = str(len(task_ids))
+            env['SLURM_ARRAY_TASK_MIN'] = str(task_ids[0])
+            env['SLURM_ARRAY_TASK_MAX'] = str(task_ids[-1])
+            stdout = options.get('output', options.get('o', 'slurm-%A_%a.out'))
+            stderr = options.get('error', options.get('e', None))
+            for task_id in task_ids:
+                tasks.append((f'{job_id}_{task_id}', task_id, stdout, stderr))
+
+        with self.lock:
+            for array_id, _, _, _ in tasks:
+                self.states[array_id] = 'PENDING'
+            self.queued[job_id] = tasks
+
+        params = (job_id, job_name, cmd, cwd, env, time_limit)
+
+        # submit only as many tasks as the array's throttle allows. Each
+        # task that finishes will submit the next one.
+        for _ in range(throttle if throttle else len(tasks)):
+            self._submit_next(params)
+
+        return job_id
+
+    def query(self, job, job_ids):
+        jobs = {}
+        with self.lock:
+            for array_id, state in self.states.items():
+                if array_id.split('_')[0] in job_ids:
+                    jobs[array_id] = state
+        return jobs
+
+    def _submit_next(self, params):
+        job_id = params[0]
+        with self.lock:
+            if not self.queued[job_id]:
+                return
+            task = self.queued[job_id].pop(0)
+
+        future = self.pool.submit(self._run_task, params, task)
+        future.add_done_callback(lambda _: self._submit_next(params))
+
+    def _run_task(self, params, task):
+        job_id, job_name, cmd, cwd, env, time_limit = params
+        array_id, task_id, stdout, stderr = task
+
+        env = dict(env)
+        if task_id is not None:
+            env['SLURM_ARRAY_TASK_ID'] = str(task_id)
+
+        def _expand(pattern):
+            # support the filename patterns most commonly used w/sbatch.
+            replacements = {'%%': '%', '%x': job_name, '%j': job_id,
+                            '%A': job_id, '%a': str(task_id)}
+            return re.sub('%[%xjAa]', lambda m: replacements[m.group(0)],
+                          join(cwd, pattern))
+
+        with self.lock:
+            self.states[array_id] = 'RUNNING'
+
+        try:
+            stdout = _expand(stdout)
+            makedirs(dirname(stdout), exist_ok=True)
+
+            with open(stdout, 'w') as out:
+                if stderr is None:
+                    err = out
+                else:
+                    stderr = _expand(stderr)
+                    makedirs(dirname(stderr), exist_ok=True)
+                    err = open(stderr, 'w')
+
+                try:
+                    proc = Popen(cmd, cwd=cwd, env=env, stdout=out,
+                                 stderr=err)
+                    try:
+                        return_code = proc.wait(timeout=time_limit)
+                        state = 'COMPLETED' if return_code == 0 else 'FAILED'
+                    except TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+                        state = 'TIMEOUT'
+                finally:
+                    if err is not out:
+                        err.close()
+        except OSError as e:
+            logging.error(f"job {array_id} could not be run: {e}")
+            state = 'FAILED'
+
+        with self.lock:
+            self.states[array_id] = state
+
+    def _parse_directives(self, script_path):
+        tokens = []
+        with open(script_path, 'r') as f:
+            for line in f:
+                if line.startswith('#SBATCH'):
+                    tokens += shlex.split(line[len('#SBATCH'):])
+
+        return parse_sbatch_options(tokens)
+
+    def _get_interpreter(self, script_path):
+        with open(script_path, 'r') as f:
+            line = f.readline().strip()
+
+        if line.startswith('#!'):
+            return shlex.split(line[2:])
+
+        return ['/bin/bash']
@@ -5,21 +5,30 @@ import logging
 from os import listdir, makedirs
 from os.path import join, basename
 from re import sub
+from sys import executable
+from sequence_processing_pipeline.FastqStats import (fastqc_name,
+                                                     FASTQC_COMPATIBLE_VERSION)
 from sequence_processing_pipeline.Job import Job, KISSLoader
-from sequence_processing_pipeline.PipelineError import (PipelineError,
-                                                        JobFailedError)
+from sequence_processing_pipeline.PipelineError import PipelineError
+from sequence_processing_pipeline.ResultCache import ResultCache
 
 
 class FastQCJob(Job):
+    native_qc_command = (f'{executable} -m sequence_processing_pipeline.'
+                         'scripts.cli fastq-qc')
+
     def __init__(self, run_dir, output_path, raw_fastq_files_path,
                  processed_fastq_files_path, nprocs, nthreads, fastqc_path,
                  modules_to_load, qiita_job_id, queue_name, node_count,
                  wall_time_limit, jmem, pool_size,
-                 max_array_length, is_amplicon):
+                 max_array_length, is_amplicon, pack_by_size=False,
+                 min_bytes_per_task=0, native_qc=False,
+                 skip_processed_fastq=False, use_cache=False,
+                 cache_checksums=False):
         super().__init__(run_dir,
                          output_path,
                          'FastQCJob',
-                         [fastqc_path],
+                         [] if native_qc else [fastqc_path],
                          max_array_length,
                          modules_to_load=modules_to_load)
 
@@ -35,13 +44,48 @@ class FastQCJob(Job):
         self.raw_fastq_files_path = raw_fastq_files_path
         self.processed_fastq_files_path = processed_fastq_files_path
         self.is_amplicon = is_amplicon
+        # if True, reports are generated by FastqStats rather than fastqc.
+        self.native_qc = native_qc
+        # if True, only raw fastq files are processed. Reports for processed
+        # files are expected from NuQCJob(collect_qc_stats=True) instead.
+        self.skip_processed_fastq = skip_processed_fastq
+        # the number of bytes of fastq each command processes. Only needed,
+        # and hence only gathered, w/pack_by_size.
+        self.pack_by_size = pack_by_size
+        self.command_sizes = {}
+
+        if use_cache:
+            # leave out commands whose reports are up to date from a previous
+            # run.
+            self.result_cache = ResultCache(
+                join(self.output_path, f'{self.job_name}.cache.json'),
+                checksums=cache_checksums)
+            self.tool_version = (
+                f'FastqStats {FASTQC_COMPATIBLE_VERSION}' if native_qc else
+                self._get_tool_version(fastqc_path))
 
         self.job_script_path = join(self.output_path, f"{self.job_name}.sh")
 
         self.commands, self.project_names = self._get_commands()
         # for lists greater than n commands, chain the extra commands,
-        # distributing them evenly throughout the first n commands.
-        self.commands = self._group_commands(self.commands)
+        # distributing them evenly throughout the first n commands. If
+        # pack_by_size is True, distribute them so that each array task
+        # processes a similar amount of data instead.
+        self.task_commands = self._group_command_lists(
+            self.commands,
+            sizes=self.command_sizes if self.pack_by_size else None,
+            min_bytes_per_task=min_bytes_per_task)
+        self.commands = [';'.join(x) for x in self.task_commands]
+        # the commands task_runner.py runs for each array task.
+        self.manifest_commands = self.task_commands
+
+        if self.native_qc:
+            # process all of the files assigned to an array task w/a single
+            # pool of nprocs processes.
+            self.commands = [self._merge_native_commands(x) for x in
+                             self.task_commands]
+            self.manifest_commands = [[x] for x in self.commands]
+
         self.suffix = 'fastqc.html'
 
         # for projects that use sequence_processing_pipeline as a dependency,
@@ -61,23 +105,55 @@ class FastQCJob(Job):
         # gather the parameters for processing all relevant raw fastq
         # files.
         params, project_names = self._scan_fastq_files(True)
-        for fwd_file_path, rev_file_path, output_path in params:
-            command = ['fastqc', '--noextract', '-t', str(self.nthreads),
-                       fwd_file_path, rev_file_path, '-o', output_path]
-            results.append(' '.join(command))
 
-        if not self.is_amplicon:
+        if not (self.is_amplicon or self.skip_processed_fastq):
             # next, do the same for the trimmed/filtered fastq files.
-            params, additional_project_names = self._scan_fastq_files(False)
-            for fwd_file_path, rev_file_path, output_path in params:
-                command = ['fastqc', '--noextract', '-t', str(self.nthreads),
-                           fwd_file_path, rev_file_path, '-o', output_path]
-                results.append(' '.join(command))
+            additional_params, additional_project_names = \
+                self._scan_fastq_files(False)
+            params += additional_params
             # remove duplicate project names from the list
             project_names = list(set(project_names + additional_project_names))
 
+        for fwd_file_path, rev_file_path, output_path in params:
+            command = self._get_command(fwd_file_path, rev_file_path,
+                                        output_path)
+
+            # fastqc and fastq-qc write an .html and a .zip for each file.
+            output_paths = [join(output_path, fastqc_name(x) + ext) for x in
+                            [fwd_file_path, rev_file_path]
+                            for ext in ['.html', '.zip']]
+
+            if self._is_cached(command, [fwd_file_path, rev_file_path],
+                               output_paths):
+                continue
+
+            results.append(command)
+            if self.pack_by_size:
+                self.command_sizes[command] = self._total_size(
+                    [fwd_file_path, rev_file_path])
+
         return results, project_names
 
+    def _get_command(self, fwd_file_path, rev_file_path, output_path):
+        if self.native_qc:
+            return (f'{self.native_qc_command} --input {fwd_file_path} '
+                    f'{output_path} --input {rev_file_path} {output_path}')
+
+        command = ['fastqc', '--noextract', '-t', str(self.nthreads),
+                   fwd_file_path, rev_file_path, '-o', output_path]
+        return ' '.join(command)
+
+    def _merge_native_commands(self, commands):
+        """
+        Merge the native QC commands of an array task into a single command.
+        :param commands: A list of commands from _group_command_lists().
+        :return: A command that processes all of their inputs w/a pool of
+                 nprocs processes.
+        """
+        inputs = [x[len(self.native_qc_command):] for x in commands]
+        return (f'{self.native_qc_command} --processes {self.nprocs}' +
+                ''.join(inputs))
+
     def _find_projects(self, path_to_run_id_data_fastq_dir, is_raw_input):
         results = []
         for directory in listdir(path_to_run_id_data_fastq_dir):
@@ -189,37 +265,52 @@ class FastQCJob(Job):
                       f'failed_indexes_{job_id}.json')
 
         if failed_indexes:
+            report = {'job_id': job_id, 'failed_indexes': failed_indexes}
+
+            # include the commands that failed and how, where known.
+            failed_commands = self._get_failed_commands(failed_indexes)
+            if failed_commands:
+                report['failed_commands'] = failed_commands
+
             with open(log_fp, 'w') as f:
-                f.write(dumps({'job_id': job_id,
-                               'failed_indexes': failed_indexes}, indent=2))
+                f.write(dumps(report, indent=2))
 
         return failed_indexes
 
-    def run(self, callback=None):
-        try:
-            job_info = self.submit_job(self.job_script_path,
-                                       exec_from=self.log_path,
-                                       callback=callback)
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            info = self.parse_logs()
-            # prepend just the message component of the Error.
-            info.insert(0, str(e))
-            raise JobFailedError('\n'.join(info)) from None
+    def complete_locally(self, callback=None):
+        if not self.commands:
+            # all reports are up to date; there is nothing to submit.
+            logging.debug('FastQCJob has no commands to run.')
+            return {'job_id': None, 'job_state': 'COMPLETED'}
 
+        return None
+
+    def submit(self, callback=None):
+        self._clear_task_markers()
+        return self.submit_job(self.job_script_path,
+                               exec_from=self.log_path,
+                               wait=False,
+                               callback=callback)
+
+    def finalize(self, job_info):
         logging.debug(job_info)
 
-        if self._get_failed_indexes(job_info['job_id']):
+        failed_indexes = self._get_failed_indexes(job_info['job_id'])
+
+        # cache the reports of the tasks that completed, even if others
+        # failed, so that they aren't regenerated when the job is rerun.
+        self._cache_completed_commands(failed_indexes)
+
+        if failed_indexes:
             # raise error if list isn't empty.
             raise PipelineError("FastQCJob did not complete successfully.")
 
         self.mark_job_completed()
 
     def _generate_job_script(self):
-        # bypass generating job script for a force-fail job, since it is
-        # not needed.
-        if self.force_job_fail:
+        # bypass generating job script for a force-fail job, or if there
+        # are no commands to run, since it is not needed.
+        if self.force_job_fail or not self.commands:
             return None
 
         template = self.jinja_env.get_template("fastqc_job.sh")
@@ -227,6 +318,8 @@ class FastQCJob(Job):
         job_name = f'{self.qiita_job_id}_{self.job_name}'
         details_file_name = f'{self.job_name}.array-details'
         array_details = join(self.output_path, details_file_name)
+        task_manifest = join(self.output_path, f'{self.job_name}.tasks.json')
+        self._write_task_manifest(task_manifest, self.manifest_commands)
         array_params = "1-%d%%%d" % (len(self.commands), self.pool_size)
         modules_to_load = ' '.join(self.modules_to_load)
 
@@ -237,10 +330,17 @@ class FastQCJob(Job):
                                     node_count=self.node_count,
                                     nprocs=self.nprocs,
                                     wall_time_limit=self.wall_time_limit,
-                                    mem_in_gb=self.jmem,
+                                    mem_in_gb=self._task_memory(
+                                        self.jmem, self.nprocs,
+                                        self.nthreads,
+                                        self.manifest_commands),
                                     array_params=array_params,
                                     output_path=self.output_path,
-                                    modules_to_load=modules_to_load))
+                                    modules_to_load=modules_to_load,
+                                    nthreads=self.nthreads,
+                                    python_path=executable,
+                                    task_runner_path=self.task_runner_path,
+                                    task_manifest=task_manifest))
 
         # save the .details file as well
         with open(array_details, 'w') as f:
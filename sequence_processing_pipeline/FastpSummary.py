@@ -0,0 +1,136 @@
+from concurrent.futures import ProcessPoolExecutor
+from json import load
+from os.path import basename, isdir, sep
+from sequence_processing_pipeline.FileManifest import (FileManifest,
+                                                       extract_sample_id)
+import pandas as pd
+
+
+# the columns of the summary, in order.
+COLUMNS = ['project', 'sample', 'file', 'fastp_version',
+           'reads_before', 'bases_before', 'q30_rate_before',
+           'gc_content_before', 'read1_mean_length_before',
+           'read2_mean_length_before',
+           'reads_after', 'bases_after', 'q30_rate_after',
+           'gc_content_after', 'read1_mean_length_after',
+           'read2_mean_length_after',
+           'passed_filter_reads', 'low_quality_reads', 'too_many_n_reads',
+           'too_short_reads', 'too_long_reads',
+           'duplication_rate', 'adapter_trimmed_reads',
+           'adapter_trimmed_bases', 'insert_size_peak', 'path']
+
+# the fields of fastp's before_filtering and after_filtering summaries that
+# are reported.
+SUMMARY_FIELDS = [('total_reads', 'reads'), ('total_bases', 'bases'),
+                  ('q30_rate', 'q30_rate'), ('gc_content', 'gc_content'),
+                  ('read1_mean_length', 'read1_mean_length'),
+                  ('read2_mean_length', 'read2_mean_length')]
+
+FILTERING_FIELDS = [('passed_filter_reads', 'passed_filter_reads'),
+                    ('low_quality_reads', 'low_quality_reads'),
+                    ('too_many_N_reads', 'too_many_n_reads'),
+                    ('too_short_reads', 'too_short_reads'),
+                    ('too_long_reads', 'too_long_reads')]
+
+
+def find_fastp_reports(paths):
+    """
+    Returns the fastp JSON reports found in paths.
+    :param paths: A list of JSON files and directories. Directories are
+                  searched for JSON files in fastp_reports_dir/json
+                  directories, such as those NuQCJob creates for each
+                  project.
+    :return: A sorted list of paths to JSON files.
+    """
+    results = []
+    for some_path in paths:
+        if isdir(some_path):
+            files = FileManifest.get(some_path).find_files(some_path,
+                                                           suffix='.json')
+            marker = sep + 'fastp_reports_dir' + sep + 'json' + sep
+            results += [x for x in files if marker in x]
+        else:
+            results.append(some_path)
+
+    return sorted(set(results))
+
+
+def load_fastp_report(report_path):
+    """
+    Returns the summary statistics from a fastp JSON report.
+    :param report_path: The path to a JSON report.
+    :return: A dictionary w/the keys in COLUMNS.
+    """
+    with open(report_path, 'r') as f:
+        report = load(f)
+
+    summary = report.get('summary', {})
+    row = {'file': basename(report_path),
+           'sample': extract_sample_id(basename(report_path)),
+           'fastp_version': summary.get('fastp_version'),
+           'path': report_path}
+
+    # reports are organized as <project>/fastp_reports_dir/json/<file>.
+    parts = report_path.split(sep)
+    row['project'] = (parts[-4] if len(parts) >= 4 and
+                      parts[-3] == 'fastp_reports_dir' else None)
+
+    for section, suffix in [('before_filtering', 'before'),
+                            ('after_filtering', 'after')]:
+        values = summary.get(section, {})
+        for key, column in SUMMARY_FIELDS:
+            row[f'{column}_{suffix}'] = values.get(key)
+
+    values = report.get('filtering_result', {})
+    for key, column in FILTERING_FIELDS:
+        row[column] = values.get(key)
+
+    # duplication, adapter_cutting and insert_size are absent when the
+    # corresponding fastp features are disabled or found nothing.
+    row['duplication_rate'] = report.get('duplication', {}).get('rate')
+    adapter_cutting = report.get('adapter_cutting', {})
+    row['adapter_trimmed_reads'] = adapter_cutting.get(
+        'adapter_trimmed_reads', 0)
+    row['adapter_trimmed_bases'] = adapter_cutting.get(
+        'adapter_trimmed_bases', 0)
+    row['insert_size_peak'] = report.get('insert_size', {}).get('peak')
+
+    return row
+
+
+def summarize_fastp_reports(report_paths, processes=1):
+    """
+    Load many fastp JSON reports into a single table.
+    :param report_paths: A list of paths to JSON reports.
+    :param processes: The number of processes to parse reports with.
+    :return: A DataFrame w/one row for each report and COLUMNS as columns.
+    """
+    if processes > 1 and len(report_paths) > 1:
+        # parsing is CPU-bound; hand each process large batches of reports
+        # to amortize the cost of returning results.
+        chunk_size = max(1, len(report_paths) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            rows = list(executor.map(load_fastp_report, report_paths,
+                                     chunksize=chunk_size))
+    else:
+        rows = [load_fastp_report(x) for x in report_paths]
+
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    return df.sort_values(by=['project', 'sample', 'file'],
+                          na_position='first').reset_index(drop=True)
+
+
+def write_fastp_summary(df, output_path):
+    """
+    Write a summary table as parquet or tab-separated values.
+    :param df: A DataFrame returned by summarize_fastp_reports().
+    :param output_path: The path to write to. Paths ending in '.parquet' are
+                        written as parquet, which requires pyarrow or
+                        fastparquet to be installed. Otherwise, TSV is
+                        written.
+    :return: None
+    """
+    if output_path.endswith('.parquet'):
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, sep='\t', index=False)
@@ -0,0 +1,520 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from html import escape
+from os import makedirs
+from os.path import basename, getsize, join
+from zipfile import ZipFile, ZIP_DEFLATED
+import gzip
+import numpy as np
+import re
+
+
+# the version of FastQC whose fastqc_data.txt format is reproduced. MultiQC
+# reads the version from the first line of the file.
+FASTQC_COMPATIBLE_VERSION = '0.11.9'
+
+PHRED_OFFSET = 33
+# phred scores are tracked from 0 to 93 ('!' to '~').
+QUALITY_BINS = 94
+
+# bases are counted in the order FastQC reports them. Anything else is an N.
+BASES = 'GATCN'
+BASE_CODES = np.full(256, BASES.index('N'), dtype=np.uint8)
+for i, base in enumerate(BASES):
+    BASE_CODES[ord(base)] = i
+    BASE_CODES[ord(base.lower())] = i
+
+# like FastQC, reads longer than this are truncated to
+# DUPLICATION_TRUNCATE_TO bases when checking for duplicates.
+DUPLICATION_MAX_LENGTH = 75
+DUPLICATION_TRUNCATE_TO = 50
+
+# FastQC's duplication levels.
+DUPLICATION_LEVELS = [('1', 1), ('2', 2), ('3', 3), ('4', 4), ('5', 5),
+                      ('6', 6), ('7', 7), ('8', 8), ('9', 9), ('>10', 10),
+                      ('>50', 50), ('>100', 100), ('>500', 500),
+                      ('>1k', 1000), ('>5k', 5000), ('>10k+', 10000)]
+
+
+def fastqc_name(file_name):
+    """
+    Returns the name FastQC gives its outputs for a fastq file.
+    :param file_name: The name of a fastq file e.g. 'a_R1.fastq.gz'.
+    :return: e.g. 'a_R1_fastqc'.
+    """
+    name = re.sub(r'\.gz$', '', basename(file_name))
+    name = re.sub(r'\.(fastq|fq)$', '', name)
+    return f'{name}_fastqc'
+
+
+class FastqStats:
+    # the number of bytes of decompressed fastq processed at once.
+    block_size = 64 * 1024 * 1024
+
+    # duplication levels and overrepresented sequences are estimated from
+    # the first n reads.
+    duplication_sample_size = 100000
+
+    # sequences making up more than this fraction of the sampled reads are
+    # reported as overrepresented.
+    overrepresented_threshold = 0.001
+
+    def __init__(self):
+        """
+        Accumulates FastQC's QC statistics for fastq records.
+
+        Records are decoded in large blocks and each statistic is computed
+        w/numpy over the whole block, rather than record by record.
+        """
+        self.read_count = 0
+        # counts of each phred score at each position.
+        self.quality_counts = np.zeros((0, QUALITY_BINS), dtype=np.int64)
+        # counts of each base at each position.
+        self.base_counts = np.zeros((0, len(BASES)), dtype=np.int64)
+        self.length_counts = np.zeros(0, dtype=np.int64)
+        self.mean_quality_counts = np.zeros(QUALITY_BINS, dtype=np.int64)
+        self.gc_counts = np.zeros(101, dtype=np.int64)
+        self.duplication_keys = []
+        self.sampled = 0
+
+    def add_file(self, file_path):
+        """
+        Add the records in a fastq file, which may be gzipped.
+        :param file_path: The path to a fastq file.
+        :return: None
+        """
+        opener = gzip.open if file_path.endswith('.gz') else open
+
+        with opener(file_path, 'rb') as f:
+            leftover = b''
+            while True:
+                data = f.read(self.block_size)
+                if not data:
+                    break
+                leftover = self.add_block(leftover + data)
+
+        if leftover.strip():
+            # the last record may not end w/a newline.
+            if self.add_block(leftover + b'\n').strip():
+                raise ValueError(f"{file_path} ends w/a truncated record")
+
+    def add_block(self, block):
+        """
+        Add the complete records at the beginning of a block of fastq.
+        :param block: bytes beginning at the start of a record.
+        :return: The bytes following the last complete record.
+        """
+        arr = np.frombuffer(block, dtype=np.uint8)
+        newlines = np.flatnonzero(arr == ord('\n'))
+        line_count = len(newlines) - len(newlines) % 4
+
+        if line_count == 0:
+            return block
+
+        self._add_records(arr, newlines[:line_count].reshape(-1, 4))
+
+        return block[newlines[line_count - 1] + 1:]
+
+    def _add_records(self, arr, newlines):
+        header_starts = np.concatenate(([0], newlines[:-1, 3] + 1))
+        seq_starts = newlines[:, 0] + 1
+        plus_starts = newlines[:, 1] + 1
+        qual_starts = newlines[:, 2] + 1
+
+        if (arr[header_starts] != ord('@')).any() or \
+                (arr[plus_starts] != ord('+')).any():
+            raise ValueError("fastq records are malformed")
+
+        lengths = newlines[:, 1] - seq_starts
+        if (newlines[:, 3] - qual_starts != lengths).any():
+            raise ValueError("fastq records have sequences and qualities of "
+                             "differing lengths")
+
+        read_count = len(lengths)
+        max_length = int(lengths.max())
+        self._resize(max_length)
+
+        # gather records into (reads x positions) matrices. Positions past
+        # the end of a read hold the bytes that follow it, or the zeros
+        # padding the block, and are excluded using mask.
+        cols = np.arange(max_length, dtype=np.int32)
+        arr = np.concatenate((arr, np.zeros(max_length, dtype=np.uint8)))
+        seqs = arr[seq_starts[:, None] + cols]
+        quals = arr[qual_starts[:, None] + cols]
+
+        if (lengths == max_length).all():
+            # reads of a single length need no masking.
+            mask = None
+            select = np.ravel
+        else:
+            mask = cols < lengths[:, None]
+            quals = np.where(mask, quals, PHRED_OFFSET)
+            select = partial(_select, mask=mask)
+
+        codes = BASE_CODES[seqs]
+        scores = quals.astype(np.int16) - PHRED_OFFSET
+
+        if scores.min() < 0 or scores.max() >= QUALITY_BINS:
+            raise ValueError("fastq records have invalid quality scores")
+
+        self.read_count += read_count
+
+        self.quality_counts[:max_length] += np.bincount(
+            select(cols * QUALITY_BINS + scores),
+            minlength=max_length * QUALITY_BINS).reshape(max_length, -1)
+
+        self.base_counts[:max_length] += np.bincount(
+            select(cols * len(BASES) + codes),
+            minlength=max_length * len(BASES)).reshape(max_length, -1)
+
+        self.length_counts += np.bincount(lengths,
+                                          minlength=len(self.length_counts))
+
+        # like FastQC, mean qualities are truncated to integers. Padding
+        # holds a score of zero.
+        score_sums = scores.sum(axis=1, dtype=np.int64)
+        has_bases = lengths > 0
+        self.mean_quality_counts += np.bincount(
+            score_sums[has_bases] // lengths[has_bases],
+            minlength=QUALITY_BINS)
+
+        is_gc = (codes == BASES.index('G')) | (codes == BASES.index('C'))
+        is_called = codes != BASES.index('N')
+        if mask is not None:
+            is_gc &= mask
+            is_called &= mask
+        gc = is_gc.sum(axis=1)
+        called = is_called.sum(axis=1)
+        has_calls = called > 0
+        self.gc_counts += np.bincount(
+            np.rint(100 * gc[has_calls] / called[has_calls]).astype(int),
+            minlength=101)
+
+        self._sample_duplicates(seqs, lengths)
+
+    def _sample_duplicates(self, seqs, lengths):
+        count = min(len(lengths), self.duplication_sample_size - self.sampled)
+        if count <= 0:
+            return
+
+        key_lengths = np.where(lengths[:count] > DUPLICATION_MAX_LENGTH,
+                               DUPLICATION_TRUNCATE_TO, lengths[:count])
+        width = min(seqs.shape[1], DUPLICATION_MAX_LENGTH)
+        key_mask = np.arange(width) < key_lengths[:, None]
+
+        # reads are keyed by their (possibly truncated) sequence, padded w/
+        # zeros to a fixed width.
+        keys = np.zeros((count, DUPLICATION_MAX_LENGTH), dtype=np.uint8)
+        keys[:, :width] = np.where(key_mask, seqs[:count, :width], 0)
+
+        self.duplication_keys.append(keys)
+        self.sampled += count
+
+    def _resize(self, length):
+        if length > len(self.quality_counts):
+            pad = length - len(self.quality_counts)
+            self.quality_counts = np.pad(self.quality_counts,
+                                         ((0, pad), (0, 0)))
+            self.base_counts = np.pad(self.base_counts, ((0, pad), (0, 0)))
+
+        if length + 1 > len(self.length_counts):
+            self.length_counts = np.pad(
+                self.length_counts, (0, length + 1 - len(self.length_counts)))
+
+    def _unique_sequences(self):
+        if not self.duplication_keys:
+            return np.zeros((0, DUPLICATION_MAX_LENGTH), dtype=np.uint8), \
+                np.zeros(0, dtype=np.int64)
+
+        keys = np.concatenate(self.duplication_keys)
+        return np.unique(keys, axis=0, return_counts=True)
+
+    def basic_statistics(self, file_name):
+        lengths = np.flatnonzero(self.length_counts)
+        if len(lengths) == 0:
+            length = '0'
+        elif lengths[0] == lengths[-1]:
+            length = str(lengths[0])
+        else:
+            length = f'{lengths[0]}-{lengths[-1]}'
+
+        gc = self.base_counts[:, [BASES.index('G'), BASES.index('C')]].sum()
+        called = self.base_counts[:, :BASES.index('N')].sum()
+
+        return [('Filename', file_name),
+                ('File type', 'Conventional base calls'),
+                ('Encoding', 'Sanger / Illumina 1.9'),
+                ('Total Sequences', self.read_count),
+                ('Sequences flagged as poor quality', 0),
+                ('Sequence length', length),
+                ('%GC', int(round(100 * gc / called)) if called else 0)]
+
+    def per_base_quality(self):
+        counts = self.quality_counts
+        totals = counts.sum(axis=1)
+        counts, totals = counts[totals > 0], totals[totals > 0]
+        cumulative = counts.cumsum(axis=1)
+
+        def percentile(p):
+            # the lowest score at or below which p of the scores fall.
+            return (cumulative < p * totals[:, None]).sum(axis=1)
+
+        means = (counts * np.arange(QUALITY_BINS)).sum(axis=1) / totals
+        percentiles = np.stack([percentile(x) for x in
+                                [0.5, 0.25, 0.75, 0.1, 0.9]], axis=1)
+
+        return [(i + 1, round(float(means[i]), 2),
+                 *[int(x) for x in percentiles[i]])
+                for i in range(len(totals))]
+
+    def per_sequence_quality(self):
+        scores = np.flatnonzero(self.mean_quality_counts)
+        if len(scores) == 0:
+            return []
+        return [(i, int(self.mean_quality_counts[i]))
+                for i in range(scores[0], scores[-1] + 1)]
+
+    def per_base_content(self):
+        called = self.base_counts[:, :BASES.index('N')]
+        totals = called.sum(axis=1)
+        return [(i + 1, *[round(float(x), 2) for x in
+                          100 * called[i] / totals[i]])
+                for i in range(len(totals)) if totals[i]]
+
+    def per_sequence_gc(self):
+        return [(i, int(x)) for i, x in enumerate(self.gc_counts)]
+
+    def per_base_n_content(self):
+        totals = self.base_counts.sum(axis=1)
+        n_counts = self.base_counts[:, BASES.index('N')]
+        return [(i + 1, round(float(100 * n_counts[i] / totals[i]), 2))
+                for i in range(len(totals)) if totals[i]]
+
+    def length_distribution(self):
+        lengths = np.flatnonzero(self.length_counts)
+        if len(lengths) == 0:
+            return []
+        return [(i, int(self.length_counts[i]))
+                for i in range(lengths[0], lengths[-1] + 1)]
+
+    def duplication_levels(self):
+        """
+        Returns the percentage of sampled reads remaining after
+        deduplication, and the percentage of distinct and of total sampled
+        reads at each of FastQC's duplication levels.
+        """
+        keys, counts = self._unique_sequences()
+        if len(counts) == 0:
+            return 100.0, [(x, 0.0, 0.0) for x, _ in DUPLICATION_LEVELS]
+
+        thresholds = [x for _, x in DUPLICATION_LEVELS]
+        levels = np.searchsorted(thresholds, counts, side='right') - 1
+        distinct = np.bincount(levels, minlength=len(thresholds))
+        total = np.bincount(levels, weights=counts,
+                            minlength=len(thresholds))
+
+        remaining = 100 * len(counts) / self.sampled
+        return round(remaining, 2), [
+            (label, round(float(100 * distinct[i] / len(counts)), 2),
+             round(float(100 * total[i] / self.sampled), 2))
+            for i, (label, _) in enumerate(DUPLICATION_LEVELS)]
+
+    def overrepresented_sequences(self):
+        keys, counts = self._unique_sequences()
+        keep = counts > self.overrepresented_threshold * self.sampled
+        order = np.argsort(-counts[keep], kind='stable')
+
+        return [(bytes(key[key > 0]).decode(), int(count),
+                 round(float(100 * count / self.sampled), 2), 'No Hit')
+                for key, count in zip(keys[keep][order], counts[keep][order])]
+
+    def modules(self, file_name):
+        """
+        Returns FastQC's modules for the records added.
+        :param file_name: The name of the fastq file, as reported.
+        :return: A list of (name, status, header, rows, preamble) tuples.
+        """
+        quality = self.per_base_quality()
+        sequence_quality = self.per_sequence_quality()
+        content = self.per_base_content()
+        gc = self.per_sequence_gc()
+        n_content = self.per_base_n_content()
+        lengths = self.length_distribution()
+        remaining, duplication = self.duplication_levels()
+        overrepresented = self.overrepresented_sequences()
+
+        return [
+            ('Basic Statistics', 'pass', ['Measure', 'Value'],
+             self.basic_statistics(file_name), []),
+            ('Per base sequence quality', _quality_status(quality),
+             ['Base', 'Mean', 'Median', 'Lower Quartile', 'Upper Quartile',
+              '10th Percentile', '90th Percentile'], quality, []),
+            ('Per sequence quality scores',
+             _sequence_quality_status(sequence_quality),
+             ['Quality', 'Count'], sequence_quality, []),
+            ('Per base sequence content', _content_status(content),
+             ['Base'] + list(BASES[:-1]), content, []),
+            ('Per sequence GC content', _gc_status(self.gc_counts),
+             ['GC Content', 'Count'], gc, []),
+            ('Per base N content', _threshold_status(
+                [x[1] for x in n_content], 5, 20),
+             ['Base', 'N-Count'], n_content, []),
+            ('Sequence Length Distribution', _length_status(lengths),
+             ['Length', 'Count'], lengths, []),
+            ('Sequence Duplication Levels', _threshold_status(
+                [100 - remaining], 20, 50),
+             ['Duplication Level', 'Percentage of deduplicated',
+              'Percentage of total'], duplication,
+             [('Total Deduplicated Percentage', remaining)]),
+            ('Overrepresented sequences', _threshold_status(
+                [x[2] for x in overrepresented], 0.1, 1),
+             ['Sequence', 'Count', 'Percentage', 'Possible Source'],
+             overrepresented, [])]
+
+    def write(self, output_dir, file_name):
+        """
+        Write FastQC's outputs for the records added.
+
+        Like FastQC w/--noextract, <name>_fastqc.html and <name>_fastqc.zip
+        are written. The zip contains fastqc_data.txt, summary.txt and
+        fastqc_report.html in a <name>_fastqc directory, as MultiQC expects.
+        :param output_dir: The directory to write to.
+        :param file_name: The name of the fastq file.
+        :return: The path to the zip file.
+        """
+        name = fastqc_name(file_name)
+        modules = self.modules(file_name)
+
+        data = _format_data(modules)
+        summary = ''.join([f'{status.upper()}\t{module}\t{file_name}\n'
+                           for module, status, _, _, _ in modules])
+        report = _format_html(file_name, modules)
+
+        makedirs(output_dir, exist_ok=True)
+
+        with open(join(output_dir, f'{name}.html'), 'w') as f:
+            f.write(report)
+
+        zip_path = join(output_dir, f'{name}.zip')
+        with ZipFile(zip_path, 'w', ZIP_DEFLATED) as z:
+            z.writestr(f'{name}/fastqc_data.txt', data)
+            z.writestr(f'{name}/summary.txt', summary)
+            z.writestr(f'{name}/fastqc_report.html', report)
+
+        return zip_path
+
+
+def _select(values, mask):
+    return values[mask]
+
+
+def _threshold_status(values, warn, fail):
+    worst = max(values, default=0)
+    return 'fail' if worst > fail else 'warn' if worst > warn else 'pass'
+
+
+def _quality_status(rows):
+    # FastQC warns if any lower quartile is below 10 or median below 25.
+    if any([r[3] < 5 or r[2] < 20 for r in rows]):
+        return 'fail'
+    if any([r[3] < 10 or r[2] < 25 for r in rows]):
+        return 'warn'
+    return 'pass'
+
+
+def _sequence_quality_status(rows):
+    if not rows:
+        return 'pass'
+    mode = max(rows, key=lambda x: x[1])[0]
+    return 'fail' if mode < 20 else 'warn' if mode < 27 else 'pass'
+
+
+def _content_status(rows):
+    # the largest difference between A and T or G and C at any position.
+    return _threshold_status([max(abs(g - c), abs(a - t))
+                              for _, g, a, t, c in rows], 10, 20)
+
+
+def _gc_status(gc_counts):
+    # FastQC compares the distribution to a normal distribution w/the same
+    # mean and standard deviation.
+    total = gc_counts.sum()
+    if total == 0:
+        return 'pass'
+
+    x = np.arange(len(gc_counts))
+    mean = (gc_counts * x).sum() / total
+    sd = np.sqrt((gc_counts * (x - mean) ** 2).sum() / total)
+    if sd == 0:
+        return 'pass'
+
+    theoretical = np.exp(-0.5 * ((x - mean) / sd) ** 2)
+    theoretical *= total / theoretical.sum()
+    deviation = 100 * np.abs(gc_counts - theoretical).sum() / total
+
+    return _threshold_status([deviation], 15, 30)
+
+
+def _length_status(rows):
+    if any([length == 0 and count for length, count in rows]):
+        return 'fail'
+    return 'warn' if len([x for x in rows if x[1]]) > 1 else 'pass'
+
+
+def _format_data(modules):
+    lines = [f'##FastQC\t{FASTQC_COMPATIBLE_VERSION}']
+    for module, status, header, rows, preamble in modules:
+        lines.append(f'>>{module}\t{status}')
+        lines += [f'#{k}\t{v}' for k, v in preamble]
+        lines.append('#' + '\t'.join(header))
+        lines += ['\t'.join([str(x) for x in row]) for row in rows]
+        lines.append('>>END_MODULE')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_html(file_name, modules):
+    body = []
+    for module, status, header, rows, preamble in modules:
+        body.append(f'<h2>{escape(module)}: {status}</h2>')
+        body += [f'<p>{escape(k)}: {v}</p>' for k, v in preamble]
+        body.append('<table><tr>' + ''.join(
+            [f'<th>{escape(x)}</th>' for x in header]) + '</tr>')
+        body += ['<tr>' + ''.join([f'<td>{escape(str(x))}</td>' for x in row])
+                 + '</tr>' for row in rows]
+        body.append('</table>')
+
+    return (f'<html><head><title>{escape(file_name)} QC Report</title>'
+            f'</head><body><h1>{escape(file_name)}</h1>' + '\n'.join(body) +
+            '</body></html>\n')
+
+
+def run_qc(file_path, output_dir):
+    """
+    Write FastQC-compatible outputs for a fastq file.
+    :param file_path: The path to a fastq file.
+    :param output_dir: The directory to write to.
+    :return: The path to the zip file written.
+    """
+    stats = FastqStats()
+    stats.add_file(file_path)
+    return stats.write(output_dir, basename(file_path))
+
+
+def run_qc_parallel(inputs, processes=1):
+    """
+    Write FastQC-compatible outputs for many fastq files using a pool of
+    processes.
+    :param inputs: A list of (fastq file path, output directory) tuples.
+    :param processes: The number of files to process at once.
+    :return: A list of the zip files written, in the same order as inputs.
+    """
+    if processes <= 1:
+        return [run_qc(*x) for x in inputs]
+
+    # start the largest files first, so that the pool doesn't end waiting
+    # on a single large file.
+    order = sorted(range(len(inputs)), key=lambda i: -getsize(inputs[i][0]))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {i: executor.submit(run_qc, *inputs[i]) for i in order}
+        return [futures[i].result() for i in range(len(inputs))]
@@ -0,0 +1,220 @@
+from collections import namedtuple, OrderedDict
+from os import scandir, stat
+from os.path import abspath, sep
+from sequence_processing_pipeline.util import determine_orientation
+from threading import Lock
+from time import time
+import re
+
+
+# size and mtime are None for files that cannot be stat'ed e.g. broken links.
+FileEntry = namedtuple('FileEntry', ['path', 'size', 'mtime', 'orientation',
+                                     'sample_id'])
+
+# e.g. SAMPLE_1_S3_L007_R1_001.trimmed.fastq.gz
+ILLUMINA_NAME = re.compile(r'^(.+?)_S\d+_L\d+_[RI]\d_\d+\b')
+
+
+def extract_sample_id(file_name):
+    """
+    Returns the sample-id embedded in the name of a fastq file.
+    :param file_name: The name of a fastq file.
+    :return: The sample-id or None if one could not be determined.
+    """
+    m = ILLUMINA_NAME.match(file_name)
+    if m:
+        return m.group(1)
+
+    orientation = determine_orientation(file_name)
+    if orientation is None:
+        return None
+
+    # the sample-id is everything that precedes the orientation.
+    pos = max(file_name.rfind(f'_{orientation}_'),
+              file_name.rfind(f'.{orientation}.'))
+    return file_name[:pos] if pos > 0 else None
+
+
+class _Directory:
+    def __init__(self, mtime_ns, scanned_at, files, subdirs):
+        self.mtime_ns = mtime_ns
+        self.scanned_at = scanned_at
+        self.files = files
+        self.subdirs = subdirs
+
+
+class FileManifest:
+    # a directory modified this recently when it was scanned may have had
+    # files added w/in the same mtime tick. It is rescanned on next refresh
+    # regardless of its mtime.
+    settle_time_in_seconds = 2
+
+    # the most manifests get() keeps. The least recently used is forgotten
+    # first, so a long-running process that visits many roots doesn't keep
+    # an index of each of them forever.
+    max_manifests = 16
+
+    _manifests = OrderedDict()
+    _manifests_lock = Lock()
+
+    def __init__(self, root):
+        """
+        An index of the files found beneath a root directory.
+
+        The tree is crawled once using scandir(). Subsequent queries only
+        rescan directories whose mtime has changed; directories that have
+        not changed cost a single stat() call. Note that modifying a file in
+        place does not change its directory's mtime, hence size and mtime
+        reflect the time its directory was last scanned.
+        :param root: The path to the directory to index.
+        """
+        self.root = abspath(root)
+        self.directories = {}
+        self.lock = Lock()
+
+    @classmethod
+    def get(cls, path):
+        """
+        Returns the manifest shared by all Jobs for the given path.
+
+        At most max_manifests are kept; creating another forgets the least
+        recently used. As the manifests are shared, the size and mtime of a
+        file modified in place may lag behind until its directory changes.
+        :param path: A path to a directory.
+        :return: An existing FileManifest whose root contains path, or a new
+                 FileManifest rooted at path.
+        """
+        path = abspath(path)
+
+        with cls._manifests_lock:
+            for root, manifest in cls._manifests.items():
+                if path == root or path.startswith(root + sep):
+                    cls._manifests.move_to_end(root)
+                    return manifest
+
+            cls._manifests[path] = FileManifest(path)
+            while len(cls._manifests) > cls.max_manifests:
+                cls._manifests.popitem(last=False)
+
+            return cls._manifests[path]
+
+    @classmethod
+    def clear(cls):
+        """
+        Forget all manifests created by get().
+        :return: None
+        """
+        with cls._manifests_lock:
+            cls._manifests = OrderedDict()
+
+    def entries(self, search_path=None):
+        """
+        Returns information on all files found beneath search_path.
+        :param search_path: A path beneath root. Defaults to root.
+        :return: A list of FileEntry tuples, in the same order os.walk()
+                 would return them. Paths begin w/search_path as given. The
+                 size and mtime of a file are those found when its directory
+                 was last scanned, hence they may not reflect in-place
+                 writes since.
+        """
+        if search_path is None:
+            search_path = self.root
+
+        abs_path = abspath(search_path)
+
+        if not (abs_path == self.root or abs_path.startswith(self.root + sep)):
+            raise ValueError(f"'{search_path}' is not in '{self.root}'")
+
+        with self.lock:
+            self._refresh(abs_path)
+            results = []
+            self._collect(abs_path, results)
+
+        if abs_path != search_path:
+            # paths should begin w/search_path as given, as they would if
+            # os.walk(search_path) was used.
+            prefix = search_path.rstrip(sep)
+            results = [x._replace(path=prefix + x.path[len(abs_path):])
+                       for x in results]
+
+        return results
+
+    def find_files(self, search_path=None, suffix=None):
+        """
+        Returns the paths to all files found beneath search_path.
+        :param search_path: A path beneath root. Defaults to root.
+        :param suffix: Optionally return only files ending w/suffix.
+        :return: A list of file paths.
+        """
+        return [x.path for x in self.entries(search_path)
+                if suffix is None or x.path.endswith(suffix)]
+
+    def _refresh(self, path):
+        try:
+            mtime_ns = stat(path).st_mtime_ns
+        except OSError:
+            # directory no longer exists.
+            self._forget(path)
+            return
+
+        directory = self.directories.get(path)
+
+        if (directory is None or directory.mtime_ns != mtime_ns or
+                directory.mtime_ns / 1e9 > directory.scanned_at -
+                self.settle_time_in_seconds):
+            directory = self._scan(path, mtime_ns)
+
+        for subdir in directory.subdirs:
+            self._refresh(subdir)
+
+    def _scan(self, path, mtime_ns):
+        scanned_at = time()
+        files = []
+        subdirs = []
+
+        try:
+            with scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        # like os.walk(), don't follow symlinks to dirs.
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                        continue
+
+                    try:
+                        st = entry.stat()
+                        size, mtime = st.st_size, st.st_mtime
+                    except OSError:
+                        size, mtime = None, None
+
+                    files.append(FileEntry(entry.path, size, mtime,
+                                           determine_orientation(entry.name),
+                                           extract_sample_id(entry.name)))
+        except OSError:
+            # like os.walk(), ignore directories that can't be read.
+            pass
+
+        old = self.directories.get(path)
+        if old is not None:
+            for subdir in set(old.subdirs) - set(subdirs):
+                self._forget(subdir)
+
+        directory = _Directory(mtime_ns, scanned_at, files, subdirs)
+        self.directories[path] = directory
+
+        return directory
+
+    def _forget(self, path):
+        directory = self.directories.pop(path, None)
+        if directory is not None:
+            for subdir in directory.subdirs:
+                self._forget(subdir)
+
+    def _collect(self, path, results):
+        directory = self.directories.get(path)
+        if directory is None:
+            return
+
+        results += directory.files
+        for subdir in directory.subdirs:
+            self._collect(subdir, results)
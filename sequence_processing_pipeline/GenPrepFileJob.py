@@ -159,36 +159,47 @@ class GenPrepFileJob(Job):
         return results
 
     def _get_prep_file_paths(self, stdout):
-        # Strip UserWarnings and empty lines that appear on stdout.
-        tmp = [x for x in stdout.split('\n') if x != ''
-               and 'UserWarning' not in x]
-
         results = defaultdict(list)
 
-        for line in tmp:
-            qiita_id, prep_file_fp = line.strip().split('\t')
-            results[qiita_id].append(prep_file_fp)
+        for line in stdout.split('\n'):
+            self._add_prep_file_path(line, results)
 
         return results
 
+    @staticmethod
+    def _add_prep_file_path(line, results):
+        # Strip UserWarnings and empty lines that appear on stdout.
+        if line.strip() == '' or 'UserWarning' in line:
+            return
+
+        qiita_id, prep_file_fp = line.strip().split('\t')
+        results[qiita_id].append(prep_file_fp)
+
     def run(self, callback=None):
         results = defaultdict(list)
 
-        for command in self.commands:
+        for count, command in enumerate(self.commands, 1):
             # note that if GenPrepFileJob will be run after QCJob in a
             # Pipeline, and QCJob currently moves its products to the final
             # location. It would be cleaner if it did not do this, but
             # currently that is how it's done. Hence, self.output_directory
             # and the path to run_dir might be different locations than the
             # others.
-            res = self._system_call(' '.join(command), callback=callback)
+            # seqpro --verbose can be very chatty. Stream its output to files
+            # rather than holding all of it in memory. The streamed files may
+            # be rotated, hence the prep-file paths on stdout are parsed as
+            # they arrive rather than read back afterwards.
+            cmd_results = defaultdict(list)
+            res = self._system_call(
+                ' '.join(command), callback=callback,
+                stream_to=join(self.log_path, f'seqpro_{count}'),
+                stdout_callback=partial(self._add_prep_file_path,
+                                        results=cmd_results))
 
             if res['return_code'] != 0:
                 raise PipelineError("Seqpro encountered an error")
 
             # if successful, store results.
-            cmd_results = self._get_prep_file_paths(res['stdout'])
-
             for qiita_id in cmd_results:
                 results[qiita_id] += cmd_results[qiita_id]
 
@@ -2,18 +2,27 @@ from jinja2 import BaseLoader, TemplateNotFound
 from os.path import getmtime
 import pathlib
 from itertools import zip_longest
-from os import makedirs, walk
-from os.path import basename, exists, split, join
+from os import makedirs, remove, rename
+from os.path import basename, dirname, exists, split, join, isdir, getsize
+from sequence_processing_pipeline.FileManifest import FileManifest
+from sequence_processing_pipeline.Metrics import Metrics
+from sequence_processing_pipeline.util import PrefixIndex
+from sequence_processing_pipeline.Executor import SlurmExecutor
 from sequence_processing_pipeline.PipelineError import (PipelineError,
                                                         JobFailedError,
                                                         ExecFailedError)
 from subprocess import Popen, PIPE
-from time import sleep
+from shlex import quote
+from time import sleep, time
 import logging
 from inspect import stack
 import re
-from collections import Counter
-from glob import glob
+from collections import Counter, deque
+from glob import glob, escape as glob_escape
+from json import dumps, load
+from heapq import heappop, heappush
+from threading import Thread, Lock
+from math import ceil
 
 
 # taken from https://jinja.palletsprojects.com/en/3.0.x/api/#jinja2.BaseLoader
@@ -34,6 +43,70 @@ class KISSLoader(BaseLoader):
         return source, path, lambda: mtime == getmtime(path)
 
 
+class RotatingWriter:
+    def __init__(self, path, max_bytes, backup_count):
+        """
+        Writes lines to a file, rotating it once it grows past max_bytes.
+        Rotated files are named path.1, path.2, etc. w/path.1 being the most
+        recent. At most backup_count rotated files are kept; older output is
+        discarded, hence output that must be read in full shouldn't be
+        written w/a RotatingWriter. Rotated files left by a previous writer
+        of the same path are removed.
+        :param path: The path to the file to write.
+        :param max_bytes: The maximum size of the file before it's rotated.
+        :param backup_count: The number of rotated files to keep.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        # don't let read() mix a previous run's output w/this one's.
+        for rotated_path in glob(f'{glob_escape(path)}.*'):
+            if rotated_path[len(path) + 1:].isdigit():
+                remove(rotated_path)
+        self.f = open(path, 'w')
+        self.size = 0
+
+    def write(self, line):
+        if self.size and self.size + len(line) > self.max_bytes:
+            self._rotate()
+        self.f.write(line)
+        self.size += len(line)
+
+    def close(self):
+        self.f.close()
+
+    def _rotate(self):
+        self.f.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if exists(f'{self.path}.{i}'):
+                rename(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        if self.backup_count > 0:
+            rename(self.path, f'{self.path}.1')
+        self.f = open(self.path, 'w')
+        self.size = 0
+
+    @staticmethod
+    def read(path):
+        """
+        Returns the contents of a file and any of its rotated files.
+        :param path: The path given to RotatingWriter().
+        :return: The contents of all files, oldest first.
+        """
+        paths = []
+        i = 1
+        while exists(f'{path}.{i}'):
+            paths.insert(0, f'{path}.{i}')
+            i += 1
+        paths.append(path)
+
+        contents = []
+        for some_path in paths:
+            with open(some_path, 'r') as f:
+                contents.append(f.read())
+
+        return ''.join(contents)
+
+
 class Job:
     slurm_status_terminated = ['BOOT_FAIL', 'CANCELLED', 'DEADLINE', 'FAILED',
                                'NODE_FAIL', 'OUT_OF_MEMORY', 'PREEMPTED',
@@ -57,6 +130,30 @@ class Job:
     polling_interval_in_seconds = 60
     squeue_retry_in_seconds = 10
 
+    # runs the commands assigned to each task of an array job.
+    task_runner_path = join(pathlib.Path(__file__).parent.resolve(), 'scripts',
+                            'task_runner.py')
+
+    # SlurmExecutor is stateless and can be shared by all Jobs.
+    slurm_executor = SlurmExecutor()
+    default_executor = None
+
+    # limits for _system_call() when streaming output to files. Output files
+    # are rotated at stream_max_bytes. Only the last stream_tail_lines of
+    # each stream are kept in memory and progress is reported to callbacks
+    # at most once every stream_progress_interval_in_seconds.
+    stream_max_bytes = 100 * 1024 * 1024
+    stream_backup_count = 5
+    stream_tail_lines = 100
+    stream_progress_interval_in_seconds = 10
+
+    # paths to executables found by _which(), keyed on the modules loaded
+    # and the name of the executable.
+    _which_cache = {}
+
+    # versions reported by _get_tool_version(), keyed in the same way.
+    _tool_version_cache = {}
+
     def __init__(self, root_dir, output_path, job_name, executable_paths,
                  max_array_length, modules_to_load=None):
         """
@@ -78,6 +175,11 @@ class Job:
         self.log_path = join(self.output_path, 'logs')
         self._directory_check(self.log_path, create=True)
 
+        # wall times for each phase of the job are appended to metrics.jsonl
+        # alongside any recorded by the job's scripts.
+        self.metrics = Metrics(join(self.log_path, 'metrics.jsonl'),
+                               source=self.job_name)
+
         self.modules_to_load = modules_to_load
         self.max_array_length = max_array_length
 
@@ -94,11 +196,30 @@ class Job:
 
         self.audit_folders = None
 
+        # sub-classes that skip commands whose outputs are up to date assign
+        # a ResultCache and the version of the tool they run.
+        self.result_cache = None
+        self.tool_version = None
+        # the key and outputs of each command not found in result_cache.
+        self.cache_entries = {}
+        # the commands run by each array task, in order.
+        self.task_commands = []
+
+        # jobs are submitted to Slurm unless an alternate executor, such as
+        # a LocalExecutor, is set as the default for all Jobs or assigned to
+        # this Job.
+        if Job.default_executor is None:
+            self.executor = Job.slurm_executor
+        else:
+            self.executor = Job.default_executor
+
         # For each executable in the list, get its filename and use _which()
         # to see if it can be found. Directly pass an optional list of modules
         # to load before-hand, so that the binary can be found.
         # If the executable can't be found or doesn't have the same path as
-        # the version given, raise a PipelineError.
+        # the version given, raise a PipelineError. All executables are found
+        # using a single shell.
+        file_names = []
         for executable_path in executable_paths:
             file_path, file_name = split(executable_path)
 
@@ -113,20 +234,93 @@ class Job:
                 if name in file_name:
                     continue
 
-            # No need to test results. _which() will raise a PipelineError if
-            # file_name is a path and the path found does not match. It will
-            # also raise a PipelineError if the file could not be found.
-            if not self.is_test:
-                self._which(file_name, modules_to_load=self.modules_to_load)
+            file_names.append(file_name)
+
+        # No need to test results. _which_all() will raise a PipelineError if
+        # a file_name is a path and the path found does not match. It will
+        # also raise a PipelineError if a file could not be found.
+        if not self.is_test:
+            self._which_all(file_names, modules_to_load=self.modules_to_load)
+
+    def run(self, callback=None):
+        """
+        Submit the job, wait for it to finish and perform post-processing.
+        Sub-classes that encapsulate a single submit_job() call define what
+        is submitted in submit() and what is done with the results in
+        finalize(). Sub-classes that can't be split this way (e.g. they
+        encapsulate one or more system() calls) override run() instead.
+        Sub-classes that can sometimes finish w/out submitting anything
+        define how in complete_locally().
+        :param callback: Set callback function that receives status updates.
+        :return: A dictionary containing the job's id and status.
+        """
+        try:
+            self.metrics.start('script_generation')
+            job_info = self.complete_locally(callback=callback)
+            if job_info is None:
+                job_id = self.submit(callback=callback)
+                job_info = self.wait(job_id, callback=callback)
+        except JobFailedError as e:
+            raise self._describe_failure(e) from None
+
+        with self.metrics.timer('post_processing', job_id=job_info['job_id']):
+            self.finalize(job_info)
+
+        return job_info
+
+    def _describe_failure(self, e):
+        """
+        Returns a JobFailedError w/details from the job's logs.
+        :param e: The JobFailedError raised by submit() or wait().
+        :return: A new JobFailedError.
+        """
+        # When a job has failed, parse the logs generated by this specific
+        # job to return a more descriptive message to the user.
+        info = self.parse_logs()
+        # prepend just the message component of the Error.
+        info.insert(0, str(e))
+        return JobFailedError('\n'.join(info))
+
+    def complete_locally(self, callback=None):
+        """
+        Complete the job in-process, if there's no need to submit it.
+        Called by run() and JobDriver before submit(); submit() is only
+        called if this returns None. By default, jobs are always submitted.
+        :param callback: Set callback function that receives status updates.
+        :return: A dictionary containing the job's id (None) and status, to
+                 be passed to finalize(), or None if the job must be
+                 submitted.
+        """
+        return None
+
+    def submit(self, callback=None):
+        """
+        Submit the job to the scheduler without waiting for it to finish.
+        :param callback: Set callback function that receives status updates.
+        :return: The scheduler's id for the submitted job.
+        """
+        raise PipelineError("Base class submit() method not implemented.")
+
+    def wait(self, job_id, callback=None):
+        """
+        Wait for a job returned by submit() to finish.
+        :param job_id: The id returned by submit().
+        :param callback: Set callback function that receives status updates.
+        :return: A dictionary containing the job's id and status. Raises
+                 JobFailedError if the job was unsuccessful.
+        """
+        job_id = str(job_id)
+        results = self.wait_on_job_ids([job_id], callback=callback)
+        return self._process_job_states(job_id, results, callback=callback)
 
-    def run(self):
+    def finalize(self, job_info):
         """
-        Since a Job object can encapsulate one or more submit_job() or system()
-        calls, the base run() method remains unimplemented. It is the job of
-        each sub-class to define what needs to be run in order to generate the
-        expected output.
+        Perform post-processing once a submitted job has successfully
+        finished. By default, there is nothing to post-process.
+        :param job_info: The dictionary returned by wait().
+        :return: None
         """
-        raise PipelineError("Base class run() method not implemented.")
+        pass
 
     def mark_job_completed(self):
         with open(join(self.output_path, 'job_completed'), 'w') as f:
@@ -158,28 +352,66 @@ class Job:
         :param modules_to_load: A list of Linux module names to load.
         :return: A path to 'file_name'.
         """
-        tmp = split(file_path)
-        # remove any elements that are empty string.
-        tmp = [x for x in tmp if x]
+        return self._which_all([file_path],
+                               modules_to_load=modules_to_load)[file_path]
 
-        isPath = True if len(tmp) > 1 else False
+    def _which_all(self, file_paths, modules_to_load=None):
+        """
+        Performs _which() on a list of executables using a single shell.
+        Results are cached for the life of the process, as loading modules
+        can be slow and many Jobs validate the same executables.
+        :param file_paths: A list of paths of executables to find.
+        :param modules_to_load: A list of Linux module names to load.
+        :return: A dictionary of file_paths and the paths found for them.
+        """
+        modules = tuple(modules_to_load) if modules_to_load else ()
+
+        results = {}
+        missing = []
+        for file_path in file_paths:
+            if (modules, file_path) in Job._which_cache:
+                results[file_path] = Job._which_cache[(modules, file_path)]
+            elif file_path not in missing:
+                missing.append(file_path)
+
+        if missing:
+            # report each executable on its own line as 'name<TAB>path'.
+            # 'which' reports nothing on stdout for executables not found.
+            cmd = ('for f in %s; do printf "%%s\\t%%s\\n" "$f" '
+                   '"$(which "$f")"; done' % ' '.join([quote(x) for x in
+                                                      missing]))
 
-        cmd = 'which ' + file_path
+            if modules:
+                cmd = 'module load ' + ' '.join(modules) + ';' + cmd
 
-        if modules_to_load:
-            cmd = 'module load ' + ' '.join(modules_to_load) + ';' + cmd
+            found = {}
+            stdout = self._system_call(cmd)['stdout']
+            for line in stdout.split('\n'):
+                if '\t' in line:
+                    file_path, result = line.split('\t', 1)
+                    found[file_path] = result.strip()
 
-        results = self._system_call(cmd)
-        result = results['stdout'].strip()
+            for file_path in missing:
+                tmp = split(file_path)
+                # remove any elements that are empty string.
+                tmp = [x for x in tmp if x]
 
-        if not result:
-            raise PipelineError("File '%s' does not exist." % file_path)
+                isPath = True if len(tmp) > 1 else False
 
-        if isPath is True and result != file_path:
-            raise PipelineError(f"Found path '{result} does not match "
-                                f"{file_path}")
+                result = found.get(file_path, '')
 
-        return result
+                if not result:
+                    raise PipelineError("File '%s' does not exist." %
+                                        file_path)
+
+                if isPath is True and result != file_path:
+                    raise PipelineError(f"Found path '{result} does not match "
+                                        f"{file_path}")
+
+                Job._which_cache[(modules, file_path)] = result
+                results[file_path] = result
+
+        return results
 
     def _file_check(self, file_path):
         if exists(file_path):
@@ -189,10 +421,7 @@ class Job:
             raise PipelineError("file '%s' does not exist." % file_path)
 
     def _find_files(self, search_path):
-        lst = []
-        for root, dirs, files in walk(search_path):
-            lst += [join(root, x) for x in files]
-        return lst
+        return FileManifest.get(search_path).find_files(search_path)
 
     def _directory_check(self, directory_path, create=False):
         if exists(directory_path):
@@ -210,7 +439,8 @@ class Job:
                 raise PipelineError(
                     "directory_path '%s' does not exist." % directory_path)
 
-    def _system_call(self, cmd, allow_return_codes=[], callback=None):
+    def _system_call(self, cmd, allow_return_codes=[], callback=None,
+                     stream_to=None, stdout_callback=None):
         """
         Call command and return (stdout, stderr, return_value)
         :param cmd: The string containing the command to be run, or a sequence
@@ -220,8 +450,24 @@ class Job:
         :param callback: optional function taking two parameters (id, status)
                          that is called when a running process's status is
                          changed.
+        :param stream_to: optional path prefix. If set, stdout and stderr are
+                          written to rotating files named stream_to.stdout
+                          and stream_to.stderr as they arrive, only the last
+                          lines of each are kept in memory and the most
+                          recent line is periodically reported to callback.
+                          Rotated output older than stream_backup_count
+                          files is discarded.
+        :param stdout_callback: optional function taking a line of stdout.
+                                If stream_to is set, it's called w/each line
+                                as it arrives, so that output that must be
+                                parsed in full needn't be read back from the
+                                rotating files. If it raises, it isn't called
+                                again and PipelineError is raised once the
+                                command has finished.
         :return: a dictionary containing stdout, stderr, and return_code as
-                 key/value pairs.
+                 key/value pairs. If stream_to is set, stdout and stderr hold
+                 only the last lines of output and the paths to the full
+                 output are returned as stdout_path and stderr_path.
         """
         proc = Popen(cmd, universal_newlines=True, shell=True,
                      stdout=PIPE, stderr=PIPE)
@@ -229,13 +475,25 @@ class Job:
         if callback is not None:
             callback(jid=proc.pid, status='RUNNING')
 
-        # Communicate pulls all stdout/stderr from the PIPEs
-        # This call blocks until the command is done
-        stdout, stderr = proc.communicate()
-        return_code = proc.returncode
+        if stream_to is None:
+            # Communicate pulls all stdout/stderr from the PIPEs
+            # This call blocks until the command is done
+            stdout, stderr = proc.communicate()
+            return_code = proc.returncode
+
+            logging.debug("stdout: %s" % stdout)
+            logging.debug("stderr: %s" % stderr)
+            results = {}
+        else:
+            stdout, stderr = self._stream(proc, stream_to, callback,
+                                          stdout_callback)
+            return_code = proc.returncode
+
+            logging.debug("stdout: %s.stdout" % stream_to)
+            logging.debug("stderr: %s.stderr" % stream_to)
+            results = {'stdout_path': f'{stream_to}.stdout',
+                       'stderr_path': f'{stream_to}.stderr'}
 
-        logging.debug("stdout: %s" % stdout)
-        logging.debug("stderr: %s" % stderr)
         logging.debug("return code: %s" % return_code)
 
         acceptable_return_codes = [0] + allow_return_codes
@@ -255,42 +513,76 @@ class Job:
         if callback is not None:
             callback(jid=proc.pid, status='COMPLETED')
 
-        return {'stdout': stdout, 'stderr': stderr, 'return_code': return_code}
-
-    def _query_slurm(self, job_ids):
-        # query_slurm encapsulates the handling of squeue.
-        count = 0
-        while True:
-            result = self._system_call("squeue -t all -j "
-                                       f"{','.join(job_ids)} "
-                                       "-o '%i,%T'")
-
-            if result['return_code'] == 0:
-                # there was no issue w/squeue, break this loop and
-                # continue.
-                break
-            else:
-                # there was likely an intermittent issue w/squeue. Pause
-                # and wait before trying a few more times. If the problem
-                # persists then report the error and exit.
-                count += 1
-
-                if count > 3:
-                    raise ExecFailedError(result['stderr'])
+        results.update({'stdout': stdout, 'stderr': stderr,
+                        'return_code': return_code})
 
-                sleep(Job.squeue_retry_in_seconds)
-
-        lines = result['stdout'].split('\n')
-        lines.pop(0)  # remove header
-        lines = [x.split(',') for x in lines if x != '']
+        return results
 
-        jobs = {}
-        for job_id, state in lines:
-            # ensure unique_id is of type string for downstream use.
-            job_id = str(job_id)
-            jobs[job_id] = state
+    def _stream(self, proc, stream_to, callback, stdout_callback=None):
+        # drain stdout and stderr concurrently so that neither PIPE fills up
+        # and blocks the process.
+        lock = Lock()
+        last_report = [time()]
+        # the first exception raised by stdout_callback. Once it has been
+        # raised, the rest of stdout is only written to its file, so that
+        # the process can't block on a full PIPE.
+        errors = []
+
+        def _drain(pipe, path, tail, line_callback):
+            writer = RotatingWriter(path, self.stream_max_bytes,
+                                    self.stream_backup_count)
+            try:
+                for line in pipe:
+                    writer.write(line)
+                    tail.append(line)
+
+                    if line_callback is not None and not errors:
+                        try:
+                            line_callback(line)
+                        except Exception as e:
+                            errors.append(e)
+
+                    if callback is None or not line.strip():
+                        continue
+
+                    with lock:
+                        now = time()
+                        if (now - last_report[0] <
+                                self.stream_progress_interval_in_seconds):
+                            continue
+                        last_report[0] = now
+
+                    callback(jid=proc.pid, status=line.strip())
+            finally:
+                writer.close()
+                pipe.close()
+
+        tails = [deque(maxlen=self.stream_tail_lines) for _ in range(2)]
+        threads = [Thread(target=_drain, args=(pipe, f'{stream_to}.{ext}',
+                                               tail, line_callback))
+                   for pipe, ext, tail, line_callback in [
+                       (proc.stdout, 'stdout', tails[0], stdout_callback),
+                       (proc.stderr, 'stderr', tails[1], None)]]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        proc.wait()
+
+        if errors:
+            raise PipelineError(f"Could not process the output of command "
+                                f"(see {stream_to}.stdout): "
+                                f"{errors[0]}") from errors[0]
+
+        return ''.join(tails[0]), ''.join(tails[1])
 
-        return jobs
+    def _query_slurm(self, job_ids):
+        # query_slurm encapsulates the handling of squeue, or of whichever
+        # executor is running the job in its place.
+        return self.executor.query(self, job_ids)
 
     def wait_on_job_ids(self, job_ids, callback=None):
         '''
@@ -315,6 +607,9 @@ class Job:
             # states are 'running' states or not.
             jobs = self._query_slurm(job_ids)
 
+            for job_id in job_ids:
+                self._update_phases(job_id, jobs)
+
             # jobs will be a dict of job-ids or array-ids for jobs that
             # are array-jobs. the value of jobs[id] will be a state e.g.:
             # 'RUNNING', 'FAILED', 'COMPLETED'.
@@ -328,12 +623,41 @@ class Job:
                 # that are running.
                 break
 
-            logging.debug(f"sleeping {Job.polling_interval_in_seconds} "
-                          "seconds...")
-            sleep(Job.polling_interval_in_seconds)
+            interval = self._polling_interval()
+            logging.debug(f"sleeping {interval} seconds...")
+            sleep(interval)
 
         return jobs
 
+    def _update_phases(self, job_id, results):
+        """
+        Record the time a submitted job spent waiting in the queue and
+        running, based on the states reported by the scheduler.
+        :param job_id: The id of a job submitted by submit_job().
+        :param results: A dictionary of job-ids or array-ids and their states.
+        :return: None
+        """
+        states = [v for k, v in results.items()
+                  if k == job_id or k.startswith(f'{job_id}_')]
+
+        if not states:
+            return
+
+        # the job has left the queue once any part of it has started.
+        if [x for x in states if x != 'PENDING']:
+            if self.metrics.stop('queue_wait', key=job_id, job_id=job_id):
+                self.metrics.start('run', key=job_id)
+
+        if not [x for x in states if x not in Job.slurm_status_not_running]:
+            self.metrics.stop('run', key=job_id, job_id=job_id)
+
+    def _polling_interval(self):
+        # executors that run jobs locally can be polled more frequently.
+        if self.executor.polling_interval_in_seconds is not None:
+            return self.executor.polling_interval_in_seconds
+
+        return Job.polling_interval_in_seconds
+
     def submit_job(self, script_path, job_parameters=None,
                    script_parameters=None, wait=True,
                    exec_from=None, callback=None):
@@ -350,32 +674,22 @@ class Job:
                  job. Raises PipelineError if job could not be submitted or if
                  job was unsuccessful.
         """
-        if job_parameters:
-            cmd = 'sbatch %s %s' % (job_parameters, script_path)
-        else:
-            cmd = 'sbatch %s' % (script_path)
-
-        if script_parameters:
-            cmd += ' %s' % script_parameters
-
-        if exec_from:
-            cmd = f'cd {exec_from};' + cmd
-
-        logging.debug("job scheduler call: %s" % cmd)
-
         if self.force_job_fail:
             raise JobFailedError("This job died.")
 
-        # if system_call does not raise a PipelineError(), then the scheduler
-        # successfully submitted the job. In this case, it should return
-        # the id of the job in stdout.
-        results = self._system_call(cmd)
-        stdout = results['stdout']
+        # everything done since the job began submitting was in preparation
+        # for this call.
+        self.metrics.stop('script_generation')
 
-        job_id = stdout.strip().split()[-1]
+        # if the executor does not raise a PipelineError(), then the job was
+        # successfully submitted and its id is returned.
+        with self.metrics.timer('submit'):
+            job_id = self.executor.submit(self, script_path,
+                                          job_parameters=job_parameters,
+                                          script_parameters=script_parameters,
+                                          exec_from=exec_from)
 
-        # Just to give some time for everything to be set up properly
-        sleep(10)
+        self.metrics.start('queue_wait', key=job_id)
 
         if wait is False:
             # return job_id since that is the only information for this new
@@ -383,12 +697,28 @@ class Job:
             # not a dict if they explicitly set wait=False.
             return job_id
 
+        return self.wait(job_id, callback=callback)
+
+    def _process_job_states(self, job_id, results, callback=None):
+        """
+        Reduce the states of a finished job to a single result.
+        :param job_id: The Slurm job-id of the finished job.
+        :param results: A dictionary of job-ids or array-ids and their states,
+                        as returned by wait_on_job_ids(). May contain entries
+                        for other jobs as well.
+        :param callback: Set callback function that receives status updates.
+        :return: A dictionary containing the job's id and status. Raises
+                 JobFailedError if the job was unsuccessful.
+        """
+        # wait_on_job_ids() may have been called on behalf of more than one
+        # job. Consider only the job-id and the array-ids belonging to it.
+        results = {k: v for k, v in results.items()
+                   if k == job_id or k.startswith(f'{job_id}_')}
+
         # the user is expecting a dict with 'job_id' and 'job_state'
         # attributes. This method will return a dict w/job_ids as keys and
         # their job status as values. This must be munged before returning
         # to the user.
-        results = self.wait_on_job_ids([job_id], callback=callback)
-
         if job_id in results:
             # job is a non-array job
             job_result = {'job_id': job_id, 'job_state': results[job_id]}
@@ -432,7 +762,34 @@ class Job:
                 raise JobFailedError(f"job {job_id} exited with status "
                                      f"{job_result['job_state']}")
 
-    def _group_commands(self, cmds):
+    def _group_commands(self, cmds, sizes=None, min_bytes_per_task=0):
+        """
+        Group commands into at most max_array_length chained commands.
+        :param cmds: A list of commands.
+        :param sizes: Optional dictionary of commands and the number of bytes
+                      of input each one processes. If given, commands are
+                      packed so that each chained command processes roughly
+                      the same number of bytes.
+        :param min_bytes_per_task: If sizes are given, use fewer chained
+                      commands so that each one processes at least this many
+                      bytes where possible.
+        :return: A list of chained commands.
+        """
+        return [';'.join(x) for x in
+                self._group_command_lists(cmds, sizes, min_bytes_per_task)]
+
+    def _group_command_lists(self, cmds, sizes=None, min_bytes_per_task=0):
+        """
+        Group commands into at most max_array_length lists of commands, as
+        _group_commands() chains them.
+        :param cmds: A list of commands.
+        :param sizes: See _group_commands().
+        :param min_bytes_per_task: See _group_commands().
+        :return: A list of lists of commands, one for each array task.
+        """
+        if sizes is not None:
+            return self._pack_commands(cmds, sizes, min_bytes_per_task)
+
         # break list of commands into chunks of max_array_length (Typically
         # 1000 for Slurm job arrays). To ensure job arrays are never more
         # than 1000 jobs long, we'll chain additional commands together, and
@@ -449,12 +806,206 @@ class Job:
         for tuple in zip_longest(*chunks):
             # zip_longest() pads shorter lists with None. In our case, we
             # don't want an additional command named 'None'.
-            chained_cmd = [x for x in list(tuple) if x is not None]
-            chained_cmd = ';'.join(chained_cmd)
-            results.append(chained_cmd)
+            results.append([x for x in list(tuple) if x is not None])
+
+        return results
+
+    def _pack_commands(self, cmds, sizes, min_bytes_per_task):
+        if not cmds:
+            return []
+
+        task_count = min(self.max_array_length, len(cmds))
+
+        if min_bytes_per_task:
+            # collapse small commands into fewer tasks so that the overhead
+            # of scheduling each task is amortized.
+            total = sum([sizes.get(x, 0) for x in cmds])
+            task_count = max(1, min(task_count,
+                                    int(total // min_bytes_per_task)))
+
+        # longest-processing-time-first: assign the largest remaining command
+        # to the task w/the fewest bytes assigned so far.
+        heap = [(0, i) for i in range(task_count)]
+        tasks = [[] for _ in range(task_count)]
+
+        for cmd in sorted(cmds, key=lambda x: (-sizes.get(x, 0), x)):
+            size, i = heappop(heap)
+            tasks[i].append(cmd)
+            heappush(heap, (size + sizes.get(cmd, 0), i))
+
+        return tasks
+
+    def _write_task_manifest(self, manifest_path, task_commands):
+        """
+        Writes the commands for each array task as a JSON manifest for
+        scripts/task_runner.py.
+        :param manifest_path: The path to write the manifest to.
+        :param task_commands: A list of lists of commands, one for each array
+                              task, as returned by _group_command_lists().
+        :return: None
+        """
+        manifest = {str(i): list(x) for i, x in enumerate(task_commands, 1)}
+
+        with open(manifest_path, 'w') as f:
+            f.write(dumps(manifest, indent=2))
+
+    def _task_memory(self, jmem, nprocs, nthreads, task_commands):
+        """
+        Returns the memory to request for each array task.
+        scripts/task_runner.py runs up to nprocs // nthreads of a task's
+        commands at once, hence jmem, the memory needed by one command, is
+        multiplied by the number of commands that may run concurrently.
+        :param jmem: The memory needed by one command e.g.: '8' or '8g'.
+        :param nprocs: The number of cores allocated to each array task.
+        :param nthreads: The number of cores each command uses.
+        :param task_commands: A list of lists of commands, one for each array
+                              task.
+        :return: The memory to request, in the same units as jmem.
+        """
+        concurrent = min(max(1, int(nprocs) // max(1, int(nthreads))),
+                         max([len(x) for x in task_commands] + [1]))
+
+        if concurrent == 1:
+            return jmem
+
+        m = re.match(r'^(\d+(?:\.\d+)?)(\D*)$', str(jmem).strip())
+        if m is None:
+            raise PipelineError(f"'{jmem}' is not a valid amount of memory")
+
+        return f'{ceil(float(m.group(1)) * concurrent)}{m.group(2)}'
+
+    def _get_task_results(self):
+        """
+        Returns the results written by scripts/task_runner.py.
+        :return: A dictionary of array task-ids and their results.
+        """
+        results = {}
+        for some_path in self._find_files(self.log_path):
+            m = re.match(r'^%s_(\d+)\.results\.json$' % self.job_name,
+                         basename(some_path))
+            if m:
+                with open(some_path, 'r') as f:
+                    results[int(m.group(1))] = load(f)
+
+        return results
+
+    def _get_failed_commands(self, indexes):
+        """
+        Returns the commands that failed in the given array tasks.
+        :param indexes: A list of array task-ids.
+        :return: A list of dictionaries w/the task-id, command and return
+                 code of each failed command.
+        """
+        task_results = self._get_task_results()
+
+        results = []
+        for index in indexes:
+            if index not in task_results:
+                # the task never finished e.g.: it was killed by Slurm.
+                continue
+
+            for cmd in task_results[index]['commands']:
+                if cmd['return_code'] != 0:
+                    results.append({'index': index,
+                                    'command': cmd['command'],
+                                    'return_code': cmd['return_code']})
 
         return results
 
+    def _get_tool_version(self, executable_path):
+        """
+        Returns the version an executable reports w/--version.
+        Results are cached for the life of the process.
+        :param executable_path: The path to an executable.
+        :return: The output of the executable.
+        """
+        modules = tuple(self.modules_to_load) if self.modules_to_load else ()
+
+        if (modules, executable_path) not in Job._tool_version_cache:
+            cmd = f'{quote(executable_path)} --version'
+            if modules:
+                cmd = 'module load ' + ' '.join(modules) + ';' + cmd
+
+            results = self._system_call(cmd)
+            Job._tool_version_cache[(modules, executable_path)] = (
+                results['stdout'] + results['stderr']).strip()
+
+        return Job._tool_version_cache[(modules, executable_path)]
+
+    def _is_cached(self, command, input_paths, output_paths):
+        """
+        Returns True if a command's outputs are up to date in result_cache.
+        Otherwise, the command is remembered so that its outputs can be
+        cached by _cache_completed_commands() once it has run.
+        :param command: A command.
+        :param input_paths: A list of the files and directories it reads.
+        :param output_paths: A list of the files it writes.
+        :return: bool
+        """
+        if self.result_cache is None:
+            return False
+
+        key = self.result_cache.key(command, input_paths, self.tool_version)
+
+        if self.result_cache.is_cached(key):
+            logging.debug(f"skipping '{command}': outputs are up to date.")
+            return True
+
+        self.cache_entries[command] = (key, output_paths)
+        return False
+
+    def _cache_completed_commands(self, failed_indexes):
+        """
+        Record the outputs of the commands run by array tasks that completed.
+        :param failed_indexes: A list of the array task-ids that failed.
+        :return: None
+        """
+        if self.result_cache is None:
+            return
+
+        for index, commands in enumerate(self.task_commands, 1):
+            if index in failed_indexes:
+                continue
+
+            for cmd in commands:
+                if cmd not in self.cache_entries:
+                    continue
+
+                key, output_paths = self.cache_entries[cmd]
+                if all([exists(x) for x in output_paths]):
+                    self.result_cache.add(key, cmd, output_paths)
+
+        self.result_cache.save()
+
+    def _clear_task_markers(self):
+        """
+        Remove the .completed and .results.json files written by the array
+        tasks of a previous submission, so they aren't mistaken for this
+        submission's.
+        :return: None
+        """
+        for some_path in self._find_files(self.log_path):
+            if re.match(r'^%s_\d+\.(completed|results\.json)$' %
+                        self.job_name, basename(some_path)):
+                remove(some_path)
+
+    def _total_size(self, paths):
+        """
+        Returns the total size of files and the contents of directories.
+        :param paths: A list of paths to files and/or directories.
+        :return: The total size in bytes. Paths that don't exist are ignored.
+        """
+        total = 0
+        for some_path in paths:
+            if isdir(some_path):
+                total += sum([x.size for x in
+                              FileManifest.get(some_path).entries(some_path)
+                              if x.size is not None])
+            elif exists(some_path):
+                total += getsize(some_path)
+
+        return total
+
     # assume for now that a corresponding zip file exists for each html
     # file found. Assume for now that all html files will be found in a
     # 'filtered_sequences' or 'trimmed_sequences' subdirectory.
@@ -474,26 +1025,27 @@ class Job:
         if self.suffix is None:
             raise PipelineError("Audit() method called on base Job object.")
 
-        for root, dirs, files in walk(self.output_path):
+        for entry in FileManifest.get(self.output_path).entries(
+                self.output_path):
+            root = dirname(entry.path)
             if 'zero_files' in root:
                 continue
             if self.audit_folders is not None:
                 # let's check that any of the audit_folders is in root
                 if not [f for f in self.audit_folders if f in root]:
                     continue
-            files_found += [join(root, x) for x in files if
-                            x.endswith(self.suffix)]
+            if entry.path.endswith(self.suffix):
+                files_found.append(entry.path)
+
+        # the trailing underscore is important as it can be assumed
+        # that all fastq.gz files will begin with sample_id followed
+        # by an '_', and then one or more additional parameters
+        # separated by underscores. This substring is unlikely to be
+        index = PrefixIndex(sample_ids, delimiter='_')
 
         found = []
-        for sample_id in sample_ids:
-            for found_file in files_found:
-                # the trailing underscore is important as it can be assumed
-                # that all fastq.gz files will begin with sample_id followed
-                # by an '_', and then one or more additional parameters
-                # separated by underscores. This substring is unlikely to be
-                if basename(found_file).startswith('%s_' % sample_id):
-                    found.append(sample_id)
-                    break
+        for found_file in files_found:
+            found += index.matches(basename(found_file))
 
         return sorted(list(set(found) ^ set(sample_ids)))
 
@@ -515,17 +1067,17 @@ class Job:
 
         # given a nested directory containing fastq.gz files from any part
         # of the SPP, get a list of paths to just the fastq files.
-        for root, dirs, files in walk(path_to_fastq_dir):
-            for file_name in files:
-                if file_name.endswith('.fastq.gz'):
-                    if not file_name.startswith('Undetermined'):
-                        # do not include the Undetermined files found in
-                        # ConvertJob, because they do not contain a project
-                        # name in their path, by definition.
-                        # don't record the full_path w/filename, as we're
-                        # not interested in the files themselves, just their
-                        # basedirs().
-                        tmp.append(root)
+        for file_path in self._find_files(path_to_fastq_dir):
+            root, file_name = split(file_path)
+            if file_name.endswith('.fastq.gz'):
+                if not file_name.startswith('Undetermined'):
+                    # do not include the Undetermined files found in
+                    # ConvertJob, because they do not contain a project
+                    # name in their path, by definition.
+                    # don't record the full_path w/filename, as we're
+                    # not interested in the files themselves, just their
+                    # basedirs().
+                    tmp.append(root)
 
         # break up the path into a set of unique directory names. at least
         # some of these will be of the form PROJECT-NAME_QIITA-ID. Flatten
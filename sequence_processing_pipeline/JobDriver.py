@@ -0,0 +1,178 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.PipelineError import JobFailedError
+from threading import Lock, Thread
+from time import sleep
+import logging
+
+
+class JobDriver:
+    def __init__(self, max_workers=4):
+        """
+        Submits and monitors many Jobs from within a single process.
+
+        Jobs are submitted w/out blocking and a Future is returned for each
+        one. A single monitoring thread polls Slurm on behalf of all of the
+        submitted Jobs at once and hands each Job that has finished to a pool
+        of worker threads for post-processing. The Future resolves to the
+        dictionary returned by Job.wait() once Job.finalize() has completed,
+        or to the Error raised along the way. Jobs that Job.complete_locally()
+        completes are finalized w/out being submitted, as Job.run() does. Use
+        asyncio.wrap_future() to await a Future from within an event loop.
+        :param max_workers: The maximum number of Jobs to submit or finalize
+                            at the same time.
+        """
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = {}
+        self.futures = []
+        self.lock = Lock()
+        self.monitor = None
+
+    def submit(self, job, callback=None):
+        """
+        Submit a Job w/out waiting for it to finish.
+        :param job: A Job object that implements submit().
+        :param callback: Set callback function that receives status updates.
+        :return: A Future for the Job's results.
+        """
+        future = Future()
+        self.futures.append(future)
+        self.pool.submit(self._submit, job, future, callback)
+        return future
+
+    def run(self, jobs, callback=None):
+        """
+        Submit Jobs and wait for all of them to finish.
+        :param jobs: A list of Job objects that implement submit().
+        :param callback: Set callback function that receives status updates.
+        :return: A list of results, in the same order as jobs. Raises the
+                 first Error encountered, in the same order as jobs.
+        """
+        futures = [self.submit(job, callback=callback) for job in jobs]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def wait(self):
+        """
+        Wait for all Jobs submitted so far to finish.
+        :return: None
+        """
+        wait(self.futures)
+
+    def shutdown(self):
+        """
+        Wait for all Jobs submitted so far to finish and release resources.
+        :return: None
+        """
+        self.wait()
+        self.pool.shutdown()
+
+    def _submit(self, job, future, callback):
+        try:
+            job.metrics.start('script_generation')
+            job_info = job.complete_locally(callback=callback)
+            if job_info is None:
+                job_id = str(job.submit(callback=callback))
+        except JobFailedError as e:
+            future.set_exception(job._describe_failure(e))
+            return
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        if job_info is not None:
+            # there was nothing to submit; the job is already complete.
+            self._post_process(job, job_info, future)
+            return
+
+        logging.debug(f'{job.job_name} submitted as job {job_id}')
+
+        with self.lock:
+            self.pending[job_id] = (job, future, callback)
+
+            if self.monitor is None:
+                self.monitor = Thread(target=self._monitor, daemon=True)
+                self.monitor.start()
+
+    def _monitor(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    # nothing left to monitor. A new monitor will be started
+                    # by the next call to _submit().
+                    self.monitor = None
+                    return
+
+                pending = dict(self.pending)
+
+            # any one of the Jobs can query Slurm (or whichever executor is
+            # running them) on behalf of all Jobs sharing the same executor.
+            by_executor = {}
+            for job_id, (job, _, _) in pending.items():
+                by_executor.setdefault(id(job.executor), []).append(job_id)
+
+            states = {}
+            for job_ids in by_executor.values():
+                some_job = pending[job_ids[0]][0]
+                try:
+                    states.update(some_job._query_slurm(job_ids))
+                except Exception as e:
+                    # squeue is persistently unavailable. There's no way to
+                    # know the outcome of any of these Jobs.
+                    with self.lock:
+                        for job_id in job_ids:
+                            del self.pending[job_id]
+                            pending.pop(job_id)[1].set_exception(e)
+
+            interval = min([job._polling_interval() for job, _, _ in
+                            pending.values()], default=0)
+
+            for job_id in pending:
+                pending[job_id][0]._update_phases(job_id, states)
+
+                # consider only the job-id and the array-ids belonging to it.
+                job_states = {k: v for k, v in states.items()
+                              if k == job_id or k.startswith(f'{job_id}_')}
+
+                if not job_states:
+                    continue
+
+                if [x for x in job_states.values()
+                        if x not in Job.slurm_status_not_running]:
+                    # some or all of the job is still running.
+                    continue
+
+                with self.lock:
+                    del self.pending[job_id]
+
+                job, future, callback = pending[job_id]
+                self.pool.submit(self._finalize, job, job_id, job_states,
+                                 future, callback)
+
+            with self.lock:
+                if not self.pending:
+                    continue
+
+            logging.debug(f"sleeping {interval} seconds...")
+            sleep(interval)
+
+    def _finalize(self, job, job_id, job_states, future, callback):
+        try:
+            job_info = job._process_job_states(job_id, job_states,
+                                               callback=callback)
+        except JobFailedError as e:
+            future.set_exception(job._describe_failure(e))
+            return
+
+        self._post_process(job, job_info, future)
+
+    def _post_process(self, job, job_info, future):
+        try:
+            with job.metrics.timer('post_processing',
+                                   job_id=job_info['job_id']):
+                job.finalize(job_info)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        future.set_result(job_info)
@@ -0,0 +1,155 @@
+from contextlib import contextmanager
+from fcntl import flock, LOCK_EX
+from json import dumps, loads
+from os import walk
+from os.path import isdir, join
+from threading import Lock
+from time import time
+import pandas as pd
+
+
+class Metrics:
+    def __init__(self, path, **fields):
+        """
+        Records the wall time of named phases to a JSON-lines file.
+
+        Each line is a JSON object w/at least 'phase', 'start', 'end' and
+        'elapsed' (in seconds) keys, plus any fields given here or when the
+        phase is recorded. Lines are appended under an exclusive lock, hence
+        many processes (e.g. array tasks) can share the same file.
+        :param path: The path to the JSON-lines file to append to.
+        :param fields: Fields to include in every record e.g. source='Job'.
+        """
+        self.path = path
+        self.fields = fields
+        self.starts = {}
+        self.lock = Lock()
+
+    def record(self, phase, start, end, **fields):
+        """
+        Append a record for a phase.
+        :param phase: The name of the phase.
+        :param start: The time the phase started, in seconds since epoch.
+        :param end: The time the phase ended, in seconds since epoch.
+        :param fields: Additional fields to include in the record.
+        :return: None
+        """
+        record = {'phase': phase}
+        record.update(self.fields)
+        record.update(fields)
+        record.update({'start': start, 'end': end, 'elapsed': end - start})
+
+        line = dumps(record) + '\n'
+
+        with self.lock:
+            with open(self.path, 'a') as f:
+                flock(f, LOCK_EX)
+                f.write(line)
+
+    def start(self, phase, key=None):
+        """
+        Mark the start of a phase that will be ended by stop().
+        :param phase: The name of the phase.
+        :param key: Optional key to distinguish concurrent instances of the
+                    same phase e.g. a job-id.
+        :return: None
+        """
+        with self.lock:
+            self.starts[(phase, key)] = time()
+
+    def stop(self, phase, key=None, **fields):
+        """
+        Mark the end of a phase started by start() and record it.
+        :param phase: The name of the phase.
+        :param key: The key given to start(), if any.
+        :param fields: Additional fields to include in the record.
+        :return: True if the phase was started and is now recorded.
+        """
+        with self.lock:
+            start = self.starts.pop((phase, key), None)
+
+        if start is None:
+            return False
+
+        self.record(phase, start, time(), **fields)
+        return True
+
+    @contextmanager
+    def timer(self, phase, **fields):
+        """
+        Record the time spent in a with-block as a phase.
+        :param phase: The name of the phase.
+        :param fields: Additional fields to include in the record.
+        """
+        start = time()
+        try:
+            yield
+        finally:
+            self.record(phase, start, time(), **fields)
+
+
+def load_metrics(paths, file_name='metrics.jsonl'):
+    """
+    Load metrics records from files and directories.
+    :param paths: A list of paths to JSON-lines files or to directories that
+                  will be searched for files named file_name.
+    :param file_name: The name of the files to search for.
+    :return: A DataFrame w/one row for each record.
+    """
+    files = []
+    for path in paths:
+        if isdir(path):
+            for root, dirs, names in walk(path):
+                files += [join(root, x) for x in names if x == file_name]
+        else:
+            files.append(path)
+
+    records = []
+    for some_file in sorted(files):
+        with open(some_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(loads(line))
+
+    df = pd.DataFrame(records)
+
+    if df.empty:
+        df = pd.DataFrame(columns=['source', 'phase', 'start', 'end',
+                                   'elapsed'])
+    elif 'source' not in df.columns:
+        df['source'] = None
+
+    return df
+
+
+def summarize_metrics(df):
+    """
+    Report where run time was spent.
+    :param df: A DataFrame returned by load_metrics().
+    :return: A DataFrame w/one row for each source and phase, reporting the
+             number of times the phase was recorded and the total, mean and
+             maximum elapsed seconds. 'share' is the phase's fraction of the
+             total time recorded for its source. Phases of a source may
+             overlap (e.g. array tasks running in parallel), hence 'share'
+             describes the work done rather than the wall time.
+    """
+    columns = ['source', 'phase', 'count', 'total', 'mean', 'max', 'share']
+
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df = df.copy()
+    df['source'] = df['source'].fillna('')
+
+    summary = df.groupby(['source', 'phase'])['elapsed'].agg(
+        ['count', 'sum', 'mean', 'max']).reset_index()
+    summary = summary.rename(columns={'sum': 'total'})
+
+    totals = summary.groupby('source')['total'].transform('sum')
+    summary['share'] = (summary['total'] / totals).fillna(0)
+
+    summary = summary.sort_values(by=['source', 'total'],
+                                  ascending=[True, False])
+
+    return summary[columns].reset_index(drop=True)
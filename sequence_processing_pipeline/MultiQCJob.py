@@ -4,11 +4,15 @@ from json import dumps
 import logging
 from os import listdir
 from os.path import join, basename, exists, sep, split
+from sequence_processing_pipeline.FastpSummary import (find_fastp_reports,
+                                                       summarize_fastp_reports,
+                                                       write_fastp_summary)
 from sequence_processing_pipeline.Job import Job, KISSLoader
-from sequence_processing_pipeline.PipelineError import (PipelineError,
-                                                        JobFailedError)
+from sequence_processing_pipeline.PipelineError import PipelineError
+from sequence_processing_pipeline.ResultCache import ResultCache
 from sequence_processing_pipeline.util import determine_orientation
 from re import sub
+from sys import executable
 
 
 class MultiQCJob(Job):
@@ -16,7 +20,9 @@ class MultiQCJob(Job):
                  processed_fastq_files_path, nprocs, nthreads, multiqc_path,
                  modules_to_load, qiita_job_id, queue_name, node_count,
                  wall_time_limit, jmem, pool_size, fastqc_root_path,
-                 max_array_length, multiqc_config_file_path, is_amplicon):
+                 max_array_length, multiqc_config_file_path, is_amplicon,
+                 pack_by_size=False, min_bytes_per_task=0, use_cache=False,
+                 cache_checksums=False, fastp_summary_processes=0):
         super().__init__(run_dir,
                          output_path,
                          'MultiQCJob',
@@ -38,6 +44,23 @@ class MultiQCJob(Job):
         self.multiqc_config_file_path = multiqc_config_file_path
         self.is_amplicon = is_amplicon
         self.fastqc_root_path = fastqc_root_path
+        self.pack_by_size = pack_by_size
+        self.min_bytes_per_task = min_bytes_per_task
+        # the number of bytes of input each command processes.
+        self.command_sizes = {}
+        # if non-zero, the fastp reports for all projects are summarized in
+        # fastp_summary.tsv using this many processes.
+        self.fastp_summary_processes = fastp_summary_processes
+
+        if use_cache:
+            # leave out projects whose reports are up to date from a previous
+            # run. MultiQC doesn't read the HTML reports found alongside
+            # FastQC's zips and fastp's JSON; regenerating them alone
+            # shouldn't regenerate a project's report.
+            self.result_cache = ResultCache(
+                join(self.output_path, f'{self.job_name}.cache.json'),
+                checksums=cache_checksums, ignore_suffixes=['.html'])
+            self.tool_version = self._get_tool_version(multiqc_path)
 
         self.job_script_path = join(self.output_path, f"{self.job_name}.sh")
 
@@ -122,10 +145,16 @@ class MultiQCJob(Job):
         # generate log-file here instead of in run() where it can be
         # unittested more easily.
         if failed_indexes:
+            report = {'job_id': job_id, 'failed_indexes': failed_indexes}
+
+            # include the commands that failed and how, where known.
+            failed_commands = self._get_failed_commands(failed_indexes)
+            if failed_commands:
+                report['failed_commands'] = failed_commands
+
             with open(join(self.output_path, 'logs',
                            f'failed_indexes_{job_id}.json'), 'w') as f:
-                f.write(dumps({'job_id': job_id,
-                               'failed_indexes': failed_indexes}, indent=2))
+                f.write(dumps(report, indent=2))
 
         return failed_indexes
 
@@ -152,6 +181,9 @@ class MultiQCJob(Job):
 
             p_path = partial(join, self.processed_fastq_files_path, project)
             input_path_list.append(p_path('fastp_reports_dir', 'json'))
+            # QC reports collected by demux, if FastQC was skipped for
+            # processed files.
+            input_path_list.append(p_path('qc_stats'))
 
             # I don't usually see a json directory associated with raw data.
             # It looks to be metadata coming directly off the machine, in the
@@ -168,23 +200,50 @@ class MultiQCJob(Job):
             # file and hence this switch was redunant and now removed.
             cmd_tail = ['-o', join(self.output_path, 'multiqc', project)]
 
-            array_cmds.append(' '.join(cmd_head + input_path_list + cmd_tail))
+            command = ' '.join(cmd_head + input_path_list + cmd_tail)
+
+            output_paths = [join(self.output_path, 'multiqc', project,
+                                 'multiqc_report.html')]
+
+            # the report also depends on the contents of the config file.
+            if self._is_cached(command,
+                               [self.multiqc_config_file_path] +
+                               input_path_list, output_paths):
+                continue
+
+            array_cmds.append(command)
+            if self.pack_by_size:
+                self.command_sizes[command] = self._total_size(
+                    input_path_list)
 
         # These commands are okay to execute in parallel because each command
         # is limited to a specific project and each invocation creates its own
         # multiqc/project output directory so there will not be collisions.
         # These commands must be executed after FastQCJob has completed for
         # FastQC report results to be included, however.
-        return array_cmds
+        if self.pack_by_size:
+            # balance the amount of input each array task processes.
+            return self._group_command_lists(
+                array_cmds, sizes=self.command_sizes,
+                min_bytes_per_task=self.min_bytes_per_task)
+
+        return [[x] for x in array_cmds]
 
     def _generate_job_script(self):
         template = self.jinja_env.get_template("multiqc_job.sh")
 
-        self.array_cmds = self._get_commands()
+        self.task_commands = self._get_commands()
+        self.array_cmds = [';'.join(x) for x in self.task_commands]
+
+        if not self.array_cmds:
+            # all reports are up to date; there is nothing to submit.
+            return None
 
         job_name = f'{self.qiita_job_id}_{self.job_name}'
         details_file_name = f'{self.job_name}.array-details'
         array_details = join(self.output_path, details_file_name)
+        task_manifest = join(self.output_path, f'{self.job_name}.tasks.json')
+        self._write_task_manifest(task_manifest, self.task_commands)
         array_params = "1-%d%%%d" % (len(self.array_cmds), self.pool_size)
         modules_to_load = ' '.join(self.modules_to_load)
 
@@ -195,10 +254,16 @@ class MultiQCJob(Job):
                                     node_count=self.node_count,
                                     nprocs=self.nprocs,
                                     wall_time_limit=self.wall_time_limit,
-                                    mem_in_gb=self.jmem,
+                                    mem_in_gb=self._task_memory(
+                                        self.jmem, self.nprocs,
+                                        self.nthreads, self.task_commands),
                                     array_params=array_params,
                                     output_path=self.output_path,
-                                    modules_to_load=modules_to_load))
+                                    modules_to_load=modules_to_load,
+                                    nthreads=self.nthreads,
+                                    python_path=executable,
+                                    task_runner_path=self.task_runner_path,
+                                    task_manifest=task_manifest))
 
         # save the .details file as well
         with open(array_details, 'w') as f:
@@ -206,21 +271,48 @@ class MultiQCJob(Job):
 
         return self.job_script_path
 
-    def run(self, callback=None):
-        try:
-            job_info = self.submit_job(self.job_script_path,
-                                       exec_from=self.log_path,
-                                       callback=callback)
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            info = self.parse_logs()
-            # prepend just the message component of the Error.
-            info.insert(0, str(e))
-            raise JobFailedError('\n'.join(info)) from None
-
+    def write_fastp_summary(self):
+        """
+        Summarize the fastp reports of all projects in a single table.
+        :return: The path to the table written.
+        """
+        reports = find_fastp_reports([self.processed_fastq_files_path])
+        df = summarize_fastp_reports(
+            reports, processes=self.fastp_summary_processes)
+
+        output_path = join(self.output_path, 'fastp_summary.tsv')
+        write_fastp_summary(df, output_path)
+
+        return output_path
+
+    def complete_locally(self, callback=None):
+        if not self.array_cmds:
+            # all reports are up to date; there is nothing to submit.
+            logging.debug('MultiQCJob has no commands to run.')
+            self.mark_job_completed()
+            return {'job_id': None, 'job_state': 'COMPLETED'}
+
+        return None
+
+    def submit(self, callback=None):
+        self._clear_task_markers()
+        return self.submit_job(self.job_script_path,
+                               exec_from=self.log_path,
+                               wait=False,
+                               callback=callback)
+
+    def finalize(self, job_info):
         logging.debug(job_info)
 
-        if self._get_failed_indexes(job_info['job_id']):
+        if self.fastp_summary_processes:
+            self.write_fastp_summary()
+
+        failed_indexes = self._get_failed_indexes(job_info['job_id'])
+
+        # cache the reports of the tasks that completed, even if others
+        # failed, so that they aren't regenerated when the job is rerun.
+        self._cache_completed_commands(failed_indexes)
+
+        if failed_indexes:
             # raise error if list isn't empty.
             raise PipelineError("MultiQCJob did not complete successfully.")
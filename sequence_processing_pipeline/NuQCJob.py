@@ -2,8 +2,7 @@ from metapool import load_sample_sheet
 from os import stat, makedirs, rename
 from os.path import join, basename, dirname, exists, abspath, split
 from sequence_processing_pipeline.Job import Job, KISSLoader
-from sequence_processing_pipeline.PipelineError import (PipelineError,
-                                                        JobFailedError)
+from sequence_processing_pipeline.PipelineError import PipelineError
 from sequence_processing_pipeline.Pipeline import Pipeline
 from shutil import move
 import logging
@@ -25,7 +24,7 @@ class NuQCJob(Job):
                  samtools_path, modules_to_load, qiita_job_id,
                  max_array_length, known_adapters_path, movi_path, gres_value,
                  pmls_path, additional_fastq_tags, bucket_size=8,
-                 length_limit=100, cores_per_task=4):
+                 length_limit=100, cores_per_task=4, collect_qc_stats=False):
         """
         Submit a slurm job where the contents of fastq_root_dir are processed
         using fastp, minimap2, and samtools. Human-genome sequences will be
@@ -52,6 +51,8 @@ class NuQCJob(Job):
         :param cores_per_task: Number of CPU cores per node to request.
         :param additional_fastq_tags: A list of fastq tags to preserve during
         filtering.
+        :param collect_qc_stats: If True, demux writes FastQC-compatible
+        reports for each filtered fastq file to <project>/qc_stats.
         """
         super().__init__(fastq_root_dir,
                          output_path,
@@ -101,6 +102,7 @@ class NuQCJob(Job):
         # because it's allowable to request more cores than are available on
         # one node using this pair of switches (N nodes * n tasks per node).
         self.cores_per_task = cores_per_task
+        self.collect_qc_stats = collect_qc_stats
 
         self.temp_dir = join(self.output_path, 'tmp')
         makedirs(self.temp_dir, exist_ok=True)
@@ -225,7 +227,7 @@ class NuQCJob(Job):
         else:
             raise ValueError(f"'{output_path}' does not exist")
 
-    def run(self, callback=None):
+    def submit(self, callback=None):
         # now a single job-script will be created to process all projects at
         # the same time, and intelligently handle adapter-trimming as needed
         # as well as human-filtering.
@@ -254,19 +256,13 @@ class NuQCJob(Job):
         # job_script_path formerly known as:
         #  process.multiprep.pangenome.adapter-filter.pe.sbatch
 
-        try:
-            job_info = self.submit_job(job_script_path,
-                                       job_parameters=' '.join(job_params),
-                                       exec_from=self.log_path,
-                                       callback=callback)
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            info = self.parse_logs()
-            # prepend just the message component of the Error.
-            info.insert(0, str(e))
-            raise JobFailedError('\n'.join(info))
+        return self.submit_job(job_script_path,
+                               job_parameters=' '.join(job_params),
+                               exec_from=self.log_path,
+                               wait=False,
+                               callback=callback)
 
+    def finalize(self, job_info):
         job_id = job_info['job_id']
 
         self.mark_job_completed()
@@ -346,6 +342,12 @@ class NuQCJob(Job):
                                            empty_files_directory,
                                            self.minimum_bytes)
 
+            # move the QC reports written by demux, if any, underneath the
+            # subdirectory for this project.
+            qc_stats_path = join(self.output_path, 'qc_stats', project_name)
+            if exists(qc_stats_path):
+                move(qc_stats_path, join(source_dir, 'qc_stats'))
+
         self.mark_post_processing_completed()
 
     def _confirm_job_completed(self):
@@ -429,10 +431,14 @@ class NuQCJob(Job):
                 input = tmp_file1
                 output = tmp_file2
 
+            # phase_start/phase_end are defined in nuqc_job.sh and record
+            # the time spent filtering against each database.
+            cmds.append("phase_start minimap2")
             cmds.append(f"minimap2 -2 -ax sr{t_switch} -t {cores_to_allocate} "
                         f"{mmi_db_path} {input} -a | samtools fastq -@ "
                         f"{cores_to_allocate} -f 12 -F 256{tags} > "
                         f"{output}")
+            cmds.append(f"phase_end minimap2 {basename(mmi_db_path)}")
 
         # rename the latest tmp file to the final output filename.
         cmds.append(f"mv {output} {final_output}")
@@ -456,6 +462,8 @@ class NuQCJob(Job):
 
         html_path = join(self.output_path, 'fastp_reports_dir', 'html')
         json_path = join(self.output_path, 'fastp_reports_dir', 'json')
+        qc_stats_path = (join(self.output_path, 'qc_stats') if
+                         self.collect_qc_stats else None)
 
         # get location of python executable in this environment.
         # demux script should be present in the same location.
@@ -499,6 +507,7 @@ class NuQCJob(Job):
                                     html_path=html_path,
                                     json_path=json_path,
                                     demux_path=demux_path,
+                                    qc_stats_path=qc_stats_path,
                                     temp_dir=self.temp_dir,
                                     splitter_binary=splitter_binary,
                                     modules_to_load=mtl,
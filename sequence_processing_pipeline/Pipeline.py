@@ -9,6 +9,7 @@ from metapool import (load_sample_sheet, AmpliconSampleSheet, is_blank,
                       CONTAINS_REPLICATES_KEY)
 from metapool.plate import ErrorMessage, WarningMessage
 from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.Metrics import Metrics
 from sequence_processing_pipeline.PipelineError import PipelineError
 import logging
 from re import findall, search, match
@@ -480,8 +481,12 @@ class Pipeline:
         :param callback(status=): a string message or description.
         :return:
         """
+        metrics = Metrics(join(self.output_path, 'metrics.jsonl'),
+                          source='Pipeline')
+
         for job in self.pipeline:
-            job.run(callback=callback)
+            with metrics.timer(job.job_name):
+                job.run(callback=callback)
 
     def add(self, job):
         """
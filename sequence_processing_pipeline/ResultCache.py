@@ -0,0 +1,151 @@
+from hashlib import md5, sha256
+from json import dumps, load
+from os import replace, stat
+from os.path import exists, isdir
+from sequence_processing_pipeline.FileManifest import FileManifest
+from threading import Lock
+
+
+class ResultCache:
+    # the number of bytes read at once when computing checksums.
+    checksum_block_size = 16 * 1024 * 1024
+
+    def __init__(self, path, checksums=False, ignore_suffixes=None):
+        """
+        Records the outputs of commands, keyed on their inputs.
+
+        A command's key is a hash of the tool version, the command itself and
+        the identity of each of its input files: path, size and either mtime
+        or a checksum of the contents. If a command's key is found and all of
+        the outputs recorded for it are unchanged, the command does not need
+        to be run again.
+        :param path: The path to a JSON file to store the cache in.
+        :param checksums: If True, identify input files by a checksum of
+                          their contents rather than by mtime. Checksums are
+                          cached, keyed on the file's path, size and mtime.
+        :param ignore_suffixes: (Optional) A list of suffixes. Files in input
+                                directories ending in any of them aren't
+                                part of a command's key, e.g. files the
+                                command finds but doesn't read.
+        """
+        self.path = path
+        self.checksums = checksums
+        self.ignore_suffixes = tuple(ignore_suffixes or [])
+        self.lock = Lock()
+
+        self.entries = {}
+        self.checksum_cache = {}
+
+        if exists(self.path):
+            with open(self.path, 'r') as f:
+                contents = load(f)
+            self.entries = contents.get('entries', {})
+            self.checksum_cache = contents.get('checksums', {})
+
+    def key(self, command, input_paths, tool_version):
+        """
+        Returns the key for a command.
+        :param command: The command to be run.
+        :param input_paths: A list of the files and directories it reads.
+        :param tool_version: The version of the tool being run.
+        :return: A hex digest.
+        """
+        identities = []
+        for some_path in input_paths:
+            identities += self._identify(some_path)
+
+        return sha256(dumps([tool_version, command, sorted(identities)]
+                            ).encode()).hexdigest()
+
+    def is_cached(self, key):
+        """
+        Returns True if the outputs recorded for key are unchanged.
+        :param key: A key returned by key().
+        :return: bool
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None:
+            return False
+
+        for some_path, identity in entry['outputs'].items():
+            if not exists(some_path):
+                return False
+            st = stat(some_path)
+            if [st.st_size, st.st_mtime_ns] != identity:
+                return False
+
+        return True
+
+    def add(self, key, command, output_paths):
+        """
+        Record the outputs of a command that completed successfully.
+        :param key: A key returned by key().
+        :param command: The command that was run.
+        :param output_paths: A list of the files it wrote.
+        :return: None
+        """
+        outputs = {}
+        for some_path in output_paths:
+            st = stat(some_path)
+            outputs[some_path] = [st.st_size, st.st_mtime_ns]
+
+        with self.lock:
+            self.entries[key] = {'command': command, 'outputs': outputs}
+
+    def save(self):
+        """
+        Write the cache to disk.
+        :return: None
+        """
+        with self.lock:
+            contents = dumps({'entries': self.entries,
+                              'checksums': self.checksum_cache}, indent=2)
+
+        # write atomically so that an interrupted save doesn't corrupt the
+        # cache.
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(contents)
+        replace(tmp_path, self.path)
+
+    def _identify(self, some_path):
+        if isdir(some_path):
+            entries = FileManifest.get(some_path).entries(some_path)
+            return [self._identity(x.path) for x in entries
+                    if x.size is not None and
+                    not (self.ignore_suffixes and
+                         x.path.endswith(self.ignore_suffixes))]
+
+        if exists(some_path):
+            return [self._identity(some_path)]
+
+        return [[some_path, None]]
+
+    def _identity(self, some_path):
+        st = stat(some_path)
+
+        if self.checksums:
+            # files are identified by their contents, hence touching a file
+            # doesn't invalidate the commands that read it.
+            return [some_path, st.st_size, self._checksum(some_path, st)]
+
+        return [some_path, st.st_size, st.st_mtime_ns]
+
+    def _checksum(self, some_path, st):
+        key = f'{some_path}:{st.st_size}:{st.st_mtime_ns}'
+
+        with self.lock:
+            if key in self.checksum_cache:
+                return self.checksum_cache[key]
+
+        h = md5()
+        with open(some_path, 'rb') as f:
+            for block in iter(lambda: f.read(self.checksum_block_size), b''):
+                h.update(block)
+
+        with self.lock:
+            self.checksum_cache[key] = h.hexdigest()
+
+        return self.checksum_cache[key]
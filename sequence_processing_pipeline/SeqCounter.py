@@ -0,0 +1,376 @@
+from concurrent.futures import ProcessPoolExecutor
+from os.path import getsize
+import gzip
+import numpy as np
+import zlib
+
+
+# the number of decompressed bytes counted at once.
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# quality scores are phred+33 encoded, from 0 to 93.
+PHRED_OFFSET = 33
+QUALITY_BINS = 94
+
+# bases at or above this quality are counted in 'q30_bases'.
+Q30 = 30
+
+# the number of places in a file that estimate_seqs() samples and the number
+# of compressed bytes read at each.
+ESTIMATE_SAMPLES = 8
+ESTIMATE_SAMPLE_SIZE = 1024 * 1024
+
+# the magic bytes and compression method that begin each gzip member.
+GZIP_MEMBER_HEADER = b'\x1f\x8b\x08'
+
+
+def count_seqs(file_path, block_size=BLOCK_SIZE):
+    """
+    Count the reads and bases in a fastq file, as 'seqtk size' does.
+    Records are expected to be four lines long, as they are in the fastq
+    files written by bcl-convert and the pipeline. Lines are counted over
+    blocks of decompressed data, rather than parsing each record.
+    :param file_path: The path to a fastq file, optionally gzipped.
+    :param block_size: The number of decompressed bytes counted at once.
+    :return: A tuple of the number of reads and the number of bases.
+    """
+    opener = gzip.open if file_path.endswith('.gz') else open
+
+    line_count = 0
+    base_count = 0
+    # the length of a line that began in a previous block.
+    carried = 0
+
+    with opener(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) ==
+                                      10)
+
+            if len(newlines) == 0:
+                carried += len(block)
+                continue
+
+            # the length of each line ending in this block, w/o the newline.
+            lengths = np.diff(newlines, prepend=-1) - 1
+            lengths[0] += carried
+
+            # sequences are the second line of each record.
+            first_sequence = (1 - line_count) % 4
+            base_count += int(lengths[first_sequence::4].sum())
+
+            line_count += len(newlines)
+            carried = len(block) - int(newlines[-1]) - 1
+
+    if carried:
+        # the last line isn't followed by a newline.
+        if line_count % 4 == 1:
+            base_count += carried
+        line_count += 1
+
+    if line_count % 4 != 0:
+        raise ValueError(f"'{file_path}' contains a truncated record")
+
+    return line_count // 4, base_count
+
+
+def _add_counts(a, b):
+    # add two histograms that may differ in length.
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[:len(b)] += b
+    return a
+
+
+def count_seqs_w_histograms(file_path, block_size=BLOCK_SIZE):
+    """
+    Count the reads and bases in a fastq file and histogram their lengths and
+    mean qualities, in a single pass.
+    :param file_path: The path to a fastq file, optionally gzipped.
+    :param block_size: The number of decompressed bytes counted at once.
+    :return: A tuple of the number of reads, the number of bases and a
+             dictionary of histograms: 'length' holds the number of reads of
+             each length, 'mean_quality' the number of reads whose mean
+             quality rounds down to each score and 'q30_bases' the number of
+             bases w/a quality of at least Q30.
+    """
+    opener = gzip.open if file_path.endswith('.gz') else open
+
+    length_counts = np.zeros(1, dtype=np.int64)
+    quality_counts = np.zeros(QUALITY_BINS, dtype=np.int64)
+    read_count = 0
+    base_count = 0
+    q30_bases = 0
+    # the bytes of a record that began in a previous block.
+    leftover = b''
+
+    with opener(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            data = leftover + block
+
+            if not block and data and not data.endswith(b'\n'):
+                # the last line isn't followed by a newline.
+                data += b'\n'
+
+            arr = np.frombuffer(data, dtype=np.uint8)
+            newlines = np.flatnonzero(arr == 10)
+            record_count = len(newlines) // 4
+
+            if not block and len(newlines) % 4 != 0:
+                raise ValueError(f"'{file_path}' contains a truncated record")
+
+            if record_count:
+                ends = newlines[:record_count * 4].reshape(-1, 4)
+                lengths = ends[:, 1] - ends[:, 0] - 1
+                quality_starts = ends[:, 2] + 1
+                quality_lengths = ends[:, 3] - quality_starts
+
+                # sum each quality line. reduceat() returns the element at
+                # an index for empty ranges, hence they're zeroed.
+                bounds = np.column_stack([quality_starts, ends[:, 3]]).ravel()
+                empty = quality_lengths == 0
+                sums = np.add.reduceat(arr, bounds, dtype=np.int64)[::2]
+                sums[empty] = 0
+                high = np.add.reduceat(arr >= PHRED_OFFSET + Q30, bounds,
+                                       dtype=np.int64)[::2]
+                high[empty] = 0
+
+                read_count += record_count
+                base_count += int(lengths.sum())
+                q30_bases += int(high.sum())
+                length_counts = _add_counts(length_counts,
+                                            np.bincount(lengths))
+
+                scored = ~empty
+                means = ((sums[scored] - PHRED_OFFSET *
+                          quality_lengths[scored]) //
+                         quality_lengths[scored])
+                quality_counts += np.bincount(
+                    np.clip(means, 0, QUALITY_BINS - 1),
+                    minlength=QUALITY_BINS)
+
+                leftover = data[int(ends[-1, 3]) + 1:]
+            else:
+                leftover = data
+
+            if not block:
+                break
+
+    return read_count, base_count, {'length': length_counts,
+                                    'mean_quality': quality_counts,
+                                    'q30_bases': q30_bases}
+
+
+def write_histograms(output_path, histograms):
+    """
+    Write the histograms returned by count_seqs_w_histograms() as a
+    compressed numpy archive.
+    :param output_path: The path to write to, ending in '.npz'.
+    :param histograms: The dictionary of histograms.
+    :return: None
+    """
+    np.savez_compressed(output_path, **histograms)
+
+
+def _decompress(data):
+    """
+    Decompress as much of a sample of gzip data as possible.
+    :param data: Compressed bytes, beginning at the start of a gzip member.
+    :return: A tuple of the decompressed bytes and the number of compressed
+             bytes they were decompressed from.
+    """
+    chunks = []
+    remaining = data
+
+    # a sample may span any number of members.
+    while remaining:
+        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        chunks.append(d.decompress(remaining))
+        if not d.eof:
+            # the sample ends within this member.
+            remaining = b''
+            break
+        remaining = d.unused_data
+        if not remaining.startswith(GZIP_MEMBER_HEADER):
+            # ignore trailing garbage or padding.
+            remaining = b''
+
+    return b''.join(chunks), len(data) - len(remaining)
+
+
+def _find_member(f, offset, sample_size):
+    """
+    Decompress a sample of data beginning at the first gzip member found at
+    or after offset.
+    :param f: A gzip file opened in binary mode.
+    :param offset: The offset to begin searching at.
+    :param sample_size: The number of compressed bytes to return.
+    :return: A tuple of the bytes decompressed and the number of compressed
+             bytes they were decompressed from, or None if no member is
+             found within sample_size bytes.
+    """
+    f.seek(offset)
+    window = f.read(sample_size * 2)
+    start = window.find(GZIP_MEMBER_HEADER)
+
+    while 0 <= start < sample_size:
+        try:
+            decompressed, compressed = _decompress(
+                window[start:start + sample_size])
+            if decompressed:
+                return decompressed, compressed
+        except zlib.error:
+            # the magic bytes occurred within compressed data.
+            pass
+        start = window.find(GZIP_MEMBER_HEADER, start + 1)
+
+    return None
+
+
+def _sample_records(data):
+    """
+    Measure the complete records in a sample of fastq data.
+    :param data: Decompressed bytes, which may begin and end mid-record.
+    :return: A tuple of the number of records found, the number of bytes
+             they span and the number of bases they contain.
+    """
+    lines = data.split(b'\n')
+    # the last line may be incomplete.
+    lines = lines[:-1]
+
+    # find the first line that begins a record. Quality lines may begin
+    # w/'@' or '+' too, hence the record's lines must also be consistent.
+    for start in range(min(len(lines), 8)):
+        record = lines[start:start + 4]
+        if (len(record) == 4 and record[0].startswith(b'@') and
+                record[2].startswith(b'+') and
+                len(record[1]) == len(record[3])):
+            break
+    else:
+        return 0, 0, 0
+
+    record_count = (len(lines) - start) // 4
+    records = lines[start:start + record_count * 4]
+    size = sum([len(x) for x in records]) + len(records)
+    bases = sum([len(x) for x in records[1::4]])
+
+    return record_count, size, bases
+
+
+def estimate_seqs(file_path, samples=ESTIMATE_SAMPLES,
+                  sample_size=ESTIMATE_SAMPLE_SIZE):
+    """
+    Estimate the reads and bases in a fastq file from a few samples of it.
+    The size of a record is measured in samples taken at evenly spaced
+    offsets and extrapolated to the file's uncompressed size. Samples can
+    only be taken from the middle of gzipped files that consist of many
+    members, such as those written by bgzip or concatenated w/cat. For
+    others, the head of the file is sampled and the uncompressed size is
+    taken from the file's trailer.
+    :param file_path: The path to a fastq file, optionally gzipped.
+    :param samples: The number of places in the file to sample.
+    :param sample_size: The number of (compressed) bytes to read at each.
+    :return: A tuple of the estimated number of reads and bases.
+    """
+    file_size = getsize(file_path)
+    if file_size == 0:
+        return 0, 0
+
+    offsets = [file_size * i // samples for i in range(samples)]
+    offsets = sorted(set(offsets))
+
+    record_count = 0
+    record_bytes = 0
+    base_count = 0
+    compressed = 0
+    decompressed = 0
+
+    with open(file_path, 'rb') as f:
+        if not file_path.endswith('.gz'):
+            for offset in offsets:
+                f.seek(offset)
+                counts = _sample_records(f.read(sample_size))
+                record_count += counts[0]
+                record_bytes += counts[1]
+                base_count += counts[2]
+
+            if record_count == 0:
+                # the file is smaller than a sample or malformed; count it.
+                return count_seqs(file_path)
+
+            reads = file_size * record_count / record_bytes
+            return (int(round(reads)),
+                    int(round(reads * base_count / record_count)))
+
+        members = 0
+        for offset in offsets:
+            sample = _find_member(f, offset, sample_size)
+            if sample is None:
+                continue
+
+            members += 1
+            counts = _sample_records(sample[0])
+            record_count += counts[0]
+            record_bytes += counts[1]
+            base_count += counts[2]
+            decompressed += len(sample[0])
+            compressed += sample[1]
+
+        f.seek(-4, 2)
+        # the uncompressed size of the last member, modulo 2^32.
+        trailer_size = int.from_bytes(f.read(4), 'little')
+
+    if record_count == 0 or file_size <= sample_size:
+        # the file is small enough that counting is as fast.
+        return count_seqs(file_path)
+
+    # extrapolate the uncompressed size from the compression ratio.
+    uncompressed_size = file_size * decompressed / compressed
+
+    if members == 1:
+        # likely a single member file, hence the trailer holds the exact
+        # size, modulo 2^32. Use the size closest to the extrapolated one,
+        # unless they disagree, as they will if the file has a few large
+        # members.
+        wraps = round((uncompressed_size - trailer_size) / 2 ** 32)
+        trailer_size += max(wraps, 0) * 2 ** 32
+        if abs(trailer_size - uncompressed_size) < 0.1 * uncompressed_size:
+            uncompressed_size = trailer_size
+
+    reads = uncompressed_size * record_count / record_bytes
+    return int(round(reads)), int(round(reads * base_count / record_count))
+
+
+def count_seqs_parallel(file_paths, processes=1, histograms=False,
+                        estimate=False):
+    """
+    Count the reads and bases in many fastq files using a pool of processes.
+    :param file_paths: A list of paths to fastq files.
+    :param processes: The number of files to count at once.
+    :param histograms: If True, also histogram the lengths and mean qualities
+                       of each file's reads.
+    :param estimate: If True, estimate the reads and bases w/estimate_seqs()
+                     rather than counting them.
+    :return: A list of (reads, bases) tuples, or (reads, bases, histograms)
+             tuples if histograms is True, in the same order as file_paths.
+    """
+    if estimate:
+        func = estimate_seqs
+    elif histograms:
+        func = count_seqs_w_histograms
+    else:
+        func = count_seqs
+
+    if processes <= 1:
+        return [func(x) for x in file_paths]
+
+    # start the largest files first, so that the pool doesn't end waiting
+    # on a single large file.
+    order = sorted(range(len(file_paths)),
+                   key=lambda i: -getsize(file_paths[i]))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {i: executor.submit(func, file_paths[i])
+                   for i in order}
+        return [futures[i].result() for i in range(len(file_paths))]
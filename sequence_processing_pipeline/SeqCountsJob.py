@@ -1,14 +1,21 @@
 from collections import defaultdict
+from .CountCache import CountCache
 from .Job import Job, KISSLoader
-from .PipelineError import JobFailedError
+from .PipelineError import PipelineError
+from .aggregate_counts import (RESULTS_FILE_NAME, append_count_records,
+                               load_count_records)
 from glob import glob
 from jinja2 import Environment
 from metapool import load_sample_sheet
-from os import walk
-from os.path import join, split
+import numpy as np
+from os.path import exists, getmtime, join, split
 import logging
 import pandas as pd
-from sequence_processing_pipeline.util import determine_orientation
+from sequence_processing_pipeline.SeqCounter import (count_seqs_parallel,
+                                                     write_histograms)
+from sys import executable
+from sequence_processing_pipeline.util import (determine_orientation,
+                                               PrefixIndex)
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -18,7 +25,9 @@ class SeqCountsJob(Job):
     def __init__(self, run_dir, output_path, queue_name,
                  node_count, wall_time_limit, jmem, modules_to_load,
                  qiita_job_id, max_array_length, files_to_count_path,
-                 sample_sheet_path, cores_per_task=4):
+                 sample_sheet_path, cores_per_task=4, in_process_bytes=0,
+                 processes=1, count_cache_path=None, histograms=False,
+                 estimate=False):
         """
         ConvertJob provides a convenient way to run bcl-convert or bcl2fastq
         on a directory BCL files to generate Fastq files.
@@ -34,6 +43,21 @@ class SeqCountsJob(Job):
         :param files_to_count_path: A path to a list of file-paths to count.
         :param sample_sheet_path: A path to the sample-sheet.
         :param cores_per_task: (Optional) # of CPU cores per node to request.
+        :param in_process_bytes: (Optional) If the files to count total at
+                                 most this many bytes, they are counted
+                                 in-process rather than w/a Slurm array.
+        :param processes: (Optional) # of processes to count files w/when
+                          counting in-process.
+        :param count_cache_path: (Optional) A path to a CountCache database.
+                                 Files w/counts in the cache aren't counted
+                                 again.
+        :param histograms: (Optional) If True, also write read length and
+                           mean quality histograms for each file and add
+                           mean_length and fraction_q30 to SeqCounts.csv.
+        :param estimate: (Optional) If True, estimate the counts of files
+                         from samples of them, in-process. Estimates are
+                         flagged in SeqCounts.csv's approximate column and
+                         are never added to the count cache.
         """
         super().__init__(run_dir,
                          output_path,
@@ -55,32 +79,120 @@ class SeqCountsJob(Job):
         self.job_name = (f"seq_counts_{self.qiita_job_id}")
         self.files_to_count_path = files_to_count_path
         self.sample_sheet_path = sample_sheet_path
+        self.in_process_bytes = in_process_bytes
+        self.processes = processes
+        self.estimate = estimate
+        # each file's counts are appended to a single results file, rather
+        # than recovered from the log of each array task.
+        self.results_path = join(self.output_path, RESULTS_FILE_NAME)
+        if self.estimate:
+            # keep estimates apart from exact counts.
+            self.results_path = join(self.output_path,
+                                     'seq_counts.approximate.jsonl')
+        # the names of the files whose counts were estimated.
+        self.estimated_files = set()
+
+        # histograms are written to <histograms_path>/<file name>.npz.
+        self.histograms_path = None
+        if histograms:
+            self.histograms_path = join(self.output_path, 'histograms')
+            self._directory_check(self.histograms_path, create=True)
 
         with open(self.files_to_count_path, 'r') as f:
             lines = f.readlines()
             lines = [x.strip() for x in lines]
             lines = [x for x in lines if x != '']
-            self.file_count = len(lines)
+            self.files_to_count = lines
+
+        self.count_cache = None
+        # the files that need to be counted.
+        self.files_to_submit = self.files_to_count
+
+        if count_cache_path:
+            self.count_cache = CountCache(count_cache_path)
+            cached = self.count_cache.get_many(self.files_to_count)
+            self.files_to_submit = [x for x in self.files_to_count
+                                    if x not in cached]
+            logging.debug(f'{len(cached)} of {len(self.files_to_count)} '
+                          'files have cached counts')
+
+        self.file_count = len(self.files_to_submit)
+
+    def complete_locally(self, callback=None):
+        if not self.files_to_submit:
+            # every file has a cached count; there is nothing to submit.
+            logging.debug('SeqCountsJob has no files to count.')
+            return {'job_id': None, 'job_state': 'COMPLETED'}
+
+        if not self._count_in_process():
+            return None
+
+        # scheduling an array element per file costs far more than counting
+        # small files, hence count them here w/a pool of processes.
+        with self.metrics.timer('in_process_counting'):
+            self._count_files()
+
+        return {'job_id': None, 'job_state': 'COMPLETED'}
+
+    def _count_in_process(self):
+        if self.estimate:
+            # estimates only read a few samples of each file.
+            return True
+
+        return (self.in_process_bytes > 0 and
+                self._total_size(self.files_to_submit) <=
+                self.in_process_bytes)
+
+    def _count_files(self):
+        """
+        Count the reads and bases in each file to submit in-process.
+        Results are appended to the results file, as the Slurm array's tasks
+        do.
+        :return: None
+        """
+        counts = count_seqs_parallel(
+            self.files_to_submit, processes=self.processes,
+            histograms=self.histograms_path is not None,
+            estimate=self.estimate)
+
+        if self.histograms_path is not None and not self.estimate:
+            for file_path, (_, _, histograms) in zip(self.files_to_submit,
+                                                     counts):
+                write_histograms(self._histogram_path(file_path), histograms)
+
+        append_count_records(self.results_path,
+                             [(file_path, x[0], x[1]) for file_path, x in
+                              zip(self.files_to_submit, counts)])
+
+    def _histogram_path(self, file_path):
+        return join(self.histograms_path, f'{split(file_path)[1]}.npz')
+
+    def submit(self, callback=None):
+        if self.file_count == 0:
+            # sbatch rejects an empty array. complete_locally() finishes
+            # these jobs w/out submitting them.
+            raise PipelineError("SeqCountsJob has no files to submit.")
+
+        if self.estimate:
+            # array tasks count exactly, yet their counts would be labeled
+            # approximate. complete_locally() makes the estimates instead.
+            raise PipelineError("SeqCountsJob estimates counts in-process "
+                                "and can't be submitted.")
 
-    def run(self, callback=None):
         job_script_path = self._generate_job_script()
         params = ['--parsable',
                   f'-J {self.job_name}',
                   f'--array 1-{self.file_count}']
-        try:
-            self.job_info = self.submit_job(job_script_path,
-                                            job_parameters=' '.join(params),
-                                            exec_from=None,
-                                            callback=callback)
-
-            logging.debug(f'SeqCountsJob Job Info: {self.job_info}')
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            info = self.parse_logs()
-            # prepend just the message component of the Error.
-            info.insert(0, str(e))
-            raise JobFailedError('\n'.join(info))
+        return self.submit_job(job_script_path,
+                               job_parameters=' '.join(params),
+                               exec_from=None,
+                               wait=False,
+                               callback=callback)
+
+    def finalize(self, job_info):
+        self.job_info = job_info
+
+        logging.debug(f'SeqCountsJob Job Info: {self.job_info}')
 
         self.mark_job_completed()
 
@@ -94,7 +206,14 @@ class SeqCountsJob(Job):
         job_script_path = join(self.output_path, "seq_counts.sbatch")
         template = self.jinja_env.get_template("seq_counts.sbatch")
 
-        #  got to make files_to_count.txt and put it in the output directory
+        files_to_count_path = self.files_to_count_path
+
+        if self.files_to_submit != self.files_to_count:
+            # only the files w/o cached counts are counted.
+            files_to_count_path = join(self.output_path,
+                                       'files_to_count.txt')
+            with open(files_to_count_path, 'w') as f:
+                f.write('\n'.join(self.files_to_submit) + '\n')
 
         with open(job_script_path, mode="w", encoding="utf-8") as f:
             f.write(template.render({
@@ -105,7 +224,10 @@ class SeqCountsJob(Job):
                 "cores_per_task": self.cores_per_task,
                 "queue_name": self.queue_name,
                 "file_count": self.file_count,
-                "files_to_count_path": self.files_to_count_path,
+                "files_to_count_path": files_to_count_path,
+                "results_path": self.results_path,
+                "histograms_path": self.histograms_path,
+                "python_path": executable,
                 "output_path": self.output_path
             }))
 
@@ -124,7 +246,8 @@ class SeqCountsJob(Job):
         return [msg.strip() for msg in msgs]
 
     def _aggregate_counts_by_file(self):
-        # aggregates sequence & bp counts from a directory of log files.
+        # aggregates sequence & bp counts from the results file, or from a
+        # directory of log files if the array tasks predate the results file.
 
         def extract_metadata(log_output_file_path):
             """
@@ -140,19 +263,44 @@ class SeqCountsJob(Job):
                 seq_counts, base_pairs = lines[1].split('\t')
                 return _dir, _file, int(seq_counts), int(base_pairs)
 
-        results = defaultdict(dict)
-
-        for root, dirs, files in walk(self.log_path):
-            for _file in files:
-                if _file.endswith('.out'):
-                    log_output_file = join(root, _file)
+        counted = {}
+
+        if exists(self.results_path):
+            # records are appended as files are counted, hence the counts
+            # from the latest attempt to count a file are kept.
+            counted = load_count_records(self.results_path)
+        else:
+            # process logs from oldest to newest, so that the counts from
+            # the latest attempt to count a file are kept.
+            for log_output_file in sorted(self._find_files(self.log_path),
+                                          key=getmtime):
+                if log_output_file.endswith('.out'):
                     _dir, _file, seq_counts, base_pairs = \
                         extract_metadata(log_output_file)
+                    counted[join(_dir, _file)] = (seq_counts, base_pairs)
+
+        if self.estimate:
+            self.estimated_files = set([split(x)[1] for x in counted])
+
+        if self.count_cache is not None:
+            # record the counts of the files counted by this job. Counts for
+            # other files are left over from previous attempts and may be
+            # stale.
+            submitted = set(self.files_to_submit)
+            counted = {k: v for k, v in counted.items() if k in submitted}
 
-                    results[_file] = {
-                        'seq_counts': seq_counts,
-                        'base_pairs': base_pairs
-                    }
+            if not self.estimate:
+                self.count_cache.put_many(counted)
+
+            # exact counts from the cache take precedence over estimates.
+            cached = self.count_cache.get_many(self.files_to_count)
+            counted.update(cached)
+            self.estimated_files -= set([split(x)[1] for x in cached])
+
+        results = defaultdict(dict)
+        for file_path, (seq_counts, base_pairs) in counted.items():
+            results[split(file_path)[1]] = {'seq_counts': seq_counts,
+                                            'base_pairs': base_pairs}
 
         return results
 
@@ -192,40 +340,38 @@ class SeqCountsJob(Job):
         # aggregate results by filename
         by_files = self._aggregate_counts_by_file()
 
-        # the per-sample-fastqs will be named according to sample-id. Generate
-        # a list of the sample-ids defined in the sample-sheet and sort them
-        # from longest to shortest. This allows us to match sample-ids to
-        # files correctly even when some sample-ids are subsets of longer
-        # sample-ids e.g.: 'T_LS_7_15_15B_SRE' and 'T_LS_7_15_15B'. This is
-        # important as SeqCounts is intended to count directories of fastq
-        # files that don't necessarily obey the standard Illumina naming
-        # convention e.g: samplename_S1_L001_R1_001.fastq.gz.
-        sample_ids = list(samples.keys())
-        sample_ids.sort(reverse=True, key=len)
+        # the per-sample-fastqs will be named according to sample-id. Match
+        # each file to the longest sample-id it begins with. This allows us
+        # to match sample-ids to files correctly even when some sample-ids
+        # are subsets of longer sample-ids e.g.: 'T_LS_7_15_15B_SRE' and
+        # 'T_LS_7_15_15B'. This is important as SeqCounts is intended to
+        # count directories of fastq files that don't necessarily obey the
+        # standard Illumina naming convention e.g:
+        # samplename_S1_L001_R1_001.fastq.gz.
+        index = PrefixIndex(samples.keys())
 
         results = defaultdict(list)
 
-        # generate a list of file names to associate with sample-ids.
         # only count forward and reverse reads. don't count I? or any other
         # type of file present.
-        file_names = [x for x in list(by_files.keys()) if
-                      determine_orientation(x) in ['R1', 'R2']]
-
-        for sample_id in sample_ids:
-            found = [x for x in file_names if x.startswith(sample_id)]
-
-            if len(found) == 0:
-                # zero file matches for a sample_id means that a per-sample
-                # fastq file was not generated at the stage referenced by the
-                # paths in self.files_to_count_path. For example, a per-sample
-                # fastq file may not have been generated by bcl-convert for a
-                # particular sample, or the filtered sample may be of zero-
-                # length. These things are normal operation and any error is
-                # going to be logged by those Job() objects. It's okay that
-                # a match wasn't found for a given sample_id defined in the
-                # sample-sheet.
+        for file_name in by_files:
+            if determine_orientation(file_name) not in ['R1', 'R2']:
                 continue
 
+            sample_id = index.longest_match(file_name)
+
+            # files that don't match a sample_id are ignored. Likewise, zero
+            # file matches for a sample_id means that a per-sample fastq file
+            # was not generated at the stage referenced by the paths in
+            # self.files_to_count_path. For example, a per-sample fastq file
+            # may not have been generated by bcl-convert for a particular
+            # sample, or the filtered sample may be of zero-length. These
+            # things are normal operation and any error is going to be logged
+            # by those Job() objects.
+            if sample_id is not None:
+                results[sample_id].append(file_name)
+
+        for sample_id, found in results.items():
             if len(found) != 2:
                 # Raise an error if more or less than two matches are found
                 # for a given sample-id because this our output must be the
@@ -233,32 +379,56 @@ class SeqCountsJob(Job):
                 raise ValueError("Multiple file matches for sample-id "
                                  f"'{sample_id}' found: {found}")
 
-            # remove the found elements from the list of files so they're
-            # not associated with additional sample-ids in a subsequent
-            # loop iteration.
-            file_names = list(set(file_names) - set(found))
-
-            results[sample_id] = found
-
         # output the results in CSV format.
         sample_ids = []
         raw_reads_r1r2 = []
         lanes = []
+        mean_lengths = []
+        fractions_q30 = []
+        approximate = []
 
         for sample_id in results:
             sample_ids.append(sample_id)
             found = results[sample_id]
             seq_counts = 0
+            base_pairs = 0
+            q30_bases = 0
 
             for _file in found:
                 seq_counts += by_files[_file]['seq_counts']
+                base_pairs += by_files[_file]['base_pairs']
+
+                if self.histograms_path is not None:
+                    histogram_path = self._histogram_path(_file)
+                    if exists(histogram_path):
+                        with np.load(histogram_path) as histograms:
+                            q30_bases += int(histograms['q30_bases'])
+                    else:
+                        # histograms are unavailable for files counted w/o
+                        # them, e.g. in a previous attempt.
+                        q30_bases = np.nan
 
             raw_reads_r1r2.append(seq_counts)
             lanes.append(lane)
+            mean_lengths.append(base_pairs / seq_counts if seq_counts
+                                else np.nan)
+            fractions_q30.append(q30_bases / base_pairs if base_pairs
+                                 else np.nan)
+            approximate.append(any([x in self.estimated_files
+                                    for x in found]))
+
+        data = {'Sample_ID': sample_ids,
+                'raw_reads_r1r2': raw_reads_r1r2,
+                'Lane': lanes}
+
+        if self.histograms_path is not None:
+            data['mean_length'] = mean_lengths
+            data['fraction_q30'] = fractions_q30
+
+        if self.estimate:
+            data['approximate'] = approximate
 
-        df = pd.DataFrame(data={'Sample_ID': sample_ids,
-                                'raw_reads_r1r2': raw_reads_r1r2,
-                                'Lane': lanes})
+        df = pd.DataFrame(data=data)
 
         df.set_index(['Sample_ID', 'Lane'], verify_integrity=True)
 
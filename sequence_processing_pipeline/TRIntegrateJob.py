@@ -1,12 +1,11 @@
-from os.path import join
+from os.path import join, basename
 from .Job import Job, KISSLoader
-from .PipelineError import JobFailedError
 import logging
 from jinja2 import Environment
 from .Pipeline import Pipeline
 from .PipelineError import PipelineError
 from metapool import load_sample_sheet
-from os import makedirs, walk
+from os import makedirs
 from shutil import copyfile
 from collections import defaultdict
 import re
@@ -79,7 +78,7 @@ class TRIntegrateJob(Job):
             lines = [x for x in lines if x != '']
             self.barcode_id_count = len(lines)
 
-    def run(self, callback=None):
+    def submit(self, callback=None):
         job_script_path = self._generate_job_script()
 
         # copy sil_path to TRIntegrate working directory and rename to a
@@ -92,20 +91,16 @@ class TRIntegrateJob(Job):
         params = ['--parsable',
                   f'-J {self.job_name}',
                   f'--array 1-{self.sample_count}']
-        try:
-            self.job_info = self.submit_job(job_script_path,
-                                            job_parameters=' '.join(params),
-                                            exec_from=None,
-                                            callback=callback)
-
-            logging.debug(f'TRIntegrateJob Job Info: {self.job_info}')
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            info = self.parse_logs()
-            # prepend just the message component of the Error.
-            info.insert(0, str(e))
-            raise JobFailedError('\n'.join(info))
+        return self.submit_job(job_script_path,
+                               job_parameters=' '.join(params),
+                               exec_from=None,
+                               wait=False,
+                               callback=callback)
+
+    def finalize(self, job_info):
+        self.job_info = job_info
+
+        logging.debug(f'TRIntegrateJob Job Info: {self.job_info}')
 
         self.mark_job_completed()
 
@@ -168,12 +163,13 @@ class TRIntegrateJob(Job):
                     return s_id
 
         integrated = defaultdict(list)
-        for root, dirs, files in walk(join(self.output_path, 'integrated')):
-            for _file in files:
-                m = re.match(r"(C5\d\d)\.([R,I]\d)\.fastq.gz", _file)
-                if m:
-                    barcode_id, read = m.groups(1)
-                    integrated[barcode_id].append(read)
+        for file_path in self._find_files(join(self.output_path,
+                                               'integrated')):
+            m = re.match(r"(C5\d\d)\.([R,I]\d)\.fastq.gz",
+                         basename(file_path))
+            if m:
+                barcode_id, read = m.groups(1)
+                integrated[barcode_id].append(read)
 
         # a sample was processed successfully if all three expected reads are
         # present.
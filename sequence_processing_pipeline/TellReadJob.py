@@ -1,12 +1,10 @@
-from os.path import join
+from os.path import join, basename
 from .Job import Job, KISSLoader
-from .PipelineError import JobFailedError
 import logging
 from jinja2 import Environment
 from .Pipeline import Pipeline
 from .PipelineError import PipelineError
 from metapool import load_sample_sheet
-from os import walk
 import re
 from collections import defaultdict
 
@@ -71,34 +69,34 @@ class TellReadJob(Job):
 
         self.job_name = (f"{self.qiita_job_id}-tellread")
 
-    def run(self, callback=None):
+    def submit(self, callback=None):
         job_script_path = self._generate_job_script()
 
         # everything is in the job script so there are no additional params.
         params = []
 
-        try:
-            self.job_info = self.submit_job(job_script_path,
-                                            job_parameters=' '.join(params),
-                                            exec_from=None,
-                                            callback=callback)
-
-            logging.debug(f'TellReadJob Job Info: {self.job_info}')
-        except JobFailedError as e:
-            # When a job has failed, parse the logs generated by this specific
-            # job to return a more descriptive message to the user.
-            # TODO: We need more examples of failed jobs before we can create
-            #  a parser for the logs.
-            # info = self.parse_logs()
-            # prepend just the message component of the Error.
-            # info.insert(0, str(e))
-            info = str(e)
-            raise JobFailedError('\n'.join(info))
+        return self.submit_job(job_script_path,
+                               job_parameters=' '.join(params),
+                               exec_from=None,
+                               wait=False,
+                               callback=callback)
+
+    def finalize(self, job_info):
+        self.job_info = job_info
+
+        logging.debug(f'TellReadJob Job Info: {self.job_info}')
 
         self.mark_job_completed()
 
         logging.debug(f'TellReadJob {self.job_info["job_id"]} completed')
 
+    def parse_logs(self):
+        # When a job has failed, Job.run() parses the logs generated by this
+        # specific job to return a more descriptive message to the user.
+        # TODO: We need more examples of failed jobs before we can create
+        #  a parser for the logs.
+        return []
+
     def _process_sample_sheet(self):
         sheet = load_sample_sheet(self.sample_sheet_path)
 
@@ -188,13 +186,12 @@ class TellReadJob(Job):
                     return s_id
 
         corrected = defaultdict(list)
-        for root, dirs, files in walk(join(self.output_path, 'Full')):
-            for _file in files:
-                m = re.match(r"TellReadJob_(.\d)_(C\d\d\d).fastq.gz.corrected."
-                             r"err_barcode_removed.fastq", _file)
-                if m:
-                    read, barcode_id = m.groups(1)
-                    corrected[barcode_id].append(read)
+        for file_path in self._find_files(join(self.output_path, 'Full')):
+            m = re.match(r"TellReadJob_(.\d)_(C\d\d\d).fastq.gz.corrected."
+                         r"err_barcode_removed.fastq", basename(file_path))
+            if m:
+                read, barcode_id = m.groups(1)
+                corrected[barcode_id].append(read)
 
         # a sample was processed successfully if all three expected reads are
         # present.
@@ -1,7 +1,12 @@
+from fcntl import flock, LOCK_EX
 from os import walk
 from sys import argv
 from os.path import join, split
-from json import dumps
+from json import dumps, loads
+
+
+# the name of the file SeqCountsJob's array tasks append their counts to.
+RESULTS_FILE_NAME = 'seq_counts.jsonl'
 
 
 def extract_metadata(log_output_file_path):
@@ -15,21 +20,86 @@ def extract_metadata(log_output_file_path):
         return _dir, _file, int(seq_counts), int(base_pairs)
 
 
+def load_count_records(results_file_path):
+    """
+    Load the counts appended to a results file by SeqCountsJob.
+    :param results_file_path: The path to a JSON-lines file of records w/
+                              'file', 'seq_counts' and 'base_pairs' keys.
+    :return: A dictionary of (sequence, base-pair) count tuples keyed on file
+             path. Files counted more than once keep their last record.
+    """
+    results = {}
+
+    with open(results_file_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                record = loads(line)
+            except ValueError:
+                # a task that was killed while appending may leave a partial
+                # record behind.
+                continue
+
+            results[record['file']] = (int(record['seq_counts']),
+                                       int(record['base_pairs']))
+
+    return results
+
+
+def append_count_records(results_file_path, counts):
+    """
+    Append counts to a results file shared by concurrent tasks.
+    Appends are serialized w/the same lock file seq_counts.sbatch uses.
+    :param results_file_path: The path to a JSON-lines results file.
+    :param counts: A list of (file path, sequence count, base-pair count)
+                   tuples.
+    :return: None
+    """
+    lines = [dumps({'file': file_path, 'seq_counts': seq_counts,
+                    'base_pairs': base_pairs}) + '\n'
+             for file_path, seq_counts, base_pairs in counts]
+
+    with open(results_file_path + '.lock', 'a') as lock:
+        flock(lock, LOCK_EX)
+        with open(results_file_path, 'a') as f:
+            f.write(''.join(lines))
+
+
 def aggregate_counts(fp):
     results = {}
 
+    def add(_dir, _file, seq_counts, base_pairs):
+        if _dir not in results:
+            results[_dir] = {}
+
+        results[_dir][_file] = {'seq_counts': seq_counts,
+                                'base_pairs': base_pairs}
+
+    results_files = []
+    log_files = []
+
     for root, dirs, files in walk(fp):
         for _file in files:
-            if _file.endswith('.out'):
-                log_output_file = join(root, _file)
-                _dir, _file, seq_counts, base_pairs = \
-                    extract_metadata(log_output_file)
-
-                if _dir not in results:
-                    results[_dir] = {}
+            if _file == RESULTS_FILE_NAME:
+                results_files.append(join(root, _file))
+            elif _file.endswith('.out'):
+                log_files.append(join(root, _file))
 
-                results[_dir][_file] = {'seq_counts': seq_counts,
-                                        'base_pairs': base_pairs}
+    if results_files:
+        # the counts for all files are loaded at once, rather than parsing
+        # one log file for each file counted.
+        for results_file in results_files:
+            counts = load_count_records(results_file)
+            for file_path, (seq_counts, base_pairs) in counts.items():
+                add(*split(file_path), seq_counts, base_pairs)
+    else:
+        # fall back to the stdout logs of array tasks that predate the
+        # results file.
+        for log_output_file in log_files:
+            add(*extract_metadata(log_output_file))
 
     return results
 
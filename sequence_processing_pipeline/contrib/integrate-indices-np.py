@@ -34,10 +34,26 @@
 #
 # There probably are smarter ways to do this to reduce the memory burden.
 # Right now, it's O(N) where N is the number of records. We load R1 and R2
-# separately though so we at least halve the memory use. As for doing it
-# faster, at the moment we appear to saturate time on gzip. Easiest solution
-# would be to increase the number of threads, but then again, this process
-# is expected to run in an array, and filesystem can only take so much.
+# separately though so we at least halve the memory use. When that is still
+# too much, --max-memory switches to an external sort: I1 and R1 (then R2)
+# are read in lockstep, in chunks of bounded size. Each chunk is sorted by
+# barcode and written to a temporary file, and the sorted runs are then
+# merged into the output. Sorts are stable and the merge favors earlier runs
+# on ties, so the output is identical to that of the in-memory sort.
+#
+# One sorted file per sample limits how parallel downstream assembly can be,
+# so --shards spreads the sorted records over N files. Each barcode is
+# assigned to a shard by hashing it, so all of a barcode's records land in the
+# same shard, each shard remains sorted, and the shard of any barcode can be
+# computed without the data. --index writes a table of where each barcode's
+# records start in each shard, for random access by barcode. For that, the
+# sorted outputs are written as BGZF (see BGZFWriter), and the table holds
+# virtual offsets into the compressed shards.
+#
+# As for doing it faster, at the moment we appear to saturate time on gzip.
+# Easiest solution would be to increase the number of threads, but then
+# again, this process is expected to run in an array, and filesystem can only
+# take so much.
 #
 # In addition to the inline tests, md5 checks to verify all record IDs are
 # present in both R1 / R2, and relative to original input. Spot checks on
@@ -52,61 +68,125 @@ import re
 import io
 import pgzip
 import gzip
+import heapq
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, zip_longest
+from operator import itemgetter
+from os.path import join
+
+
+# the number of records read from each input at once w/--no-sort.
+NO_SORT_BATCH = 100000
+
+# the most runs merged at once w/--max-memory. Each is an open file and a
+# read buffer, so more runs than this are merged over several passes.
+MERGE_FAN_IN = 64
+
+# the memory each record read into a run costs beyond its own bytes and its
+# barcode's: the bytes objects of both, their list entries and the argsort
+# index made when the run is sorted.
+RECORD_OVERHEAD = 2 * sys.getsizeof(b'') + 2 * 8 + 8
 
 
 RECORD = re.compile(rb'@\S+\n[ATGCN]+\n\+\n\S+\n')
 BARCODE = re.compile(rb'@\S+\n([ATGCN]+)\n\+\n\S+\n')
 
 
-def gather_order(i1_in_fp):
+def record_offsets(data):
+    """Get the offsets of the lines of each record
+
+    We completely assume non-multiline fastq here. Rather than searching for
+    each record, we find every newline at once and group them by four.
+
+    We return an array w/a row per record, holding the offset of the first
+    byte of the record and the offsets of each of its four newlines
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(raw == ord('\n'))
+    assert newlines.size % 4 == 0
+
+    offsets = np.empty([newlines.size // 4, 5], dtype=np.int64)
+    offsets[:, 1:] = newlines.reshape(-1, 4)
+    offsets[:1, 0] = 0
+    offsets[1:, 0] = offsets[:-1, 4] + 1
+
+    # get angry if the records are weird. every record starts w/an '@' and
+    # the third line w/a '+'
+    assert (raw[offsets[:, 0]] == ord('@')).all()
+    assert (raw[offsets[:, 2] + 1] == ord('+')).all()
+
+    return offsets
+
+
+def gather_order(i1_in_fp, i1_out=None):
     """Determine record order
 
     This is a fancy way of saying: get all the barcodes, and sort them.
 
     We return the order of the sorted records, the unique barcodes,
-    and the bounds for what barcode associated with what record
+    and the bounds for what barcode associated with what record. If i1_out
+    is provided, I1 is copied to it unmodified as it's read
     """
-    # determine barcode length
-    _ = i1_in_fp.readline()
-    b = i1_in_fp.readline()
-    rec_len = len(b.strip())
-    i1_in_fp.seek(0)
-
     # we need larger data in memory later anyway...
     i1 = i1_in_fp.read()
-    start = 0
-    end = len(i1)
-
-    # get the number of records. we completely assume non-multiline fastq here
-    newlines = i1.count(b'\n')
-    assert newlines % 4 == 0
-    barcodes = np.empty(newlines // 4, dtype='|S%d' % rec_len)
-
-    # walk all index records
-    # grab each barcode
-    idx = 0
-    while start < end:
-        barcode_result = BARCODE.search(i1, pos=start)
-        barcode = barcode_result.groups()[0]
-        assert len(barcode) == rec_len  # get angry if the barcode is weird
-
-        barcodes[idx] = barcode
-        idx += 1
-        start = barcode_result.end()
+    if i1_out is not None:
+        i1_out.write(i1)
+    offsets = record_offsets(i1)
+
+    # grab each barcode, the second line of each record
+    barcode_starts = offsets[:, 1] + 1
+    barcode_lengths = offsets[:, 2] - barcode_starts
+    rec_len = int(barcode_lengths[0]) if barcode_lengths.size else 0
+    # get angry if the barcode is weird
+    assert (barcode_lengths == rec_len).all()
+
+    # gather a column of bases at a time, rather than w/a 2D index, as the
+    # index would be far larger than the barcodes themselves
+    raw = np.frombuffer(i1, dtype=np.uint8)
+    barcodes = np.empty([barcode_starts.size, rec_len], dtype=np.uint8)
+    for column in range(rec_len):
+        barcodes[:, column] = raw[barcode_starts + column]
+    barcodes = barcodes.view('|S%d' % rec_len).ravel()
 
     # we no longer need the raw data so let's toss it
-    del i1
+    del raw, i1, offsets
 
     # determine the record order of a lexicographic sort
     # gather the unique barcodes so we can use them later, and the bounding
-    # points in the sorted set
-    record_order = barcodes.argsort()
+    # points in the sorted set. the sort is stable so that records sharing a
+    # barcode stay in input order, as they do in an external sort.
+    record_order = barcodes.argsort(kind='stable')
     barcodes = barcodes[record_order]
     unique_barcodes, barcode_bounds = np.unique(barcodes, return_index=True)
 
     return record_order, unique_barcodes, barcode_bounds
 
 
+def test_record_offsets():
+    data = b'@foo\nATGC\n+\n!!!!\n@bar\nTTG\n+bar\n!!!\n'
+
+    exp = np.array([[0, 4, 9, 11, 16],
+                    [17, 21, 25, 30, 34]])
+    assert (record_offsets(data) == exp).all()
+    assert record_offsets(b'').shape == (0, 5)
+
+    for bad in [b'@foo\nATGC\n+\n', b'foo\nATGC\n+\n!!!!\n',
+                b'@foo\nATGC\n-\n!!!!\n']:
+        try:
+            record_offsets(bad)
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError('%s was accepted' % bad)
+
+
 def test_gather_order():
     i1data = [b'@foo', b'ATGC', b'+', b'!!!!',
               b'@bar', b'TTGG', b'+', b'!!!!',
@@ -117,7 +197,9 @@ def test_gather_order():
               b'@ofo', b'TTTT', b'+', b'!!!!', b'']
 
     i1 = io.BytesIO(b'\n'.join(i1data))
-    order, unique, bounds = gather_order(i1)
+    i1_out = io.BytesIO()
+    order, unique, bounds = gather_order(i1, i1_out)
+    assert i1_out.getvalue() == b'\n'.join(i1data)
 
     exp_order = np.array([0, 2, 1, 4, 3, 5, 6])
     exp_unique = np.array([b'ATGC', b'TTGG', b'TTTT'])
@@ -128,56 +210,68 @@ def test_gather_order():
     assert (bounds == exp_bounds).all()
 
 
+def shard_of(barcode, shards):
+    """Get the shard a barcode's records are written to"""
+    return zlib.crc32(barcode) % shards
+
+
 def troll_and_write(order, unique, bounds, in_, out_):
     """Walk over the raw data, spit out barcode amended records in order
 
     - read all data
     - get index boundaries for each record
-    - pull out each record in order according to the barcode data
+    - pull out the records of each barcode in order
     - associate the barcode
     - write
+
+    out_ may be a list of shards, in which case each barcode's records are
+    written to the shard given by shard_of(). We return, for each barcode in
+    order, its shard, the number of records preceding it in the shard, its
+    number of records and the position of its first record, as given by the
+    shard's tell(). For a BGZFWriter, resolve_index() converts the positions
+    to virtual offsets
     """
+    outs = out_ if isinstance(out_, list) else [out_]
 
     data = in_.read()
-    boundaries = np.empty([order.size, 2], dtype=np.uint64)
+    offsets = record_offsets(data)
+    assert offsets.shape[0] == order.size
 
-    stop = 0
-    for idx in range(order.size):
-        rec = RECORD.search(data, pos=stop)
-        start, stop = rec.span()
-        boundaries[idx] = np.array([start, stop], dtype=np.uint64)
+    # the start of each record, the end of its id and the end of the record.
+    # copies, so the rest of the offsets can be tossed
+    starts = offsets[:, 0].copy()
+    id_ends = offsets[:, 1].copy()
+    stops = offsets[:, 4] + 1
+    del offsets
 
-    current_barcode_idx = 0
-    current_barcode = unique[current_barcode_idx]
-    current_barcode_bound_end = bounds[current_barcode_idx + 1]
+    bounds = list(bounds) + [order.size]
 
-    for order_idx, record_idx in enumerate(order):
-        if order_idx >= current_barcode_bound_end:
-            current_barcode_idx += 1
+    index = []
+    # the records written to each shard so far
+    positions = [0 for _ in outs]
 
-            if current_barcode_idx >= bounds.size:
-                raise ValueError("should not happen?")
-            current_barcode = unique[current_barcode_idx]
+    for barcode_idx, barcode in enumerate(unique):
+        # the records of a barcode are contiguous in the sorted order
+        records = order[bounds[barcode_idx]:bounds[barcode_idx + 1]]
+        tag = b' ' + create_tag(barcode)
+        shard = shard_of(barcode, len(outs))
 
-            if current_barcode_idx + 1 >= bounds.size:
-                # run to the end
-                current_barcode_bound_end = order.size
-            else:
-                current_barcode_bound_end = bounds[current_barcode_idx + 1]
+        # smash the tag in after each record id, as insert_barcode() does
+        pieces = []
+        for start, id_end, stop in zip(starts[records].tolist(),
+                                       id_ends[records].tolist(),
+                                       stops[records].tolist()):
+            pieces.append(data[start:id_end])
+            pieces.append(tag)
+            pieces.append(data[id_end:stop])
 
-        start, stop = boundaries[record_idx]
-        record = data[start:stop]
+        index.append((bytes(barcode), shard, positions[shard], records.size,
+                      outs[shard].tell()))
+        positions[shard] += records.size
 
-        # in a one-off, these might pass by chance. It would be real weird
-        # for them to always pass for all records in a large file.
-        # n.b., b'foo'[0] is int, because yay, so we use a slice to maintain
-        # a human readable character to test against as most mortals haven't
-        # memorized the ascii table
-        assert record[:1] == b'@'
-        assert record[-1:] == b'\n'
+        outs[shard].write(b''.join(pieces))
 
-        with_barcode = insert_barcode(record, current_barcode)
-        out_.write(with_barcode)
+    return index
 
 
 def test_troll_and_write():
@@ -218,6 +312,568 @@ def test_troll_and_write():
     assert r1exp == r1out.read()
 
 
+def write_sorted_runs(i1_in, in_, max_bytes, tmp_dir, i1_out=None):
+    """Write barcode-sorted runs of bounded size to temporary files
+
+    I1 and in_ are read in lockstep, a record at a time. Once the records
+    read reach max_bytes, they are stably sorted by barcode and written to a
+    run, each record preceded by its barcode. The size of a run counts what
+    it costs in memory, rather than just its records' bytes: the barcodes
+    (twice, as they're copied into an array to be sorted) and
+    RECORD_OVERHEAD. Returns the paths to the runs, in input order. If
+    i1_out is provided, I1 is copied to it as it's read.
+    """
+    run_paths = []
+    barcodes = []
+    records = []
+    size = 0
+
+    def flush():
+        order = np.array(barcodes).argsort(kind='stable')
+        run_path = join(tmp_dir, 'run%d' % len(run_paths))
+        with open(run_path, 'wb') as out_:
+            for idx in order:
+                out_.write(barcodes[idx] + b'\n')
+                out_.write(records[idx])
+        run_paths.append(run_path)
+
+    barcode_length = None
+    for i1, rec in zip_longest(readrec(i1_in), readrec(in_)):
+        # I1 and in_ must hold the same number of records
+        assert i1 is not None and rec is not None
+
+        if i1_out is not None:
+            i1_out.write(i1)
+
+        barcode = i1.split(b'\n', 2)[1]
+        if barcode_length is None:
+            barcode_length = len(barcode)
+        assert len(barcode) == barcode_length  # get angry if it's weird
+
+        barcodes.append(barcode)
+        records.append(rec)
+        size += len(rec) + 2 * len(barcode) + RECORD_OVERHEAD
+
+        if size >= max_bytes:
+            flush()
+            barcodes = []
+            records = []
+            size = 0
+
+    if records:
+        flush()
+
+    return run_paths
+
+
+def read_run(run_fp):
+    """Yield the (barcode, record) pairs written to a run"""
+    for barcode in run_fp:
+        record = b''.join([next(run_fp) for _ in range(4)])
+        yield barcode[:-1], record
+
+
+def merge_runs(run_paths, tmp_dir, fan_in=MERGE_FAN_IN):
+    """Merge runs, at most fan_in at a time, until at most fan_in remain
+
+    Consecutive runs are merged, so earlier runs still precede later ones
+    and the sort remains stable. Merged runs are removed. Returns the paths
+    to the remaining runs, in order.
+    """
+    assert fan_in > 1
+    count = len(run_paths)
+    while len(run_paths) > fan_in:
+        merged_paths = []
+        for i in range(0, len(run_paths), fan_in):
+            group = run_paths[i:i + fan_in]
+            if len(group) == 1:
+                merged_paths.append(group[0])
+                continue
+
+            run_path = join(tmp_dir, 'run%d' % count)
+            count += 1
+            run_fps = [open(x, 'rb') for x in group]
+            merged = heapq.merge(*[read_run(x) for x in run_fps],
+                                 key=itemgetter(0))
+            with open(run_path, 'wb') as out_:
+                for barcode, record in merged:
+                    out_.write(barcode + b'\n')
+                    out_.write(record)
+            for run_fp, x in zip(run_fps, group):
+                run_fp.close()
+                os.remove(x)
+            merged_paths.append(run_path)
+        run_paths = merged_paths
+    return run_paths
+
+
+def external_sort_and_write(i1_in, in_, out_, max_bytes, tmp_dir=None,
+                            i1_out=None, fan_in=MERGE_FAN_IN):
+    """Sort records by barcode w/bounded memory, spit out amended records
+
+    Records are written in the same order, and w/the same tags, as
+    gather_order() and troll_and_write() produce, without holding all of the
+    data in memory at once. If i1_out is provided, I1 is copied to it. At
+    most fan_in runs are open at once; see merge_runs().
+
+    out_ may be a list of shards, and the same index is returned, as
+    troll_and_write() does.
+    """
+    outs = out_ if isinstance(out_, list) else [out_]
+    run_dir = tempfile.mkdtemp(dir=tmp_dir)
+
+    try:
+        run_paths = write_sorted_runs(i1_in, in_, max_bytes, run_dir,
+                                      i1_out)
+        run_paths = merge_runs(run_paths, run_dir, fan_in)
+        run_fps = [open(x, 'rb') for x in run_paths]
+
+        # heapq.merge() favors earlier runs on ties, keeping the sort stable
+        merged = heapq.merge(*[read_run(x) for x in run_fps],
+                             key=itemgetter(0))
+
+        index = []
+        positions = [0 for _ in outs]
+        current = None
+        for barcode, record in merged:
+            if barcode != current:
+                current = barcode
+                shard = shard_of(barcode, len(outs))
+                index.append([barcode, shard, positions[shard], 0,
+                              outs[shard].tell()])
+
+            outs[shard].write(insert_barcode(record, barcode))
+
+            index[-1][3] += 1
+            positions[shard] += 1
+
+        for run_fp in run_fps:
+            run_fp.close()
+    finally:
+        shutil.rmtree(run_dir)
+
+    return [tuple(x) for x in index]
+
+
+def test_external_sort_and_write():
+    i1data = [b'@foo', b'ATGC', b'+', b'!!!!',
+              b'@bar', b'TTGG', b'+', b'!!!!',
+              b'@baz', b'ATGC', b'+', b'!!!!',
+              b'@oof', b'TTTT', b'+', b'!!!!',
+              b'@rab', b'TTGG', b'+', b'!!!!',
+              b'@zab', b'TTTT', b'+', b'!!!!',
+              b'@ofo', b'TTTT', b'+', b'!!!!', b'']
+    i1data = b'\n'.join(i1data)
+
+    r1data = [b'@foo', b'AATGC', b'+', b'!!!!!',
+              b'@bar', b'ATTGG', b'+', b'!!!!!',
+              b'@baz', b'AATGC', b'+', b'!!!!!',
+              b'@oof', b'ATTTT', b'+', b'!!!!!',
+              b'@rab', b'ATTGG', b'+', b'!!!!!',
+              b'@zab', b'ATTTT', b'+', b'!!!!!',
+              b'@ofo', b'ATTTT', b'+', b'!!!!!', b'']
+    r1data = b'\n'.join(r1data)
+
+    order, unique, bounds = gather_order(io.BytesIO(i1data))
+    exp = io.BytesIO()
+    troll_and_write(order, unique, bounds, io.BytesIO(r1data), exp)
+
+    # runs of one record, a few records and all of the records, merged in
+    # one or several passes.
+    for max_bytes in [1, 250, 10 ** 6]:
+        for fan_in in [2, 3, MERGE_FAN_IN]:
+            obs = io.BytesIO()
+            i1_out = io.BytesIO()
+            external_sort_and_write(io.BytesIO(i1data), io.BytesIO(r1data),
+                                    obs, max_bytes, i1_out=i1_out,
+                                    fan_in=fan_in)
+            assert obs.getvalue() == exp.getvalue()
+            assert i1_out.getvalue() == i1data
+
+    # the size of a run counts the overhead of each record
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        run_paths = write_sorted_runs(io.BytesIO(i1data), io.BytesIO(r1data),
+                                      250, tmp_dir)
+        assert len(run_paths) == 3
+
+        # merging leaves at most fan_in runs, and removes those it merged
+        run_paths = merge_runs(run_paths, tmp_dir, 2)
+        assert len(run_paths) == 2
+        assert sorted(os.listdir(tmp_dir)) == ['run2', 'run3']
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_shards():
+    i1data = [b'@foo', b'ATGC', b'+', b'!!!!',
+              b'@bar', b'TTGG', b'+', b'!!!!',
+              b'@baz', b'ATGC', b'+', b'!!!!',
+              b'@oof', b'TTTT', b'+', b'!!!!',
+              b'@rab', b'TTGG', b'+', b'!!!!',
+              b'@zab', b'TTTT', b'+', b'!!!!',
+              b'@ofo', b'TTTT', b'+', b'!!!!', b'']
+    i1data = b'\n'.join(i1data)
+
+    r1data = [b'@foo', b'AATGC', b'+', b'!!!!!',
+              b'@bar', b'ATTGG', b'+', b'!!!!!',
+              b'@baz', b'AATGC', b'+', b'!!!!!',
+              b'@oof', b'ATTTT', b'+', b'!!!!!',
+              b'@rab', b'ATTGG', b'+', b'!!!!!',
+              b'@zab', b'ATTTT', b'+', b'!!!!!',
+              b'@ofo', b'ATTTT', b'+', b'!!!!!', b'']
+    r1data = b'\n'.join(r1data)
+
+    # ATGC and TTGG hash to shard 1, TTTT to shard 2, and none to shard 0
+    exp_shards = [b'',
+                  b'@foo BX:Z:ATGC-1\nAATGC\n+\n!!!!!\n'
+                  b'@baz BX:Z:ATGC-1\nAATGC\n+\n!!!!!\n'
+                  b'@bar BX:Z:TTGG-1\nATTGG\n+\n!!!!!\n'
+                  b'@rab BX:Z:TTGG-1\nATTGG\n+\n!!!!!\n',
+                  b'@oof BX:Z:TTTT-1\nATTTT\n+\n!!!!!\n'
+                  b'@zab BX:Z:TTTT-1\nATTTT\n+\n!!!!!\n'
+                  b'@ofo BX:Z:TTTT-1\nATTTT\n+\n!!!!!\n']
+    exp_index = [(b'ATGC', 1, 0, 2, 0),
+                 (b'TTGG', 1, 2, 2, 62),
+                 (b'TTTT', 2, 0, 3, 0)]
+
+    order, unique, bounds = gather_order(io.BytesIO(i1data))
+    shards = [io.BytesIO() for _ in range(3)]
+    index = troll_and_write(order, unique, bounds, io.BytesIO(r1data),
+                            shards)
+    assert [x.getvalue() for x in shards] == exp_shards
+    assert index == exp_index
+
+    shards = [io.BytesIO() for _ in range(3)]
+    index = external_sort_and_write(io.BytesIO(i1data), io.BytesIO(r1data),
+                                    shards, 40)
+    assert [x.getvalue() for x in shards] == exp_shards
+    assert index == exp_index
+
+    # the index locates each barcode's records; test_bgzf() does so in
+    # compressed shards
+    for barcode, shard, _, records, offset in index:
+        data = exp_shards[shard][offset:].split(b'\n')[:records * 4]
+        assert len(data) == records * 4
+        for id_ in data[0::4]:
+            assert id_.endswith(b' BX:Z:%s-1' % barcode)
+
+    assert shard_path('foo.R1.fastq.gz', 2) == 'foo.R1.shard2.fastq.gz'
+    assert shard_path('foo.R1', 0) == 'foo.R1.shard0'
+
+
+def shard_path(path, shard):
+    """Get the path of a shard of an output"""
+    for suffix in ['.fastq.gz', '.fq.gz', '.gz']:
+        if path.endswith(suffix):
+            return '%s.shard%d%s' % (path[:-len(suffix)], shard, suffix)
+    return '%s.shard%d' % (path, shard)
+
+
+class BGZFWriter:
+    """Write gzip compressed data as BGZF, for random access by offset
+
+    BGZF (as used by htslib) is a series of gzip members, each holding at
+    most 64KB of data and recording its compressed size, so a reader can
+    seek to the start of any member and decompress from there. A position is
+    a virtual offset: the compressed offset of a member shifted left 16
+    bits, plus an offset into the member's uncompressed data.
+
+    Members are compressed by a pool of threads, so the compressed offset
+    of a member isn't known when it's written. tell() returns the position
+    w/the member's number in place of its compressed offset, and
+    virtual_offset() converts it once the writer is closed.
+    """
+    # the uncompressed data per member, and the level, as bgzip uses
+    BLOCK_SIZE = 0xff00
+    COMPRESS_LEVEL = 6
+    # the member that ends every BGZF file
+    EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000'
+                        '000000')
+
+    def __init__(self, path, threads=1):
+        self.fp = open(path, 'wb')
+        self.pool = ThreadPoolExecutor(max(threads, 1))
+        self.pending = collections.deque()
+        self.max_pending = 4 * max(threads, 1)
+        self.buf = bytearray()
+        self.members = 0
+        self.member_offsets = []
+
+    @classmethod
+    def compress(cls, data):
+        """Compress data as a single BGZF member"""
+        co = zlib.compressobj(cls.COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        deflated = co.compress(data) + co.flush()
+        if len(deflated) + 26 > 0x10000:
+            # incompressible data; store it instead
+            co = zlib.compressobj(0, zlib.DEFLATED, -15)
+            deflated = co.compress(data) + co.flush()
+
+        header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+        trailer = struct.pack('<II', zlib.crc32(data), len(data))
+        return b''.join([header, struct.pack('<H', len(deflated) + 25),
+                         deflated, trailer])
+
+    def write(self, data):
+        self.buf += data
+        while len(self.buf) >= self.BLOCK_SIZE:
+            self._submit(bytes(self.buf[:self.BLOCK_SIZE]))
+            del self.buf[:self.BLOCK_SIZE]
+
+    def tell(self):
+        return (self.members << 16) | len(self.buf)
+
+    def _submit(self, block):
+        self.pending.append(self.pool.submit(self.compress, block))
+        self.members += 1
+        while len(self.pending) > self.max_pending:
+            self._write_member()
+
+    def _write_member(self):
+        self.member_offsets.append(self.fp.tell())
+        self.fp.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buf:
+            self._submit(bytes(self.buf))
+            self.buf = bytearray()
+        while self.pending:
+            self._write_member()
+        # a position at the very end of the data refers to the EOF member
+        self.member_offsets.append(self.fp.tell())
+        self.fp.write(self.EOF)
+        self.fp.close()
+        self.pool.shutdown()
+
+    def virtual_offset(self, position):
+        """Convert a position from tell() to a virtual offset"""
+        return (self.member_offsets[position >> 16] << 16) | \
+            (position & 0xffff)
+
+
+def open_at(path, virtual_offset):
+    """Open a BGZF file for reading at a virtual offset"""
+    fp = open(path, 'rb')
+    fp.seek(virtual_offset >> 16)
+    gz = gzip.GzipFile(fileobj=fp, mode='rb')
+    gz.read(virtual_offset & 0xffff)
+    return gz
+
+
+def resolve_index(index, outs):
+    """Convert the positions in an index to virtual offsets
+
+    The writers must have been closed
+    """
+    return [x[:4] + (outs[x[1]].virtual_offset(x[4]), ) for x in index]
+
+
+def test_bgzf():
+    i1data = [b'@foo', b'ATGC', b'+', b'!!!!',
+              b'@bar', b'TTGG', b'+', b'!!!!',
+              b'@baz', b'ATGC', b'+', b'!!!!',
+              b'@oof', b'TTTT', b'+', b'!!!!',
+              b'@rab', b'TTGG', b'+', b'!!!!',
+              b'@zab', b'TTTT', b'+', b'!!!!',
+              b'@ofo', b'TTTT', b'+', b'!!!!', b'']
+    i1data = b'\n'.join(i1data[:-1] * 5000) + b'\n'
+
+    r1data = [b'@foo', b'AATGC', b'+', b'!!!!!',
+              b'@bar', b'ATTGG', b'+', b'!!!!!',
+              b'@baz', b'AATGC', b'+', b'!!!!!',
+              b'@oof', b'ATTTT', b'+', b'!!!!!',
+              b'@rab', b'ATTGG', b'+', b'!!!!!',
+              b'@zab', b'ATTTT', b'+', b'!!!!!',
+              b'@ofo', b'ATTTT', b'+', b'!!!!!', b'']
+    r1data = b'\n'.join(r1data[:-1] * 5000) + b'\n'
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        order, unique, bounds = gather_order(io.BytesIO(i1data))
+        exp = [io.BytesIO() for _ in range(3)]
+        exp_index = troll_and_write(order, unique, bounds,
+                                    io.BytesIO(r1data), exp)
+
+        # many members per shard, compressed by several threads
+        paths = [join(tmp_dir, 'r1.shard%d.fastq.gz' % i) for i in range(3)]
+        outs = [BGZFWriter(x, threads=2) for x in paths]
+        index = troll_and_write(order, unique, bounds, io.BytesIO(r1data),
+                                outs)
+        for out_ in outs:
+            out_.close()
+        index = resolve_index(index, outs)
+
+        # the shards are plain gzip files, and the index only differs in
+        # its offsets
+        for path, data in zip(paths, exp):
+            with gzip.open(path, 'rb') as fp:
+                assert fp.read() == data.getvalue()
+        assert [x[:4] for x in index] == [x[:4] for x in exp_index]
+        assert index[1][4] >> 16 > 0
+
+        # seek to each barcode's records via the index
+        for barcode, shard, _, records, offset in index:
+            with open_at(paths[shard], offset) as fp:
+                data = fp.read(records * 31).split(b'\n')[:records * 4]
+            assert len(data) == records * 4
+            for id_ in data[0::4]:
+                assert id_.endswith(b' BX:Z:%s-1' % barcode)
+
+        # incompressible data, and a position at the very end of the data
+        path = join(tmp_dir, 'random')
+        out_ = BGZFWriter(path)
+        data = np.random.default_rng(0).bytes(3 * BGZFWriter.BLOCK_SIZE)
+        out_.write(data)
+        end = out_.tell()
+        out_.close()
+        with gzip.open(path, 'rb') as fp:
+            assert fp.read() == data
+        with open_at(path, out_.virtual_offset(end)) as fp:
+            assert fp.read() == b''
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def write_index(path, r1_index, r2_index):
+    """Write where each barcode's records are in the R1 and R2 shards
+
+    R1 and R2 share the shard and record positions of each barcode, and
+    the offsets of each are BGZF virtual offsets into the compressed shards,
+    for use w/open_at()
+    """
+    with open(path, 'w') as out_:
+        out_.write('barcode\tshard\trecord\trecords\tr1_offset\t'
+                   'r2_offset\n')
+        for r1, r2 in zip_longest(r1_index, r2_index):
+            # get angry if R1 and R2 don't line up
+            assert r1 is not None and r2 is not None
+            assert r1[:4] == r2[:4]
+            out_.write('%s\t%d\t%d\t%d\t%d\t%d\n' % (r1[0].decode('ascii'),
+                                                     r1[1], r1[2], r1[3],
+                                                     r1[4], r2[4]))
+
+
+def integrate_no_sort(r1_in, r2_in, i1_in, r1_out, r2_out, orient_r1=b'',
+                      orient_r2=b'', batch_size=NO_SORT_BATCH, i1_out=None):
+    """Inline the barcodes into R1 and R2, preserving the record order
+
+    Records are read in batches of lines, and each batch is written with a
+    single call, rather than parsing and writing each record on its own. If
+    i1_out is provided, I1 is copied to it unmodified as it's read
+    """
+    lines = 4 * batch_size
+
+    while True:
+        r1 = list(islice(r1_in, lines))
+        r2 = list(islice(r2_in, lines))
+        i1 = list(islice(i1_in, lines))
+
+        if not r1 and not r2 and not i1:
+            break
+
+        # get angry if the files have a different number of records, or if
+        # the records aren't in the same order
+        assert len(r1) == len(r2) == len(i1)
+        assert len(r1) % 4 == 0
+
+        # R1 and R2 may already carry their orientation, e.g. @foo/1 and
+        # @foo/2, so compare the IDs without it
+        r1_ids = [id_.strip() for id_ in r1[0::4]]
+        r2_ids = [id_.strip() for id_ in r2[0::4]]
+        ids = [strip_orientation(id_) for id_ in r1_ids]
+        assert ids == [strip_orientation(id_) for id_ in r2_ids]
+        assert ids == [strip_orientation(id_.strip()) for id_ in i1[0::4]]
+
+        if i1_out is not None:
+            i1_out.write(b''.join(i1))
+
+        tags = [create_tag_no_suffix(barcode.strip())
+                for barcode in i1[1::4]]
+
+        for recs, rec_ids, orient, out_ in [(r1, r1_ids, orient_r1, r1_out),
+                                            (r2, r2_ids, orient_r2, r2_out)]:
+            recs[0::4] = [b'%s%s %s\n' % (id_, orient, tag)
+                          for id_, tag in zip(rec_ids, tags)]
+
+            # the last line of a file may lack a newline
+            if not recs[-1].endswith(b'\n'):
+                recs[-1] += b'\n'
+
+            out_.write(b''.join(recs))
+
+
+def test_integrate_no_sort():
+    r1 = io.BytesIO(b'@r1\nATGC\n+\n!!!!\n@r2\nTTGG\n+\n####\n'
+                    b'@r3\nAA\n+\n%%\n')
+    r2 = io.BytesIO(b'@r1\nCCCC\n+\n????\n@r2\nGGGG\n+\n$$$$\n'
+                    b'@r3\nTT\n+\n&&')
+    i1 = io.BytesIO(b'@r1\nAAAA\n+\n!!!!\n@r2\nTTTT\n+\n!!!!\n'
+                    b'@r3\nGGGG\n+\n!!!!\n')
+
+    exp_r1 = (b'@r1/1 BX:Z:AAAA\nATGC\n+\n!!!!\n'
+              b'@r2/1 BX:Z:TTTT\nTTGG\n+\n####\n'
+              b'@r3/1 BX:Z:GGGG\nAA\n+\n%%\n')
+    exp_r2 = (b'@r1/2 BX:Z:AAAA\nCCCC\n+\n????\n'
+              b'@r2/2 BX:Z:TTTT\nGGGG\n+\n$$$$\n'
+              b'@r3/2 BX:Z:GGGG\nTT\n+\n&&\n')
+
+    # batches that do and don't evenly divide the records
+    for batch_size in [1, 2, 3, 10]:
+        for fp in [r1, r2, i1]:
+            fp.seek(0)
+        r1_out = io.BytesIO()
+        r2_out = io.BytesIO()
+        i1_out = io.BytesIO()
+        integrate_no_sort(r1, r2, i1, r1_out, r2_out, b'/1', b'/2',
+                          batch_size, i1_out)
+        assert r1_out.getvalue() == exp_r1
+        assert r2_out.getvalue() == exp_r2
+        assert i1_out.getvalue() == i1.getvalue()
+
+    # IDs that already carry their orientation are kept as they are
+    r1 = io.BytesIO(exp_r1.replace(b' BX:Z:AAAA', b'')
+                    .replace(b' BX:Z:TTTT', b'').replace(b' BX:Z:GGGG', b''))
+    r2 = io.BytesIO(exp_r2.replace(b' BX:Z:AAAA', b'')
+                    .replace(b' BX:Z:TTTT', b'').replace(b' BX:Z:GGGG', b''))
+    i1.seek(0)
+    r1_out = io.BytesIO()
+    r2_out = io.BytesIO()
+    integrate_no_sort(r1, r2, i1, r1_out, r2_out, batch_size=2)
+    assert r1_out.getvalue() == exp_r1
+    assert r2_out.getvalue() == exp_r2
+
+    # records that are out of order are caught, regardless of orientation
+    r2 = io.BytesIO(b'@r2/2\nCCCC\n+\n????\n@r1/2\nGGGG\n+\n$$$$\n'
+                    b'@r3/2\nTT\n+\n&&\n')
+    for fp in [r1, i1]:
+        fp.seek(0)
+    try:
+        integrate_no_sort(r1, r2, i1, io.BytesIO(), io.BytesIO())
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError('out of order records were accepted')
+
+    # mismatched record counts are caught
+    i1 = io.BytesIO(b'@r1\nAAAA\n+\n!!!!\n')
+    r1.seek(0)
+    r2.seek(0)
+    try:
+        integrate_no_sort(r1, r2, i1, io.BytesIO(), io.BytesIO())
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError('mismatched records were accepted')
+
+
+def strip_orientation(id_):
+    """Remove a trailing orientation, e.g. /1, from a record ID"""
+    if re.search(rb'/[0-9]$', id_):
+        return id_[:-2]
+    return id_
+
+
 def create_tag(t):
     return b'BX:Z:%s-1' % t
 
@@ -234,24 +890,17 @@ def insert_barcode(record, barcode):
     return b'%s %s\n%s' % (id_, tag, remainder)
 
 
-def readfq(fp):
-    if fp.mode == 'rb':
-        strip = bytes.strip
-    else:
-        strip = str.strip
-
-    id_ = iter(fp)
-    seq = iter(fp)
-    dumb = iter(fp)
-    qual = iter(fp)
-    for rec in zip(id_, seq, dumb, qual):
-        yield list(map(strip, rec))
+def open_fastq(path):
+    """Open a fastq file for reading, decompressing it if it's gzipped"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
 
 
-def writefq(rec, out):
-    for item in rec:
-        out.write(item)
-        out.write(b'\n')
+def readrec(fp):
+    """Yield each four line record, unmodified"""
+    for rec in zip(fp, fp, fp, fp):
+        yield b''.join(rec)
 
 
 @click.group()
@@ -261,8 +910,13 @@ def cli():
 
 @cli.command()
 def tests():
+    test_record_offsets()
     test_gather_order()
     test_troll_and_write()
+    test_external_sort_and_write()
+    test_shards()
+    test_bgzf()
+    test_integrate_no_sort()
 
 
 @cli.command()
@@ -271,16 +925,45 @@ def tests():
 @click.option('--i1-in', type=click.Path(exists=True), required=True)
 @click.option('--r1-out', type=click.Path(exists=False), required=True)
 @click.option('--r2-out', type=click.Path(exists=False), required=True)
+@click.option('--i1-out', type=click.Path(exists=False), required=False,
+              default=None, help='Also write a gzipped copy of I1 here, as '
+                                 'it is read.')
 @click.option('--threads', type=int, required=False, default=1)
 @click.option('--no-sort', is_flag=True, default=False)
-def integrate(r1_in, r2_in, i1_in, r1_out, r2_out, threads, no_sort):
-    r1_in_fp = open(r1_in, 'rb')
-    r2_in_fp = open(r2_in, 'rb')
-    i1_in_fp = open(i1_in, 'rb')
+@click.option('--max-memory', type=int, required=False, default=None,
+              help='Sort using temporary files, holding about this many MB '
+                   'of records in memory at once, rather than in memory.')
+@click.option('--tmp-dir', type=click.Path(exists=True), required=False,
+              default=None, help='Where to write runs w/--max-memory.')
+@click.option('--shards', type=click.IntRange(min=1), required=False,
+              default=1, help='Partition the sorted output into this many '
+                              'files by barcode, named <out>.shard<N>.')
+@click.option('--index', type=click.Path(exists=False), required=False,
+              default=None, help='Write the shard and offsets of each '
+                                 'barcode here, as TSV.')
+def integrate(r1_in, r2_in, i1_in, r1_out, r2_out, i1_out, threads, no_sort,
+              max_memory, tmp_dir, shards, index):
+    if no_sort and (shards > 1 or index is not None):
+        raise ValueError('--shards and --index require sorting')
+
+    # inputs may be gzipped, as tellread writes them
+    r1_in_fp = open_fastq(r1_in)
+    r2_in_fp = open_fastq(r2_in)
+    i1_in_fp = open_fastq(i1_in)
+
+    if i1_out is not None:
+        i1_out_fp = pgzip.open(i1_out, mode='wb', thread=threads,
+                               blocksize=2*10**7)
+    else:
+        i1_out_fp = None
 
     if no_sort:
-        r1_out_fp = gzip.open(r1_out, mode='wb')
-        r2_out_fp = gzip.open(r2_out, mode='wb')
+        # the inputs are consumed in order, so compression dominates and
+        # is spread over the threads
+        r1_out_fp = pgzip.open(r1_out, mode='wb', thread=threads,
+                               blocksize=2*10**7)
+        r2_out_fp = pgzip.open(r2_out, mode='wb', thread=threads,
+                               blocksize=2*10**7)
 
         r1_sniff = r1_in_fp.readline().strip()
         r2_sniff = r2_in_fp.readline().strip()
@@ -294,38 +977,59 @@ def integrate(r1_in, r2_in, i1_in, r1_out, r2_out, threads, no_sort):
                 raise ValueError('unexpected endings: '
                                  f'{r1_sniff.decode("utf-8")} '
                                  f'{r2_sniff.decode("utf-8")}')
-            orient_r1 = ''
-            orient_r2 = ''
+            orient_r1 = b''
+            orient_r2 = b''
         else:
             assert b'/1' not in r1_sniff
 
             orient_r1 = b'/1'
             orient_r2 = b'/2'
 
-        for (r1, r2, i1) in zip(*map(readfq, [r1_in_fp, r2_in_fp, i1_in_fp])):
-            assert r1[0] == r2[0]
-            assert r1[0] == i1[0]
-
-            tag = create_tag_no_suffix(i1[1])
-            r1[0] = b"%s%s %s" % (r1[0], orient_r1, tag)
-            r2[0] = b"%s%s %s" % (r2[0], orient_r2, tag)
-            writefq(r1, r1_out_fp)
-            writefq(r2, r2_out_fp)
+        integrate_no_sort(r1_in_fp, r2_in_fp, i1_in_fp, r1_out_fp, r2_out_fp,
+                          orient_r1, orient_r2, i1_out=i1_out_fp)
         r1_out_fp.close()
         r2_out_fp.close()
     else:
-        # 200MB is what they use in their readme...
-        r1_out_fp = pgzip.open(r1_out, mode='wb', thread=threads,
-                               blocksize=2*10**8)
-        r2_out_fp = pgzip.open(r2_out, mode='wb', thread=threads,
-                               blocksize=2*10**8)
+        # BGZF rather than pgzip, so that --index can record where each
+        # barcode's records are in the compressed output
+        out_fps = []
+        for out_ in [r1_out, r2_out]:
+            if shards > 1:
+                paths = [shard_path(out_, i) for i in range(shards)]
+            else:
+                paths = [out_]
+            out_fps.append([BGZFWriter(x, threads=threads) for x in paths])
 
-        order, unique, bounds = gather_order(i1_in_fp)
+        indices = []
+        if max_memory is not None:
+            # I1 is read again for R2, but only copied on the first pass
+            for in_, outs, copy_ in zip([r1_in_fp, r2_in_fp], out_fps,
+                                        [i1_out_fp, None]):
+                i1_in_fp.seek(0)
+                index_ = external_sort_and_write(i1_in_fp, in_, outs,
+                                                 max_memory * 10**6,
+                                                 tmp_dir=tmp_dir,
+                                                 i1_out=copy_)
+                in_.close()
+                for out_ in outs:
+                    out_.close()
+                indices.append(resolve_index(index_, outs))
+        else:
+            order, unique, bounds = gather_order(i1_in_fp, i1_out_fp)
 
-        for in_, out_ in zip([r1_in_fp, r2_in_fp], [r1_out_fp, r2_out_fp]):
-            troll_and_write(order, unique, bounds, in_, out_)
-            in_.close()
-            out_.close()
+            for in_, outs in zip([r1_in_fp, r2_in_fp], out_fps):
+                index_ = troll_and_write(order, unique, bounds, in_, outs)
+                in_.close()
+                for out_ in outs:
+                    out_.close()
+                indices.append(resolve_index(index_, outs))
+
+        if index is not None:
+            write_index(index, *indices)
+
+    i1_in_fp.close()
+    if i1_out_fp is not None:
+        i1_out_fp.close()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,16 @@
 import click
+from sequence_processing_pipeline.aggregate_counts import \
+    append_count_records
 from sequence_processing_pipeline.Commands import demux_cmd
+from sequence_processing_pipeline.FastpSummary import (find_fastp_reports,
+                                                       summarize_fastp_reports,
+                                                       write_fastp_summary)
+from sequence_processing_pipeline.FastqStats import run_qc_parallel
+from sequence_processing_pipeline.Metrics import (load_metrics,
+                                                  summarize_metrics)
+from sequence_processing_pipeline.SeqCounter import (count_seqs_parallel,
+                                                     write_histograms)
+from os.path import basename, join
 
 
 @click.group()
@@ -13,8 +24,69 @@ def cli():
 @click.option('--output', type=click.Path(exists=True), required=True)
 @click.option('--task', type=int, required=True)
 @click.option('--maxtask', type=int, required=True)
-def demux(id_map, infile, output, task, maxtask):
-    demux_cmd(id_map, infile, output, task, maxtask)
+@click.option('--stats-dir', type=click.Path(), required=False,
+              help='Write QC reports for each output file to this path.')
+def demux(id_map, infile, output, task, maxtask, stats_dir):
+    demux_cmd(id_map, infile, output, task, maxtask, stats_dir=stats_dir)
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True),
+                required=True)
+def metrics_summary(paths):
+    """Report where run time was spent, from metrics.jsonl files."""
+    summary = summarize_metrics(load_metrics(paths))
+    click.echo(summary.to_string(index=False, float_format='%.2f'))
+
+
+@cli.command()
+@click.option('--input', 'inputs', multiple=True, required=True,
+              type=(click.Path(exists=True), click.Path()),
+              help='A fastq file and the directory to write its report to.')
+@click.option('--processes', type=int, default=1,
+              help='The number of files to process at once.')
+def fastq_qc(inputs, processes):
+    """Write FastQC-compatible reports for fastq files."""
+    run_qc_parallel(list(inputs), processes)
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True),
+                required=True)
+@click.option('--output', type=click.Path(), required=True,
+              help='The path to write to; .parquet or TSV.')
+@click.option('--processes', type=int, default=1,
+              help='The number of processes to parse reports with.')
+def fastp_summary(paths, output, processes):
+    """Summarize fastp JSON reports in a single table."""
+    reports = find_fastp_reports(paths)
+    df = summarize_fastp_reports(reports, processes=processes)
+    write_fastp_summary(df, output)
+    click.echo(f'{len(df)} fastp reports summarized in {output}')
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True),
+                required=True)
+@click.option('--results', type=click.Path(), required=True,
+              help='The JSON-lines file to append counts to.')
+@click.option('--histograms-dir', type=click.Path(exists=True),
+              required=False,
+              help='Write length and mean quality histograms to this path.')
+@click.option('--processes', type=int, default=1,
+              help='The number of files to count at once.')
+def count_seqs(paths, results, histograms_dir, processes):
+    """Count the reads and bases in fastq files."""
+    counts = count_seqs_parallel(list(paths), processes=processes,
+                                 histograms=histograms_dir is not None)
+
+    if histograms_dir is not None:
+        for file_path, (_, _, histograms) in zip(paths, counts):
+            write_histograms(join(histograms_dir,
+                                  f'{basename(file_path)}.npz'), histograms)
+
+    append_count_records(results, [(file_path, x[0], x[1])
+                                   for file_path, x in zip(paths, counts)])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,573 @@
+#!/usr/bin/env python
+# A deterministic stand-in for sbatch, squeue and sacct that actually runs the
+# submitted job scripts on the local machine.
+#
+# Unlike fake_squeue.py, job outcomes are determined by the scripts
+# themselves, rather than chosen at random. Submitted jobs are run by a
+# single scheduler process in first-come-first-served order (by job-id and
+# then by array task-id), subject to:
+#  - a fixed queue latency: the number of seconds a task must wait after
+#    submission before it is eligible to start. (LOCAL_SLURM_LATENCY)
+#  - a fixed number of slots shared by all jobs. (LOCAL_SLURM_SLOTS)
+#  - the array job's own throttle e.g.: --array 1-100%8.
+#
+# All state is kept in LOCAL_SLURM_STATE_DIR (defaults to a directory in the
+# system temp directory) rather than relative to the current working
+# directory.
+#
+# To use, link or copy this file into a directory in PATH under the names
+# 'sbatch', 'squeue' and 'sacct', or use install() to create the links.
+# Once the jobs have finished, 'local_slurm.py benchmark' reports the
+# scheduling overhead of each job and the critical path through all of them.
+from datetime import datetime
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
+from json import load, dump, dumps
+from os import (environ, makedirs, rename, listdir, symlink, getpid, chmod,
+                cpu_count, fdopen, O_WRONLY, O_CREAT, O_TRUNC)
+from os import open as os_open
+from os.path import join, exists, basename, abspath, dirname, realpath
+from subprocess import Popen, DEVNULL
+from tempfile import gettempdir
+from time import time, sleep
+import re
+import shlex
+import sys
+from sequence_processing_pipeline.Executor import (parse_sbatch_options,
+                                                   parse_array_spec,
+                                                   parse_time_limit)
+
+
+# the number of seconds the scheduler waits between scheduling decisions.
+TICK_IN_SECONDS = 0.1
+
+# the default number of seconds an idle scheduler waits for new jobs before
+# exiting. (LOCAL_SLURM_IDLE_TIMEOUT)
+IDLE_TIMEOUT_IN_SECONDS = 30
+
+
+def get_state_dir():
+    state_dir = environ.get('LOCAL_SLURM_STATE_DIR',
+                            join(gettempdir(), 'local_slurm'))
+    makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+
+def install(bin_dir):
+    """
+    Links this script into bin_dir as sbatch, squeue and sacct.
+    :param bin_dir: A directory that is (or will be) in PATH.
+    :return: None
+    """
+    script_path = realpath(__file__)
+    chmod(script_path, 0o755)
+    for name in ['sbatch', 'squeue', 'sacct']:
+        symlink(script_path, join(bin_dir, name))
+
+
+def _write_json(file_path, obj):
+    # write-then-rename so that readers never see a partially written file.
+    # job files hold the submitter's environment, hence they're only
+    # readable by the submitting user.
+    tmp_path = f'{file_path}.{getpid()}.tmp'
+    with fdopen(os_open(tmp_path, O_WRONLY | O_CREAT | O_TRUNC, 0o600),
+                'w') as f:
+        dump(obj, f, indent=2)
+    rename(tmp_path, file_path)
+
+
+def _read_json(file_path):
+    with open(file_path, 'r') as f:
+        return load(f)
+
+
+def _next_job_id(state_dir):
+    with open(join(state_dir, 'job_id.lock'), 'a+') as lock:
+        flock(lock, LOCK_EX)
+        counter_path = join(state_dir, 'next_job_id')
+        job_id = 1
+        if exists(counter_path):
+            with open(counter_path, 'r') as f:
+                job_id = int(f.read().strip())
+        with open(counter_path, 'w') as f:
+            f.write(str(job_id + 1))
+        flock(lock, LOCK_UN)
+    return str(job_id)
+
+
+def _job_ids(state_dir, suffix):
+    ids = []
+    for file_name in listdir(state_dir):
+        m = re.match(r'^job-(\d+)\.%s$' % suffix, file_name)
+        if m:
+            ids.append(m.group(1))
+    return sorted(ids, key=int)
+
+
+def load_jobs(state_dir):
+    """
+    Returns the current state of all jobs.
+    :param state_dir: The path to the stand-in's state directory.
+    :return: A list of dictionaries, one per job, ordered by job-id.
+    """
+    jobs = []
+    for job_id in _job_ids(state_dir, 'json'):
+        job = _read_json(join(state_dir, f'job-{job_id}.json'))
+        state_path = join(state_dir, f'job-{job_id}.state.json')
+        if exists(state_path):
+            job['tasks'] = _read_json(state_path)
+        jobs.append(job)
+    return jobs
+
+
+def sbatch(args):
+    state_dir = get_state_dir()
+    i = 0
+
+    # split sbatch's own options from the script and the script's params.
+    while i < len(args) and args[i].startswith('-'):
+        if '=' not in args[i] and i + 1 < len(args) and \
+                not args[i + 1].startswith('-') and \
+                args[i] not in ['--parsable']:
+            i += 2
+        else:
+            i += 1
+    options = parse_sbatch_options(args[:i])
+    script_path = abspath(args[i])
+    script_parameters = args[i + 1:]
+
+    directives = []
+    with open(script_path, 'r') as f:
+        interpreter = ['/bin/bash']
+        for count, line in enumerate(f):
+            if count == 0 and line.startswith('#!'):
+                interpreter = shlex.split(line[2:])
+            if line.startswith('#SBATCH'):
+                directives += shlex.split(line[len('#SBATCH'):])
+
+    tmp = parse_sbatch_options(directives)
+    tmp.update(options)
+    options = tmp
+
+    job_id = _next_job_id(state_dir)
+    cwd = options.get('chdir', options.get('D', abspath('.')))
+    job_name = options.get('job-name', options.get('J', basename(script_path)))
+
+    env = dict(environ)
+    export = options.get('export', 'ALL')
+    if export not in ['ALL', 'NONE']:
+        for item in export.split(','):
+            if '=' in item:
+                name, value = item.split('=', 1)
+                env[name] = value
+
+    env.update({'SLURM_JOB_ID': job_id,
+                'SLURM_JOBID': job_id,
+                'SLURM_JOB_NAME': job_name,
+                'SLURM_SUBMIT_DIR': cwd,
+                'SLURMD_NODENAME': 'localhost',
+                'SLURM_CPUS_PER_TASK': str(
+                    options.get('cpus-per-task', options.get('c', 1)))})
+
+    array_spec = options.get('array', options.get('a', None))
+    if array_spec is None:
+        task_ids = [None]
+        throttle = None
+        output = options.get('output', options.get('o', 'slurm-%j.out'))
+    else:
+        task_ids, throttle = parse_array_spec(array_spec)
+        output = options.get('output', options.get('o', 'slurm-%A_%a.out'))
+
+    time_limit = options.get('time', options.get('t', None))
+
+    job = {'job_id': job_id,
+           'job_name': job_name,
+           'cmd': interpreter + [script_path] + script_parameters,
+           'cwd': cwd,
+           'env': env,
+           'task_ids': task_ids,
+           'throttle': throttle,
+           'output': output,
+           'error': options.get('error', options.get('e', None)),
+           'time_limit': (None if time_limit is None else
+                          parse_time_limit(str(time_limit))),
+           'latency': float(environ.get('LOCAL_SLURM_LATENCY', 0)),
+           'submit_time': time()}
+
+    _write_json(join(state_dir, f'job-{job_id}.json'), job)
+
+    _ensure_scheduler(state_dir)
+
+    if 'parsable' in options:
+        print(job_id)
+    else:
+        print(f'Submitted batch job {job_id}')
+
+
+def _ensure_scheduler(state_dir):
+    # the scheduler holds an exclusive lock for as long as it's running.
+    with open(join(state_dir, 'scheduler.lock'), 'a+') as lock:
+        try:
+            flock(lock, LOCK_EX | LOCK_NB)
+        except BlockingIOError:
+            return
+        flock(lock, LOCK_UN)
+
+    Popen([sys.executable, realpath(__file__), 'scheduler'],
+          env=dict(environ, LOCAL_SLURM_STATE_DIR=state_dir),
+          stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL,
+          start_new_session=True)
+
+
+def _array_id(job_id, task_id):
+    return job_id if task_id is None else f'{job_id}_{task_id}'
+
+
+class Scheduler:
+    def __init__(self, state_dir, slots):
+        self.state_dir = state_dir
+        self.slots = slots
+        self.jobs = {}
+        self.running = {}
+
+    def _unclaimed_job_ids(self):
+        job_ids = []
+        for job_id in _job_ids(self.state_dir, 'json'):
+            if job_id in self.jobs:
+                continue
+            if exists(join(self.state_dir, f'job-{job_id}.state.json')):
+                # handled by a previous scheduler.
+                continue
+            job_ids.append(job_id)
+        return job_ids
+
+    def has_new_jobs(self):
+        # unlike load_new_jobs(), this doesn't claim the jobs it finds. It
+        # is safe to call w/out holding the scheduler lock.
+        return len(self._unclaimed_job_ids()) > 0
+
+    def load_new_jobs(self):
+        # claims new jobs by writing their state files. Only call this while
+        # holding the scheduler lock.
+        found = False
+        for job_id in self._unclaimed_job_ids():
+            job = _read_json(join(self.state_dir, f'job-{job_id}.json'))
+            job['tasks'] = {_array_id(job_id, t): {'task_id': t,
+                                                   'state': 'PENDING',
+                                                   'start': None,
+                                                   'end': None,
+                                                   'exit_code': None}
+                            for t in job['task_ids']}
+            self.jobs[job_id] = job
+            self.save(job)
+            found = True
+        return found
+
+    def save(self, job):
+        _write_json(join(self.state_dir, f"job-{job['job_id']}.state.json"),
+                    job['tasks'])
+
+    def is_idle(self):
+        return not [t for job in self.jobs.values() for t in
+                    job['tasks'].values() if t['state'] in ['PENDING',
+                                                            'RUNNING']]
+
+    def tick(self):
+        now = time()
+
+        # reap finished tasks and enforce time limits.
+        for array_id, (job, proc, files) in list(self.running.items()):
+            task = job['tasks'][array_id]
+            return_code = proc.poll()
+
+            if return_code is None:
+                if job['time_limit'] is not None and \
+                        now - task['start'] > job['time_limit']:
+                    proc.kill()
+                    proc.wait()
+                    task['state'] = 'TIMEOUT'
+                else:
+                    continue
+            else:
+                task['state'] = 'COMPLETED' if return_code == 0 else 'FAILED'
+                task['exit_code'] = return_code
+
+            task['end'] = time()
+            for f in files:
+                f.close()
+            del self.running[array_id]
+            self.save(job)
+
+        # start eligible tasks in job-id, task-id order.
+        for job_id in sorted(self.jobs, key=int):
+            job = self.jobs[job_id]
+
+            if now < job['submit_time'] + job['latency']:
+                continue
+
+            running = len([t for t in job['tasks'].values()
+                           if t['state'] == 'RUNNING'])
+
+            for array_id, task in job['tasks'].items():
+                if len(self.running) >= self.slots:
+                    return
+                if job['throttle'] and running >= job['throttle']:
+                    break
+                if task['state'] != 'PENDING':
+                    continue
+
+                self.start(job, array_id, task)
+                running += 1
+
+    def start(self, job, array_id, task):
+        def _expand(pattern):
+            replacements = {'%%': '%', '%x': job['job_name'],
+                            '%j': job['job_id'], '%A': job['job_id'],
+                            '%a': str(task['task_id'])}
+            return re.sub('%[%xjAa]', lambda m: replacements[m.group(0)],
+                          join(job['cwd'], pattern))
+
+        env = dict(job['env'])
+        if task['task_id'] is not None:
+            env['SLURM_ARRAY_JOB_ID'] = job['job_id']
+            env['SLURM_ARRAY_TASK_ID'] = str(task['task_id'])
+
+        task['start'] = time()
+
+        try:
+            stdout = _expand(job['output'])
+            makedirs(dirname(stdout), exist_ok=True)
+            files = [open(stdout, 'w')]
+            if job['error'] is not None:
+                stderr = _expand(job['error'])
+                makedirs(dirname(stderr), exist_ok=True)
+                files.append(open(stderr, 'w'))
+            proc = Popen(job['cmd'], cwd=job['cwd'], env=env,
+                         stdout=files[0], stderr=files[-1])
+        except OSError:
+            task['state'] = 'FAILED'
+            task['end'] = time()
+            self.save(job)
+            return
+
+        task['state'] = 'RUNNING'
+        self.running[array_id] = (job, proc, files)
+        self.save(job)
+
+
+def scheduler():
+    state_dir = get_state_dir()
+    lock = open(join(state_dir, 'scheduler.lock'), 'a+')
+
+    try:
+        flock(lock, LOCK_EX | LOCK_NB)
+    except BlockingIOError:
+        # another scheduler is already running.
+        return
+
+    sched = Scheduler(state_dir, int(environ.get('LOCAL_SLURM_SLOTS',
+                                                 cpu_count())))
+    idle_timeout = float(environ.get('LOCAL_SLURM_IDLE_TIMEOUT',
+                                     IDLE_TIMEOUT_IN_SECONDS))
+    idle_since = time()
+
+    while True:
+        if sched.load_new_jobs():
+            idle_since = time()
+
+        sched.tick()
+
+        if sched.is_idle():
+            if time() - idle_since > idle_timeout:
+                # give up the lock before checking one last time for new
+                # jobs. Any job submitted after this check will start a new
+                # scheduler. The check must not claim the jobs it finds, as
+                # a new scheduler may take the lock before this one can
+                # reacquire it.
+                flock(lock, LOCK_UN)
+                if not sched.has_new_jobs():
+                    return
+                try:
+                    flock(lock, LOCK_EX | LOCK_NB)
+                except BlockingIOError:
+                    # a new scheduler has already taken over and will load
+                    # the new jobs itself.
+                    return
+                idle_since = time()
+        else:
+            idle_since = time()
+
+        sleep(TICK_IN_SECONDS)
+
+
+def _job_states(job):
+    # jobs the scheduler hasn't loaded yet are reported as pending.
+    if 'tasks' in job:
+        return {k: v for k, v in job['tasks'].items()}
+
+    return {_array_id(job['job_id'], t): {'task_id': t, 'state': 'PENDING',
+                                          'start': None, 'end': None,
+                                          'exit_code': None}
+            for t in job['task_ids']}
+
+
+def squeue(args):
+    options = parse_sbatch_options(args)
+    job_ids = options.get('j', options.get('jobs', None))
+    job_ids = None if job_ids is None else job_ids.split(',')
+    fmt = options.get('o', options.get('format', '%i,%T'))
+
+    fields = {'%i': 'JOBID', '%T': 'STATE', '%j': 'NAME', '%A': 'ARRAY_JOB_ID',
+              '%a': 'ARRAY_TASK_ID'}
+
+    print(re.sub('%[iTjAa]', lambda m: fields[m.group(0)], fmt))
+
+    for job in load_jobs(get_state_dir()):
+        if job_ids is not None and job['job_id'] not in job_ids:
+            continue
+
+        for array_id, task in _job_states(job).items():
+            values = {'%i': array_id, '%T': task['state'],
+                      '%j': job['job_name'], '%A': job['job_id'],
+                      '%a': str(task['task_id'])}
+            print(re.sub('%[iTjAa]', lambda m: values[m.group(0)], fmt))
+
+
+def _timestamp(seconds):
+    if seconds is None:
+        return 'Unknown'
+    return datetime.fromtimestamp(seconds).isoformat(timespec='seconds')
+
+
+def sacct(args):
+    options = parse_sbatch_options(args)
+    job_ids = options.get('j', options.get('jobs', None))
+    job_ids = None if job_ids is None else job_ids.split(',')
+    fields = options.get('format', options.get('o', 'JobID,JobName,State,'
+                                                    'Submit,Start,End,'
+                                                    'Elapsed,ExitCode'))
+    fields = fields.split(',')
+
+    print('|'.join(fields))
+
+    for job in load_jobs(get_state_dir()):
+        if job_ids is not None and job['job_id'] not in job_ids:
+            continue
+
+        for array_id, task in _job_states(job).items():
+            elapsed = 0
+            if task['start'] is not None:
+                elapsed = (task['end'] or time()) - task['start']
+
+            values = {'JobID': array_id,
+                      'JobName': job['job_name'],
+                      'State': task['state'],
+                      'Submit': _timestamp(job['submit_time']),
+                      'Start': _timestamp(task['start']),
+                      'End': _timestamp(task['end']),
+                      'Elapsed': '%02d:%02d:%02d' % (elapsed // 3600,
+                                                     elapsed % 3600 // 60,
+                                                     elapsed % 60),
+                      'ExitCode': f"{task['exit_code'] or 0}:0"}
+
+            print('|'.join([values.get(x, '') for x in fields]))
+
+
+def benchmark_report(state_dir):
+    """
+    Measures the scheduling overhead of each job and the critical path.
+    :param state_dir: The path to the stand-in's state directory.
+    :return: A dictionary describing each job and the run as a whole.
+    """
+    jobs = []
+
+    for job in load_jobs(state_dir):
+        tasks = [t for t in _job_states(job).values()
+                 if t['start'] is not None and t['end'] is not None]
+
+        if not tasks:
+            continue
+
+        submit = job['submit_time']
+        first_start = min([t['start'] for t in tasks])
+        last_end = max([t['end'] for t in tasks])
+        durations = [t['end'] - t['start'] for t in tasks]
+
+        jobs.append({'job_id': job['job_id'],
+                     'job_name': job['job_name'],
+                     'task_count': len(tasks),
+                     'submit': submit,
+                     'end': last_end,
+                     # time spent waiting to begin any work at all.
+                     'queue_wait': first_start - submit,
+                     # time from submission until the last task finished.
+                     'makespan': last_end - submit,
+                     'longest_task': max(durations),
+                     'busy_time': sum(durations),
+                     # time the job took beyond its longest task. This is
+                     # the time lost to queueing and contention for slots.
+                     'scheduling_overhead': (last_end - submit -
+                                             max(durations))})
+
+    if not jobs:
+        return {'jobs': [], 'critical_path': []}
+
+    # jobs in a Pipeline run one after another. Each job on the critical
+    # path is the one that finished last among those submitted before the
+    # next job was submitted; the time between the two is time spent
+    # outside of Slurm e.g.: post-processing and job-script generation.
+    jobs.sort(key=lambda x: x['submit'])
+    critical_path = []
+    for job in jobs:
+        if critical_path and job['submit'] < critical_path[-1]['end']:
+            # this job ran concurrently w/the previous one.
+            if job['end'] > critical_path[-1]['end']:
+                critical_path[-1] = job
+            continue
+        critical_path.append(job)
+
+    gaps = [b['submit'] - a['end'] for a, b in zip(critical_path,
+                                                   critical_path[1:])]
+
+    return {'jobs': jobs,
+            'critical_path': [x['job_id'] for x in critical_path],
+            'wall_time': jobs[-1]['end'] - jobs[0]['submit'],
+            'time_between_jobs': sum(gaps),
+            'scheduling_overhead': sum([x['scheduling_overhead'] for x in
+                                        critical_path]),
+            'task_time': sum([x['longest_task'] for x in critical_path])}
+
+
+def benchmark(args):
+    options = parse_sbatch_options(args)
+    report = benchmark_report(options.get('state-dir', get_state_dir()))
+
+    if 'json' in options:
+        print(dumps(report, indent=2))
+        return
+
+    print("job_id\tjob_name\ttasks\tqueue_wait\tmakespan\tlongest_task\t"
+          "scheduling_overhead")
+    for job in report['jobs']:
+        print('%s\t%s\t%d\t%.2f\t%.2f\t%.2f\t%.2f' % (
+            job['job_id'], job['job_name'], job['task_count'],
+            job['queue_wait'], job['makespan'], job['longest_task'],
+            job['scheduling_overhead']))
+
+    if report['jobs']:
+        print(f"critical path: {' -> '.join(report['critical_path'])}")
+        print('wall time: %.2f task time: %.2f scheduling overhead: %.2f '
+              'time between jobs: %.2f' % (report['wall_time'],
+                                           report['task_time'],
+                                           report['scheduling_overhead'],
+                                           report['time_between_jobs']))
+
+
+if __name__ == "__main__":
+    commands = {'sbatch': sbatch, 'squeue': squeue, 'sacct': sacct,
+                'scheduler': lambda _: scheduler(), 'benchmark': benchmark}
+
+    name = basename(sys.argv[0])
+    if name in commands:
+        commands[name](sys.argv[1:])
+    else:
+        commands[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Runs the commands assigned to one task of a Slurm array job.
+#
+# Commands are read from a JSON manifest mapping array task-ids (as strings)
+# to lists of commands e.g.: {"1": ["cmd a", "cmd b"], "2": ["cmd c"]}. The
+# commands for a task are run concurrently, up to the number of commands the
+# allocated cores can support. The exit code, timing and peak RSS of each
+# command are written to a JSON results file. The .completed marker is only
+# written when every command succeeded.
+#
+# The job scripts run this script on the compute nodes w/the same python
+# that submitted the job (sys.executable), so it must be reachable from
+# there. Only the standard library is used, so that it doesn't depend on
+# any packages beyond that python.
+from argparse import ArgumentParser
+from json import load, dump
+from os import replace, wait4, waitstatus_to_exitcode, WNOHANG
+from subprocess import Popen
+from time import time, sleep
+import sys
+
+
+# the number of seconds to wait between checks for finished commands.
+POLLING_INTERVAL_IN_SECONDS = 0.1
+
+
+def load_commands(manifest_path, task_id):
+    """
+    Returns the commands assigned to a task.
+    :param manifest_path: The path to a JSON manifest.
+    :param task_id: An array task-id.
+    :return: A list of commands.
+    """
+    with open(manifest_path, 'r') as f:
+        manifest = load(f)
+
+    if str(task_id) not in manifest:
+        raise ValueError(f"task {task_id} is not in {manifest_path}")
+
+    return manifest[str(task_id)]
+
+
+def run_commands(commands, max_concurrent):
+    """
+    Runs commands w/a shell, at most max_concurrent at the same time.
+    :param commands: A list of commands.
+    :param max_concurrent: The maximum number of commands to run at once.
+    :return: A list of dictionaries describing each command's execution,
+             in the same order as commands.
+    """
+    results = [None] * len(commands)
+    running = {}
+    queued = list(enumerate(commands))
+
+    while queued or running:
+        while queued and len(running) < max_concurrent:
+            index, command = queued.pop(0)
+            proc = Popen(command, shell=True)
+            running[proc.pid] = (proc, index, command, time())
+
+        # reap the commands that have finished. wait4() reports the peak RSS
+        # of the command, including any children it waited on.
+        finished = False
+        for pid in list(running):
+            pid, status, rusage = wait4(pid, WNOHANG)
+            if pid == 0:
+                # still running.
+                continue
+
+            proc, index, command, start = running.pop(pid)
+            # the status has been collected; prevent Popen from trying to.
+            proc.returncode = waitstatus_to_exitcode(status)
+            end = time()
+            finished = True
+
+            results[index] = {'index': index,
+                              'command': command,
+                              'return_code': proc.returncode,
+                              'start': start,
+                              'end': end,
+                              'elapsed': end - start,
+                              # ru_maxrss is reported in kilobytes on Linux.
+                              'max_rss_kb': rusage.ru_maxrss}
+
+        if running and not finished:
+            sleep(POLLING_INTERVAL_IN_SECONDS)
+
+    return results
+
+
+def main(args=None):
+    parser = ArgumentParser(description='Run the commands for one task of '
+                                        'a Slurm array job.')
+    parser.add_argument('--manifest', required=True,
+                        help='JSON manifest of task-ids and commands.')
+    parser.add_argument('--task', required=True, type=int,
+                        help='The array task-id to run.')
+    parser.add_argument('--cores', type=int, default=1,
+                        help='The number of cores allocated to the task.')
+    parser.add_argument('--threads-per-command', type=int, default=1,
+                        help='The number of cores each command uses.')
+    parser.add_argument('--results', required=True,
+                        help='The path to write results to.')
+    parser.add_argument('--completed', required=True,
+                        help='The path to write if all commands succeed.')
+    args = parser.parse_args(args)
+
+    commands = load_commands(args.manifest, args.task)
+    max_concurrent = max(1, args.cores // max(1, args.threads_per_command))
+
+    start = time()
+    results = run_commands(commands, max_concurrent)
+    end = time()
+
+    failed = [x for x in results if x['return_code'] != 0]
+
+    # write results atomically so they're never read partially written.
+    tmp_path = args.results + '.tmp'
+    with open(tmp_path, 'w') as f:
+        dump({'task': args.task,
+              'start': start,
+              'end': end,
+              'elapsed': end - start,
+              'max_concurrent': max_concurrent,
+              'failed': len(failed),
+              'commands': results}, f, indent=2)
+    replace(tmp_path, args.results)
+
+    if failed:
+        for result in failed:
+            print(f"command {result['index']} failed w/return code "
+                  f"{result['return_code']}: {result['command']}",
+                  file=sys.stderr)
+    else:
+        with open(args.completed, 'w') as f:
+            f.write('\n'.join([f'Cmd Completed: {x}' for x in commands]) +
+                    '\n')
+
+    # like the commands it replaces, the task always succeeds. Failures are
+    # identified from the results instead.
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
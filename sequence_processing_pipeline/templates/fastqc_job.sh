@@ -17,6 +17,4 @@ cd {{output_path}}
 module load {{modules_to_load}}
 {% endif %}
 step=${SLURM_ARRAY_TASK_ID}
-cmd0=$(head -n $step {{array_details}} | tail -n 1)
-eval $cmd0
-echo "Cmd Completed: $cmd0" > logs/FastQCJob_$step.completed
+{{python_path}} {{task_runner_path}} --manifest {{task_manifest}} --task $step --cores {{nprocs}} --threads-per-command {{nthreads}} --results logs/FastQCJob_$step.results.json --completed logs/FastQCJob_$step.completed
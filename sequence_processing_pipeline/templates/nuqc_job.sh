@@ -36,6 +36,25 @@ fi
 conda activate qp-knight-lab-processing-2022.03
 module load {{modules_to_load}}
 
+# append the wall time of each phase of this task to the job's metrics.
+# usage: phase_start <phase>; ...; phase_end <phase> [detail]
+METRICS_PATH={{output_path}}/logs/metrics.jsonl
+declare -A PHASE_STARTS
+function phase_start () {
+    PHASE_STARTS[$1]=$(date +%s.%N)
+}
+function phase_end () {
+    local start=${PHASE_STARTS[$1]}
+    local end=$(date +%s.%N)
+    local elapsed=$(awk "BEGIN {print ${end} - ${start}}")
+    (
+        flock 9
+        printf '{"phase": "%s", "source": "NuQCJob", "job_id": "%s", "task_id": "%s", "detail": "%s", "start": %s, "end": %s, "elapsed": %s}\n' \
+            "$1" "${SLURM_ARRAY_JOB_ID}" "${SLURM_ARRAY_TASK_ID}" "$2" \
+            "${start}" "${end}" "${elapsed}" >&9
+    ) 9>>${METRICS_PATH}
+}
+
 set -x
 set -e
 set -o pipefail
@@ -101,6 +120,7 @@ function mux-runner () {
         # to minimize steps. Additionally, movi expects the input to not be
         # gz, so we are not going to compress seqs_r1
 
+        phase_start fastp
         fastp \
             -l {{length_limit}} \
             -i ${r1} \
@@ -110,31 +130,40 @@ function mux-runner () {
             --html {{html_path}}/${html_name} \
             --json {{json_path}}/${json_name} \
             --stdout | gzip > ${r_adapter_only}
+        phase_end fastp ${r1_name}
 
         # multiplex and write adapter filtered data all at once
+        phase_start mux
         zcat ${r_adapter_only} | \
             sed -r "1~4s/^@(.*)/@${i}${delimiter}\1/" \
             >> ${seqs_reads}
+        phase_end mux ${r1_name}
     done
 
     # minimap/samtools pair commands are now generated in NuQCJob._generate_mmi_filter_cmds()
     # and passed to this template.
     {{mmi_filter_cmds}}
 
+    phase_start movi
     {{movi_path}} query \
         --index /scratch/movi_hg38_chm13_hprc94 \
         --read ${seq_reads_filter_alignment} \
         --stdout | gzip > ${jobd}/seqs.movi.txt.gz
+    phase_end movi
         
+    phase_start pmls
     python {{pmls_path}} <(zcat ${jobd}/seqs.movi.txt.gz) | \
         seqtk subseq ${seq_reads_filter_alignment} - > ${jobd}/seqs.final.fastq
+    phase_end pmls
          
+    phase_start split_pair
     {{splitter_binary}} ${jobd}/seqs.final.fastq \
         ${jobd}/reads.r1.fastq ${delimiter} ${r1_tag} &
     {{splitter_binary}} ${jobd}/seqs.final.fastq \
         ${jobd}/reads.r2.fastq ${delimiter} ${r2_tag} &
     wait
     fastq_pair -t 50000000 ${jobd}/reads.r1.fastq ${jobd}/reads.r2.fastq
+    phase_end split_pair
 
     # keep seqs.movi.txt and migrate it to NuQCJob directory.
     mv ${jobd}/seqs.movi.txt.gz {{output_path}}/logs/seqs.movi.${SLURM_ARRAY_TASK_ID}.txt.gz
@@ -162,7 +191,8 @@ function demux-runner () {
             --infile <(cat ${seqs_r1} ${seqs_r2}) \
             --output ${OUTPUT} \
             --task ${idx} \
-            --maxtask ${n_demux_jobs} &
+            --maxtask ${n_demux_jobs} {% if qc_stats_path %}\
+            --stats-dir {{qc_stats_path}} {% endif %}&
     done
     wait
 }
@@ -172,8 +202,8 @@ mux-runner
 
 mkdir -p ${OUTPUT}
 
-echo "$(date) :: demux start"
+phase_start demux
 demux-runner
-echo "$(date) :: demux stop"
+phase_end demux
 
 touch ${OUTPUT}/${SLURM_JOB_NAME}.${SLURM_ARRAY_TASK_ID}.completed
@@ -0,0 +1,68 @@
+import unittest
+from sequence_processing_pipeline.CountCache import CountCache
+from os import makedirs, remove, rename, utime
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree
+
+
+class TestCountCache(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('count_cache_output')
+        makedirs(self.output_path, exist_ok=True)
+
+        self.cache_path = join(self.output_path, 'counts.sqlite')
+        self.file_paths = []
+        for i in range(3):
+            file_path = join(self.output_path, f'file{i}.fastq')
+            self._write(file_path, 'A' * (i + 1))
+            self.file_paths.append(file_path)
+
+    def tearDown(self):
+        rmtree(self.output_path)
+
+    def _write(self, file_path, contents):
+        with open(file_path, 'w') as f:
+            f.write(contents)
+        utime(file_path, (1, 1))
+
+    def test_cache(self):
+        cache = CountCache(self.cache_path)
+        self.assertEqual(cache.get_many(self.file_paths), {})
+
+        cache.put_many({self.file_paths[0]: (1, 10),
+                        self.file_paths[1]: (2, 20)})
+        self.assertEqual(cache.get(self.file_paths[0]), (1, 10))
+        self.assertIsNone(cache.get(self.file_paths[2]))
+
+        # counts persist between instances.
+        cache = CountCache(self.cache_path)
+        cache.query_size = 1
+        self.assertEqual(cache.get_many(self.file_paths),
+                         {self.file_paths[0]: (1, 10),
+                          self.file_paths[1]: (2, 20)})
+
+        # files that change size or mtime are counted again.
+        self._write(self.file_paths[0], 'AAAA')
+        self.assertIsNone(cache.get(self.file_paths[0]))
+        utime(self.file_paths[1], (2, 2))
+        self.assertIsNone(cache.get(self.file_paths[1]))
+        utime(self.file_paths[1], (1, 1))
+        self.assertEqual(cache.get(self.file_paths[1]), (2, 20))
+
+        # as are files that are replaced, even by an identical file.
+        tmp_path = join(self.output_path, 'tmp')
+        self._write(tmp_path, 'AA')
+        rename(tmp_path, self.file_paths[1])
+        self.assertIsNone(cache.get(self.file_paths[1]))
+
+        # files that no longer exist aren't returned.
+        cache.put_many({self.file_paths[2]: (3, 30)})
+        remove(self.file_paths[2])
+        self.assertIsNone(cache.get(self.file_paths[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from sequence_processing_pipeline.Executor import (LocalExecutor,
+                                                   parse_sbatch_options,
+                                                   parse_array_spec,
+                                                   parse_time_limit)
+from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.PipelineError import JobFailedError
+from os.path import abspath, join, exists
+from functools import partial
+from shutil import rmtree
+
+
+class TestExecutor(unittest.TestCase):
+    def test_parse_sbatch_options(self):
+        obs = parse_sbatch_options(['--parsable', '-J', 'foo',
+                                    '--array=1-4%2', '--export',
+                                    'PREFIX=/a,OUTPUT=/b', '-N', '1'])
+        exp = {'parsable': True, 'J': 'foo', 'array': '1-4%2',
+               'export': 'PREFIX=/a,OUTPUT=/b', 'N': '1'}
+        self.assertDictEqual(obs, exp)
+
+    def test_parse_array_spec(self):
+        self.assertEqual(parse_array_spec('1-4'), ([1, 2, 3, 4], None))
+        self.assertEqual(parse_array_spec('1-10%3'),
+                         (list(range(1, 11)), 3))
+        self.assertEqual(parse_array_spec('1,3,5-9:2'),
+                         ([1, 3, 5, 7, 9], None))
+
+        with self.assertRaisesRegex(ValueError, "'1-' is not a valid"):
+            parse_array_spec('1-')
+
+    def test_parse_time_limit(self):
+        self.assertEqual(parse_time_limit('1440'), 86400)
+        self.assertEqual(parse_time_limit('10:30'), 630)
+        self.assertEqual(parse_time_limit('1:00:00'), 3600)
+        self.assertEqual(parse_time_limit('2-01'), 176400)
+
+
+class TestLocalExecutor(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('local_executor_output')
+
+        self.job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                       self.output_path, 'LocalJob', [], 1000)
+        self.job.executor = LocalExecutor(max_workers=2)
+
+    def tearDown(self):
+        rmtree(self.output_path)
+
+    def _write_script(self, name, lines):
+        script_path = join(self.job.output_path, name)
+        with open(script_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return script_path
+
+    def test_array_job(self):
+        script_path = self._write_script('array.sh', [
+            '#!/bin/bash',
+            '#SBATCH -J array_test',
+            '#SBATCH --array 1-5%2',
+            f'#SBATCH --output {self.job.log_path}/%x_%A_%a.out',
+            'echo "${SLURM_ARRAY_TASK_ID} ${PREFIX}"',
+            'echo "error" 1>&2'])
+
+        obs = self.job.submit_job(script_path,
+                                  job_parameters='--export PREFIX=foo',
+                                  exec_from=self.job.log_path)
+
+        self.assertEqual(obs['job_state'], {'COMPLETED': 5})
+
+        job_id = obs['job_id']
+        for task_id in range(1, 6):
+            log_path = join(self.job.log_path,
+                            f'array_test_{job_id}_{task_id}.out')
+            with open(log_path, 'r') as f:
+                self.assertEqual(f.read(), f'{task_id} foo\nerror\n')
+
+        self.assertDictEqual(self.job._query_slurm([job_id]),
+                             {f'{job_id}_{x}': 'COMPLETED' for x in
+                              range(1, 6)})
+
+    def test_failed_jobs(self):
+        script_path = self._write_script('fail.sh', [
+            '#!/bin/bash',
+            'if [[ ${SLURM_ARRAY_TASK_ID} == 2 ]]; then exit 1; fi',
+            'touch task_${SLURM_ARRAY_TASK_ID}.done'])
+
+        with self.assertRaisesRegex(JobFailedError, 'exited with jobs in the '
+                                                    'following states: '):
+            self.job.submit_job(script_path, job_parameters='--array 1-3',
+                                exec_from=self.job.output_path)
+
+        for task_id, expected in [(1, True), (2, False), (3, True)]:
+            self.assertEqual(exists(join(self.job.output_path,
+                                         f'task_{task_id}.done')), expected)
+
+        # non-array jobs report a single state and log to slurm-%j.out.
+        script_path = self._write_script('timeout.sh', [
+            '#!/bin/bash',
+            '#SBATCH --time 0:01',
+            'sleep 10'])
+
+        job_id = self.job.submit_job(script_path, wait=False,
+                                     exec_from=self.job.log_path)
+
+        with self.assertRaisesRegex(JobFailedError, f'job {job_id} exited '
+                                                    'with status TIMEOUT'):
+            self.job.wait(job_id)
+
+        self.assertTrue(exists(join(self.job.log_path,
+                                    f'slurm-{job_id}.out')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,14 @@
 import unittest
+from sys import executable
 from os.path import join, exists, isfile
 from functools import partial
 from sequence_processing_pipeline.FastQCJob import FastQCJob
+from sequence_processing_pipeline.JobDriver import JobDriver
 from sequence_processing_pipeline.PipelineError import (PipelineError,
                                                         JobFailedError)
-from os import makedirs, listdir, mkdir
+from os import makedirs, listdir, mkdir, utime
 from shutil import rmtree, move
-from json import load
+from json import load, dumps
 
 
 class TestFastQCJob(unittest.TestCase):
@@ -600,15 +602,17 @@ class TestFastQCJob(unittest.TestCase):
                "cd sequence_processing_pipeline/tests/data/output_dir2/"
                "FastQCJob", "", "module load my_module.1.1", "",
                "step=${SLURM_ARRAY_TASK_ID}",
-               "cmd0=$(head -n $step sequence_processing_pipeline/tests/data/"
-               "output_dir2/FastQCJob/FastQCJob.array-details | tail -n 1)",
-               "eval $cmd0", "echo \"Cmd Completed: $cmd0\" > logs/FastQCJob_"
-               "$step.completed"]
+               f"{executable} {job.task_runner_path} --manifest sequence_"
+               "processing_pipeline/tests/data/output_dir2/FastQCJob/FastQCJob"
+               ".tasks.json --task $step --cores 16 --threads-per-command 16 "
+               "--results logs/FastQCJob_$step.results.json --completed "
+               "logs/FastQCJob_$step.completed"]
 
         with open(job_script_path, 'r') as f:
             obs = f.readlines()
             obs = [x.strip() for x in obs]
 
+        self.assertEqual(len(obs), len(exp))
         for a, b in zip(obs, exp):
             self.assertEqual(a, b)
 
@@ -646,6 +650,141 @@ class TestFastQCJob(unittest.TestCase):
         for a, b in zip(obs, exp):
             self.assertEqual(a, b)
 
+    def test_pack_by_size(self):
+        job = FastQCJob(self.qc_root_path, self.output_path,
+                        self.raw_fastq_files_path.replace('/project1', ''),
+                        self.processed_fastq_files_path,
+                        16, 16,
+                        'sequence_processing_pipeline/tests/bin/fastqc',
+                        ['my_module.1.1'], self.qiita_job_id, 'queue_name',
+                        4, 23, '8g', 30, 1000, False, pack_by_size=True,
+                        min_bytes_per_task=1)
+
+        self.assertEqual(len(job.command_sizes), 4)
+
+        # the test fastq files are empty, hence all four commands are
+        # collapsed into a single array task.
+        self.assertEqual(job.commands,
+                         [';'.join(sorted(job.command_sizes))])
+
+        with open(join(job.output_path, 'FastQCJob.sh'), 'r') as f:
+            self.assertIn('#SBATCH --array 1-1%30\n', f.read())
+
+        with open(join(job.output_path, 'FastQCJob.tasks.json'), 'r') as f:
+            self.assertEqual(load(f), {'1': sorted(job.command_sizes)})
+
+        # w/16 cores and 4 threads per command, the four commands run at
+        # once and need four times the memory.
+        job = FastQCJob(self.qc_root_path, self.output_path,
+                        self.raw_fastq_files_path.replace('/project1', ''),
+                        self.processed_fastq_files_path,
+                        16, 4,
+                        'sequence_processing_pipeline/tests/bin/fastqc',
+                        ['my_module.1.1'], self.qiita_job_id, 'queue_name',
+                        4, 23, '8g', 30, 1000, False, pack_by_size=True,
+                        min_bytes_per_task=1)
+
+        with open(join(job.output_path, 'FastQCJob.sh'), 'r') as f:
+            self.assertIn('#SBATCH --mem 32gG\n', f.read())
+
+    def test_native_qc(self):
+        job = FastQCJob(self.qc_root_path, self.output_path,
+                        self.raw_fastq_files_path.replace('/project1', ''),
+                        self.processed_fastq_files_path,
+                        16, 16, 'fastqc-is-not-required',
+                        ['my_module.1.1'], self.qiita_job_id, 'queue_name',
+                        4, 23, '8g', 30, 2, False, native_qc=True)
+
+        # four pairs of files are processed in two array tasks, each
+        # running a single command w/a pool of nprocs processes.
+        self.assertEqual(len(job.commands), 2)
+        for cmd in job.commands:
+            self.assertTrue(cmd.startswith(f'{executable} -m sequence_'
+                                           'processing_pipeline.scripts.cli'
+                                           ' fastq-qc --processes 16 --input'))
+            self.assertNotIn(';', cmd)
+            self.assertEqual(cmd.count('--input'), 4)
+
+        self.assertIn(f'--input {self.raw_fastq_files_path}/sample1_R1_.'
+                      f'fastq.gz {job.output_path}/fastqc/project1/bclconvert',
+                      job.commands[0])
+
+        # the inputs' sizes are only gathered w/pack_by_size.
+        self.assertEqual(job.command_sizes, {})
+
+    def test_skip_processed_fastq(self):
+        job = FastQCJob(self.qc_root_path, self.output_path,
+                        self.raw_fastq_files_path.replace('/project1', ''),
+                        self.processed_fastq_files_path,
+                        16, 16,
+                        'sequence_processing_pipeline/tests/bin/fastqc',
+                        ['my_module.1.1'], self.qiita_job_id, 'queue_name',
+                        4, 23, '8g', 30, 1000, False,
+                        skip_processed_fastq=True)
+
+        # only the two pairs of raw files are processed.
+        self.assertEqual(len(job.commands), 2)
+        for cmd in job.commands:
+            self.assertIn('/Data/Fastq/project1/', cmd)
+            self.assertNotIn('filtered_sequences', cmd)
+
+    def test_use_cache(self):
+        def make_job():
+            return FastQCJob(self.qc_root_path, self.output_path,
+                             self.raw_fastq_files_path.replace('/project1',
+                                                               ''),
+                             self.processed_fastq_files_path,
+                             16, 16,
+                             'sequence_processing_pipeline/tests/bin/fastqc',
+                             [], self.qiita_job_id, 'queue_name', 4, 23,
+                             '8g', 30, 1000, False, use_cache=True)
+
+        job = make_job()
+        self.assertEqual(job.tool_version,
+                         'Hello. I am a fake fastqc binary.')
+        self.assertEqual(len(job.commands), 4)
+
+        # simulate the reports written by the first three commands.
+        for cmd in job.commands[:3]:
+            for output_path in job.cache_entries[cmd][1]:
+                with open(output_path, 'w') as f:
+                    f.write('report')
+
+        # the fourth task failed.
+        job._cache_completed_commands([4])
+        self.assertTrue(exists(join(job.output_path, 'FastQCJob.cache.json')))
+
+        # only the failed command is run again.
+        job = make_job()
+        self.assertEqual(len(job.commands), 1)
+
+        # changing a report or an input invalidates the cached result.
+        cmd = list(job.cache_entries)[0]
+        for output_path in job.cache_entries[cmd][1]:
+            with open(output_path, 'w') as f:
+                f.write('report')
+        job._cache_completed_commands([])
+
+        job = make_job()
+        self.assertEqual(job.commands, [])
+        self.assertIsNone(job._generate_job_script())
+        self.assertEqual(job.run(), {'job_id': None,
+                                     'job_state': 'COMPLETED'})
+
+        # JobDriver doesn't submit it either.
+        driver = JobDriver()
+        self.assertEqual(driver.run([make_job()]),
+                         [{'job_id': None, 'job_state': 'COMPLETED'}])
+        driver.shutdown()
+        self.assertTrue(exists(join(job.output_path, 'job_completed')))
+
+        input_path = join(self.raw_fastq_files_path, 'sample1_R1_.fastq.gz')
+        utime(input_path)
+
+        job = make_job()
+        self.assertEqual(len(job.commands), 1)
+        self.assertIn(input_path, job.commands[0])
+
     def test_audit(self):
         job = FastQCJob(self.qc_root_path, self.output_path,
                         self.raw_fastq_files_path.replace('/project1', ''),
@@ -1151,6 +1290,28 @@ class TestFastQCJob(unittest.TestCase):
                    "failed_indexes": [3, 4]}
             self.assertDictEqual(obs, exp)
 
+        # when task_runner.py results are available, the commands that
+        # failed are reported as well.
+        with open(join(my_path, 'FastQCJob_3.results.json'), 'w') as f:
+            f.write(dumps({'task': 3, 'commands': [
+                {'index': 0, 'command': 'fastqc a', 'return_code': 0},
+                {'index': 1, 'command': 'fastqc b', 'return_code': 2}]}))
+
+        self.assertEqual(job._get_failed_indexes('2345.barnacle'), [3, 4])
+
+        with open(log_fp, 'r') as f:
+            obs = load(f)
+            exp = {"job_id": "2345.barnacle",
+                   "failed_indexes": [3, 4],
+                   "failed_commands": [{"index": 3, "command": "fastqc b",
+                                        "return_code": 2}]}
+            self.assertDictEqual(obs, exp)
+
+        with open(join(job.output_path, 'FastQCJob.tasks.json'), 'r') as f:
+            obs = load(f)
+            self.assertEqual(list(obs.keys()), ['1', '2', '3', '4'])
+            self.assertEqual([len(x) for x in obs.values()], [1, 1, 1, 1])
+
     def test_error_msg_from_logs(self):
         job = FastQCJob(self.qc_root_path, self.output_path,
                         self.raw_fastq_files_path.replace('/project1', ''),
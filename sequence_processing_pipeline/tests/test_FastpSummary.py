@@ -0,0 +1,134 @@
+import unittest
+from click.testing import CliRunner
+from sequence_processing_pipeline.FastpSummary import (COLUMNS,
+                                                       find_fastp_reports,
+                                                       load_fastp_report,
+                                                       summarize_fastp_reports,
+                                                       write_fastp_summary)
+from sequence_processing_pipeline.FileManifest import FileManifest
+from sequence_processing_pipeline.scripts.cli import fastp_summary
+from os import makedirs
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree
+from json import dumps
+import pandas as pd
+
+
+class TestFastpSummary(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.root = self.path('fastp_summary_test')
+
+        self.reports = []
+        for project, samples in [('Project_1', ['A', 'B']),
+                                 ('Project_2', ['C'])]:
+            json_dir = join(self.root, project, 'fastp_reports_dir', 'json')
+            makedirs(json_dir)
+            makedirs(join(self.root, project, 'fastp_reports_dir', 'html'))
+
+            for i, sample in enumerate(samples):
+                report_path = join(json_dir, f'{sample}_S{i}_L001_R1_001.'
+                                             'json')
+                with open(report_path, 'w') as f:
+                    f.write(dumps(self._report(i)))
+                self.reports.append(report_path)
+
+        # files that aren't fastp reports are ignored.
+        with open(join(self.root, 'Project_1', 'fastp_reports_dir', 'html',
+                       'A_S0_L001_R1_001.json'), 'w') as f:
+            f.write('{}')
+
+        FileManifest.clear()
+
+    def tearDown(self):
+        FileManifest.clear()
+        rmtree(self.root)
+
+    def _report(self, i):
+        report = {
+            'summary': {
+                'fastp_version': '0.23.4',
+                'before_filtering': {'total_reads': 1000 + i,
+                                     'total_bases': 151000,
+                                     'q20_rate': 0.98, 'q30_rate': 0.95,
+                                     'read1_mean_length': 151,
+                                     'read2_mean_length': 151,
+                                     'gc_content': 0.45},
+                'after_filtering': {'total_reads': 900 + i,
+                                    'total_bases': 130000,
+                                    'q20_rate': 0.99, 'q30_rate': 0.97,
+                                    'read1_mean_length': 145,
+                                    'read2_mean_length': 144,
+                                    'gc_content': 0.44}},
+            'filtering_result': {'passed_filter_reads': 900 + i,
+                                 'low_quality_reads': 50,
+                                 'too_many_N_reads': 10,
+                                 'too_short_reads': 40,
+                                 'too_long_reads': 0},
+            'duplication': {'rate': 0.01},
+            'insert_size': {'peak': 200, 'histogram': [0] * 100},
+            'read1_before_filtering': {'quality_curves': {'A': [30.0] * 151}}}
+
+        if i == 0:
+            report['adapter_cutting'] = {'adapter_trimmed_reads': 25,
+                                         'adapter_trimmed_bases': 700}
+
+        return report
+
+    def test_find_fastp_reports(self):
+        self.assertEqual(find_fastp_reports([self.root]), sorted(self.reports))
+        self.assertEqual(find_fastp_reports([self.reports[0], self.root]),
+                         sorted(self.reports))
+
+    def test_load_fastp_report(self):
+        obs = load_fastp_report(self.reports[0])
+
+        self.assertEqual(set(obs), set(COLUMNS))
+        self.assertEqual(obs['project'], 'Project_1')
+        self.assertEqual(obs['sample'], 'A')
+        self.assertEqual(obs['file'], 'A_S0_L001_R1_001.json')
+        self.assertEqual(obs['reads_before'], 1000)
+        self.assertEqual(obs['reads_after'], 900)
+        self.assertEqual(obs['q30_rate_after'], 0.97)
+        self.assertEqual(obs['too_many_n_reads'], 10)
+        self.assertEqual(obs['duplication_rate'], 0.01)
+        self.assertEqual(obs['adapter_trimmed_bases'], 700)
+        self.assertEqual(obs['insert_size_peak'], 200)
+
+        # no adapters were trimmed.
+        obs = load_fastp_report(self.reports[1])
+        self.assertEqual(obs['adapter_trimmed_reads'], 0)
+
+    def test_summarize_fastp_reports(self):
+        reports = find_fastp_reports([self.root])
+        exp = summarize_fastp_reports(reports)
+
+        self.assertEqual(list(exp.columns), COLUMNS)
+        self.assertEqual(exp['project'].tolist(),
+                         ['Project_1', 'Project_1', 'Project_2'])
+        self.assertEqual(exp['sample'].tolist(), ['A', 'B', 'C'])
+        self.assertEqual(exp['reads_before'].tolist(), [1000, 1001, 1000])
+
+        obs = summarize_fastp_reports(list(reversed(reports)), processes=2)
+        pd.testing.assert_frame_equal(obs, exp)
+
+        self.assertTrue(summarize_fastp_reports([]).empty)
+
+        output_path = join(self.root, 'summary.tsv')
+        write_fastp_summary(exp, output_path)
+        obs = pd.read_csv(output_path, sep='\t')
+        self.assertEqual(list(obs.columns), COLUMNS)
+        self.assertEqual(obs['adapter_trimmed_reads'].tolist(), [25, 0, 25])
+
+        output_path = join(self.root, 'cli_summary.tsv')
+        result = CliRunner().invoke(fastp_summary, [self.root, '--output',
+                                                    output_path])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('3 fastp reports summarized', result.output)
+        self.assertEqual(len(pd.read_csv(output_path, sep='\t')), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
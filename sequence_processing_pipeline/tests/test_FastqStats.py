@@ -0,0 +1,156 @@
+import unittest
+from click.testing import CliRunner
+from sequence_processing_pipeline.FastqStats import (FastqStats, fastqc_name,
+                                                     run_qc_parallel)
+from sequence_processing_pipeline.scripts.cli import fastq_qc
+from os import makedirs
+from os.path import abspath, exists, join
+from functools import partial
+from shutil import rmtree
+from zipfile import ZipFile
+import gzip
+
+
+class TestFastqStats(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('fastq_stats_output')
+        makedirs(self.output_path, exist_ok=True)
+
+        self.fastq = ('@r1\nACGTN\n+\nIIIII\n'
+                      '@r2\nGGGG\n+\n####\n'
+                      '@r3 comment\nACGTN\n+r3\nIIIII\n')
+
+        self.fastq_path = join(self.output_path, 'SAMPLE_R1_001.fastq.gz')
+        with gzip.open(self.fastq_path, 'wt') as f:
+            f.write(self.fastq)
+
+    def tearDown(self):
+        rmtree(self.output_path)
+
+    def _stats(self, block_size=None):
+        stats = FastqStats()
+        if block_size:
+            stats.block_size = block_size
+        stats.add_file(self.fastq_path)
+        return stats
+
+    def test_fastqc_name(self):
+        self.assertEqual(fastqc_name('/a/b_R1_001.fastq.gz'),
+                         'b_R1_001_fastqc')
+        self.assertEqual(fastqc_name('b_R1.fq'), 'b_R1_fastqc')
+
+    def test_statistics(self):
+        stats = self._stats()
+
+        self.assertEqual(stats.read_count, 3)
+        self.assertEqual(stats.length_distribution(), [(4, 1), (5, 2)])
+
+        obs = stats.basic_statistics('a.fastq.gz')
+        self.assertIn(('Total Sequences', 3), obs)
+        self.assertIn(('Sequence length', '4-5'), obs)
+        # 8 of 12 called bases are G or C.
+        self.assertIn(('%GC', 67), obs)
+
+        obs = stats.per_base_quality()
+        self.assertEqual(len(obs), 5)
+        self.assertEqual(obs[0], (1, 27.33, 40, 2, 40, 2, 40))
+        self.assertEqual(obs[4], (5, 40.0, 40, 40, 40, 40, 40))
+
+        self.assertEqual(stats.per_sequence_quality()[0], (2, 1))
+        self.assertEqual(stats.per_sequence_quality()[-1], (40, 2))
+
+        obs = stats.per_base_content()
+        self.assertEqual(obs[0], (1, 33.33, 66.67, 0.0, 0.0))
+        # position 5 is only N's.
+        self.assertEqual(len(obs), 4)
+
+        self.assertEqual(stats.per_base_n_content()[4], (5, 100.0))
+
+        obs = dict(stats.per_sequence_gc())
+        self.assertEqual(obs[50], 2)
+        self.assertEqual(obs[100], 1)
+        self.assertEqual(sum(obs.values()), 3)
+
+        remaining, levels = stats.duplication_levels()
+        self.assertEqual(remaining, 66.67)
+        self.assertEqual(levels[0], ('1', 50.0, 33.33))
+        self.assertEqual(levels[1], ('2', 50.0, 66.67))
+
+        self.assertEqual(stats.overrepresented_sequences(),
+                         [('ACGTN', 2, 66.67, 'No Hit'),
+                          ('GGGG', 1, 33.33, 'No Hit')])
+
+        # records split across blocks are counted once.
+        small = self._stats(block_size=7)
+        self.assertEqual(small.read_count, 3)
+        self.assertEqual(small.modules('a'), stats.modules('a'))
+
+    def test_malformed(self):
+        stats = FastqStats()
+        with self.assertRaisesRegex(ValueError, 'malformed'):
+            stats.add_block(b'r1\nACGT\n+\nIIII\n')
+        with self.assertRaisesRegex(ValueError, 'differing lengths'):
+            stats.add_block(b'@r1\nACGT\n+\nIII\n')
+
+        # records w/o a final newline are accepted; truncated ones are not.
+        with open(join(self.output_path, 'a.fastq'), 'w') as f:
+            f.write(self.fastq.strip())
+        stats.add_file(join(self.output_path, 'a.fastq'))
+        self.assertEqual(stats.read_count, 3)
+
+        with open(join(self.output_path, 'b.fastq'), 'w') as f:
+            f.write(self.fastq + '@r4\nACGT\n')
+        with self.assertRaisesRegex(ValueError, 'truncated record'):
+            FastqStats().add_file(join(self.output_path, 'b.fastq'))
+
+    def test_write(self):
+        zip_path = self._stats().write(self.output_path,
+                                       'SAMPLE_R1_001.fastq.gz')
+
+        self.assertEqual(zip_path, join(self.output_path,
+                                        'SAMPLE_R1_001_fastqc.zip'))
+        self.assertTrue(exists(join(self.output_path,
+                                    'SAMPLE_R1_001_fastqc.html')))
+
+        with ZipFile(zip_path) as z:
+            self.assertEqual(sorted(z.namelist()),
+                             ['SAMPLE_R1_001_fastqc/fastqc_data.txt',
+                              'SAMPLE_R1_001_fastqc/fastqc_report.html',
+                              'SAMPLE_R1_001_fastqc/summary.txt'])
+            data = z.read('SAMPLE_R1_001_fastqc/fastqc_data.txt').decode()
+            summary = z.read('SAMPLE_R1_001_fastqc/summary.txt').decode()
+
+        lines = data.split('\n')
+        self.assertEqual(lines[0], '##FastQC\t0.11.9')
+        self.assertEqual(lines[1], '>>Basic Statistics\tpass')
+        self.assertIn('Filename\tSAMPLE_R1_001.fastq.gz', lines)
+        self.assertIn('>>Per base sequence quality\tfail', lines)
+        self.assertIn('1\t27.33\t40\t2\t40\t2\t40', lines)
+        self.assertIn('#Total Deduplicated Percentage\t66.67', lines)
+        self.assertEqual(data.count('>>END_MODULE'), 9)
+
+        self.assertIn('PASS\tBasic Statistics\tSAMPLE_R1_001.fastq.gz\n',
+                      summary)
+
+    def test_run_qc_parallel(self):
+        inputs = []
+        for i in range(3):
+            output_dir = join(self.output_path, f'project{i}')
+            inputs.append((self.fastq_path, output_dir))
+
+        obs = run_qc_parallel(inputs, processes=2)
+        self.assertEqual(obs, [join(x, 'SAMPLE_R1_001_fastqc.zip')
+                               for _, x in inputs])
+        self.assertTrue(all([exists(x) for x in obs]))
+
+        output_dir = join(self.output_path, 'cli')
+        result = CliRunner().invoke(fastq_qc, ['--input', self.fastq_path,
+                                               output_dir])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(exists(join(output_dir, 'SAMPLE_R1_001_fastqc.zip')))
+
+
+if __name__ == '__main__':
+    unittest.main()
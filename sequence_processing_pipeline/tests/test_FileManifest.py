@@ -0,0 +1,150 @@
+import unittest
+from sequence_processing_pipeline.FileManifest import (FileManifest,
+                                                       extract_sample_id)
+from os import makedirs, remove, walk, utime
+from os.path import abspath, join, relpath
+from functools import partial
+from shutil import rmtree
+
+
+class TestFileManifest(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.root = self.path('file_manifest_test')
+
+        for project in ['Project_12345', 'Project_67890']:
+            fp = join(self.root, project, 'trimmed_sequences')
+            makedirs(fp)
+            for sample in ['SAMPLE_1', 'SAMPLE_2']:
+                for read in ['R1', 'R2']:
+                    with open(join(fp, f'{sample}_S1_L001_{read}_001.'
+                                       'fastq.gz'), 'w') as f:
+                        f.write(sample)
+
+        FileManifest.clear()
+
+    def tearDown(self):
+        FileManifest.clear()
+        rmtree(self.root)
+
+    def _walk(self, search_path):
+        results = []
+        for root, dirs, files in walk(search_path):
+            results += [join(root, x) for x in files]
+        return results
+
+    def _age(self, path):
+        # make path look like it hasn't been modified in a while.
+        utime(path, (0, 0))
+
+    def test_extract_sample_id(self):
+        self.assertEqual(extract_sample_id('SAMPLE_1_S1_L001_R1_001.'
+                                           'trimmed.fastq.gz'), 'SAMPLE_1')
+        self.assertEqual(extract_sample_id('LS_8_22_2014_R1_SRE_S3_L007_'
+                                           'R2_001.fastq.gz'),
+                         'LS_8_22_2014_R1_SRE')
+        self.assertEqual(extract_sample_id('a.R1.fastq'), 'a')
+        self.assertIsNone(extract_sample_id('multiqc_report.html'))
+
+    def test_get(self):
+        manifest = FileManifest.get(self.root)
+        self.assertIs(FileManifest.get(join(self.root, 'Project_12345')),
+                      manifest)
+        self.assertIsNot(FileManifest.get(self.path()), manifest)
+
+    def test_get_evicts(self):
+        max_manifests = FileManifest.max_manifests
+        FileManifest.max_manifests = 2
+        try:
+            p1, p2 = [join(self.root, x) for x in ['Project_12345',
+                                                   'Project_67890']]
+            m1 = FileManifest.get(p1)
+            m2 = FileManifest.get(p2)
+
+            # p1 was used more recently than p2, hence p2 is forgotten.
+            self.assertIs(FileManifest.get(p1), m1)
+            FileManifest.get(self.path('output_dir'))
+            self.assertEqual(len(FileManifest._manifests), 2)
+            self.assertIs(FileManifest.get(p1), m1)
+            self.assertIsNot(FileManifest.get(p2), m2)
+        finally:
+            FileManifest.max_manifests = max_manifests
+
+    def test_entries(self):
+        manifest = FileManifest.get(self.root)
+
+        # results should match os.walk(), including order.
+        self.assertEqual(manifest.find_files(self.root),
+                         self._walk(self.root))
+
+        sub_dir = join(self.root, 'Project_12345')
+        self.assertEqual(manifest.find_files(sub_dir), self._walk(sub_dir))
+
+        # paths begin w/search_path as given.
+        rel_dir = relpath(sub_dir)
+        self.assertEqual(manifest.find_files(rel_dir), self._walk(rel_dir))
+
+        obs = manifest.entries(join(sub_dir, 'trimmed_sequences'))
+        obs = sorted([(relpath(x.path, sub_dir), x.size, x.orientation,
+                       x.sample_id) for x in obs])
+        exp = [('trimmed_sequences/SAMPLE_1_S1_L001_R1_001.fastq.gz', 8,
+                'R1', 'SAMPLE_1'),
+               ('trimmed_sequences/SAMPLE_1_S1_L001_R2_001.fastq.gz', 8,
+                'R2', 'SAMPLE_1'),
+               ('trimmed_sequences/SAMPLE_2_S1_L001_R1_001.fastq.gz', 8,
+                'R1', 'SAMPLE_2'),
+               ('trimmed_sequences/SAMPLE_2_S1_L001_R2_001.fastq.gz', 8,
+                'R2', 'SAMPLE_2')]
+        self.assertEqual(obs, exp)
+
+        self.assertEqual(manifest.find_files(self.root,
+                                             suffix='R1_001.fastq.gz'),
+                         [x for x in self._walk(self.root) if
+                          x.endswith('R1_001.fastq.gz')])
+
+        self.assertEqual(manifest.find_files(join(self.root, 'nope')), [])
+
+        with self.assertRaisesRegex(ValueError, 'is not in'):
+            manifest.find_files(self.path())
+
+    def test_refresh(self):
+        manifest = FileManifest.get(self.root)
+        manifest.find_files()
+
+        # unchanged directories are not rescanned.
+        for fp in manifest.directories:
+            self._age(fp)
+        manifest.find_files()
+        scanned = {k: v.scanned_at for k, v in manifest.directories.items()}
+
+        trimmed = join(self.root, 'Project_12345', 'trimmed_sequences')
+        new_file = join(trimmed, 'SAMPLE_3_S1_L001_R1_001.fastq.gz')
+        with open(new_file, 'w') as f:
+            f.write('SAMPLE_3')
+
+        self.assertIn(new_file, manifest.find_files())
+        for fp, scanned_at in scanned.items():
+            if fp == trimmed:
+                self.assertGreater(manifest.directories[fp].scanned_at,
+                                   scanned_at)
+            else:
+                self.assertEqual(manifest.directories[fp].scanned_at,
+                                 scanned_at)
+
+        # a directory modified moments before it was scanned is rescanned,
+        # even if its mtime hasn't changed since.
+        scanned_at = manifest.directories[trimmed].scanned_at
+        manifest.find_files()
+        self.assertGreater(manifest.directories[trimmed].scanned_at,
+                           scanned_at)
+
+        remove(new_file)
+        rmtree(join(self.root, 'Project_67890'))
+        self.assertEqual(manifest.find_files(), self._walk(self.root))
+        self.assertNotIn(join(self.root, 'Project_67890', 'trimmed_sequences'),
+                         manifest.directories)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,11 @@
 import unittest
-from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.Job import Job, RotatingWriter
 from sequence_processing_pipeline.PipelineError import PipelineError
 from os.path import abspath, join, dirname, split, isdir, exists
 from os import makedirs, chmod, remove
 from functools import partial
 from shutil import rmtree, copyfile
+from json import load
 import re
 
 
@@ -50,8 +51,8 @@ class TestJob(unittest.TestCase):
         obs = job._system_call('ls ' + join(package_root, 'tests', 'bin'),
                                callback=my_callback)
 
-        exp = ['bcl2fastq\nbcl-convert\nfastqc\n',
-               'bcl-convert\nbcl2fastq\nfastqc\n']
+        exp = ['bcl2fastq\nbcl-convert\nfastqc\nmultiqc\n',
+               'bcl-convert\nbcl2fastq\nfastqc\nmultiqc\n']
 
         self.assertIn(obs['stdout'], exp)
         self.assertEqual(obs['stderr'], '')
@@ -71,6 +72,124 @@ class TestJob(unittest.TestCase):
 
         self.remove_these.append(output_dir)
 
+    def test_system_call_stream(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+
+        output_dir = self.path('my_output_dir')
+        self.remove_these.append(output_dir)
+
+        job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                  output_dir, '200nnn_xnnnnn_nnnn_xxxxxxxxxx',
+                  ['ls'], 1000, None)
+
+        job.stream_max_bytes = 1000
+        job.stream_backup_count = 2
+        job.stream_tail_lines = 5
+        job.stream_progress_interval_in_seconds = 0
+
+        callback_results = []
+
+        def my_callback(jid=None, status=None):
+            callback_results.append(status)
+
+        stream_to = join(job.log_path, 'seq')
+        obs = job._system_call('seq 1 200; echo done 1>&2',
+                               callback=my_callback, stream_to=stream_to)
+
+        self.assertEqual(obs['return_code'], 0)
+        self.assertEqual(obs['stdout'], '196\n197\n198\n199\n200\n')
+        self.assertEqual(obs['stderr'], 'done\n')
+        self.assertEqual(obs['stdout_path'], stream_to + '.stdout')
+        self.assertEqual(obs['stderr_path'], stream_to + '.stderr')
+
+        # 200 lines take 692 bytes, hence the stdout file is never rotated.
+        self.assertEqual(RotatingWriter.read(obs['stdout_path']),
+                         ''.join([f'{i}\n' for i in range(1, 201)]))
+        self.assertFalse(exists(stream_to + '.stdout.1'))
+
+        self.assertEqual(callback_results[0], 'RUNNING')
+        self.assertEqual(callback_results[-1], 'COMPLETED')
+        self.assertIn('200', callback_results)
+
+        # output beyond the backup count is discarded.
+        obs = job._system_call('seq 1 1000', stream_to=stream_to)
+        self.assertTrue(exists(stream_to + '.stdout.2'))
+        self.assertFalse(exists(stream_to + '.stdout.3'))
+        obs = RotatingWriter.read(obs['stdout_path']).split()
+        self.assertEqual(obs[-1], '1000')
+        self.assertLess(len(obs), 1000)
+
+        # rotated files from the previous call aren't mixed into the output
+        # of the next one, while stdout_callback sees every line.
+        lines = []
+        obs = job._system_call('seq 1 250', stream_to=stream_to,
+                               stdout_callback=lines.append)
+        self.assertFalse(exists(stream_to + '.stdout.1'))
+        self.assertEqual(RotatingWriter.read(obs['stdout_path']),
+                         ''.join([f'{i}\n' for i in range(1, 251)]))
+        obs = job._system_call('seq 1 1000', stream_to=stream_to,
+                               stdout_callback=lines.append)
+        self.assertEqual(lines, [f'{i}\n' for i in range(1, 251)] +
+                                [f'{i}\n' for i in range(1, 1001)])
+
+        # a stdout_callback that raises fails the call, rather than the
+        # call succeeding w/some of the output unprocessed. The rest of the
+        # output is still drained to the file, so the command can finish.
+        lines = []
+
+        def bad_callback(line):
+            if line == '10\n':
+                raise ValueError('not enough values to unpack')
+            lines.append(line)
+
+        with self.assertRaisesRegex(PipelineError, 'not enough values to '
+                                                   'unpack'):
+            job._system_call('seq 1 100000', stream_to=stream_to,
+                             stdout_callback=bad_callback)
+        self.assertEqual(lines, [f'{i}\n' for i in range(1, 10)])
+        obs = RotatingWriter.read(stream_to + '.stdout').split()
+        self.assertEqual(obs[-1], '100000')
+
+        with self.assertRaisesRegex(PipelineError, r'return code: 1\nstdout:'
+                                                   r' 6\n7\n8\n9\n10\n\n'
+                                                   r'stderr: oops'):
+            job._system_call('seq 1 10; echo oops 1>&2; exit 1',
+                             stream_to=stream_to)
+
+    def test_which_all(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+
+        output_dir = self.path('my_output_dir')
+        self.remove_these.append(output_dir)
+
+        job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                  output_dir, '200nnn_xnnnnn_nnnn_xxxxxxxxxx',
+                  ['ls', 'sh'], 1000, None)
+
+        obs = job._which_all(['ls', 'sh', 'ls'])
+        self.assertEqual(list(obs.keys()), ['ls', 'sh'])
+        self.assertIn(obs['ls'], ['/bin/ls', '/usr/bin/ls'])
+        self.assertEqual(Job._which_cache[((), 'sh')], obs['sh'])
+
+        # paths already found are not looked up again.
+        calls = []
+
+        def _system_call(cmd, callback=None):
+            calls.append(cmd)
+            return {'stdout': '', 'stderr': '', 'return_code': 0}
+
+        job._system_call = _system_call
+        self.assertEqual(job._which('ls'), obs['ls'])
+        self.assertEqual(calls, [])
+
+        with self.assertRaisesRegex(PipelineError, "File 'not_a_real_exe' "
+                                                   "does not exist."):
+            job._which_all(['ls', 'not_a_real_exe'])
+        self.assertEqual(len(calls), 1)
+        self.assertNotIn(((), 'not_a_real_exe'), Job._which_cache)
+
     def test_group_commands(self):
         package_root = abspath('./sequence_processing_pipeline')
         self.path = partial(join, package_root, 'tests', 'data')
@@ -86,6 +205,96 @@ class TestJob(unittest.TestCase):
         self.assertEqual(results[1], '2;4;6')
         self.assertEqual(len(results), 2)
 
+    def test_group_commands_by_size(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+
+        job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                  self.path('my_output_dir'), '200nnn_xnnnnn_nnnn_xxxxxxxxxx',
+                  ['ls'], 3, None)
+        self.remove_these.append(self.path('my_output_dir'))
+
+        sizes = {'a': 10, 'b': 9, 'c': 8, 'd': 4, 'e': 3, 'f': 2, 'g': 1}
+
+        # each task should process a similar number of bytes.
+        obs = job._group_commands(list(sizes.keys()), sizes=sizes)
+        self.assertEqual(obs, ['a;f;g', 'b;e', 'c;d'])
+
+        # small commands are collapsed into fewer tasks.
+        obs = job._group_commands(list(sizes.keys()), sizes=sizes,
+                                  min_bytes_per_task=15)
+        self.assertEqual(obs, ['a;d;e;f', 'b;c;g'])
+
+        obs = job._group_commands(['a', 'b'], sizes={},
+                                  min_bytes_per_task=15)
+        self.assertEqual(obs, ['a;b'])
+
+        self.assertEqual(job._group_commands([], sizes={}), [])
+
+        # lists of commands are grouped as the chained commands are.
+        obs = job._group_command_lists(list(sizes.keys()), sizes=sizes)
+        self.assertEqual(obs, [['a', 'f', 'g'], ['b', 'e'], ['c', 'd']])
+
+    def test_write_task_manifest(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+
+        job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                  self.path('my_output_dir'), '200nnn_xnnnnn_nnnn_xxxxxxxxxx',
+                  ['ls'], 2, None)
+        self.remove_these.append(self.path('my_output_dir'))
+
+        # commands containing ';' aren't split apart.
+        cmds = ["echo 'a;b'", 'echo c', 'echo d']
+        manifest_path = join(job.output_path, 'tasks.json')
+        job._write_task_manifest(manifest_path,
+                                 job._group_command_lists(cmds))
+
+        with open(manifest_path, 'r') as f:
+            self.assertEqual(load(f), {'1': ["echo 'a;b'", 'echo d'],
+                                       '2': ['echo c']})
+
+    def test_task_memory(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+
+        job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                  self.path('my_output_dir'), '200nnn_xnnnnn_nnnn_xxxxxxxxxx',
+                  ['ls'], 2, None)
+        self.remove_these.append(self.path('my_output_dir'))
+
+        tasks = [['a', 'b', 'c'], ['d']]
+
+        # one command runs at a time.
+        self.assertEqual(job._task_memory('8g', 16, 16, tasks), '8g')
+        self.assertEqual(job._task_memory('8g', 16, 8, [['a'], ['b']]), '8g')
+
+        # up to four commands run at once, but no task has more than three.
+        self.assertEqual(job._task_memory('8g', 16, 4, tasks), '24g')
+        self.assertEqual(job._task_memory(8, 16, 8, tasks), '16')
+        self.assertEqual(job._task_memory('2.5', 16, 8, tasks), '5')
+
+        with self.assertRaisesRegex(PipelineError, "'lots' is not a valid "
+                                                   "amount of memory"):
+            job._task_memory('lots', 16, 8, tasks)
+
+    def test_total_size(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+
+        job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                  self.path('my_output_dir'), '200nnn_xnnnnn_nnnn_xxxxxxxxxx',
+                  ['ls'], 3, None)
+        self.remove_these.append(self.path('my_output_dir'))
+
+        for name, size in [('a', 10), ('b', 20)]:
+            with open(join(job.log_path, name), 'w') as f:
+                f.write('x' * size)
+
+        self.assertEqual(job._total_size([job.log_path]), 30)
+        self.assertEqual(job._total_size([join(job.log_path, 'a'),
+                                          join(job.log_path, 'c')]), 10)
+
     def test_extract_project_names_from_fastq_dir(self):
         package_root = abspath('./sequence_processing_pipeline')
         base_path = partial(join, package_root, 'tests', 'data')
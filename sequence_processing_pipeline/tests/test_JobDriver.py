@@ -0,0 +1,144 @@
+import unittest
+from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.JobDriver import JobDriver
+from sequence_processing_pipeline.PipelineError import (PipelineError,
+                                                        JobFailedError)
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree
+
+
+class FakeJob(Job):
+    # a Job that pretends to submit to Slurm. Each call to _query_slurm()
+    # advances all submitted jobs by one step, until they reach the state
+    # given in end_states.
+    end_states = {}
+    steps = {}
+
+    def __init__(self, root_dir, output_path, job_name, job_id, end_states):
+        super().__init__(root_dir, output_path, job_name, [], 1000)
+        self.job_id = job_id
+        FakeJob.end_states[job_id] = end_states
+        self.finalized = None
+
+    def submit(self, callback=None):
+        if self.force_job_fail:
+            raise JobFailedError("This job died.")
+        FakeJob.steps[self.job_id] = 2
+        return self.job_id
+
+    def _query_slurm(self, job_ids):
+        results = {}
+        for job_id in job_ids:
+            FakeJob.steps[job_id] -= 1
+            for array_id, state in FakeJob.end_states[job_id].items():
+                if FakeJob.steps[job_id] > 0:
+                    state = 'RUNNING'
+                results[array_id] = state
+        return results
+
+    def finalize(self, job_info):
+        if job_info['job_id'] == '3':
+            raise PipelineError("post-processing failed.")
+        self.finalized = job_info
+
+    def parse_logs(self):
+        return ['something error: Generic Standin Error (GSE)']
+
+
+class TestJobDriver(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.run_dir = self.path('211021_A00000_0000_SAMPLE')
+        self.output_path = self.path('job_driver_output')
+        self.polling_interval = Job.polling_interval_in_seconds
+        Job.polling_interval_in_seconds = 0.1
+
+    def tearDown(self):
+        Job.polling_interval_in_seconds = self.polling_interval
+        rmtree(self.output_path)
+
+    def test_run(self):
+        ok = FakeJob(self.run_dir, self.output_path, 'OKJob', '1',
+                     {'1_1': 'COMPLETED', '1_2': 'COMPLETED'})
+        ok2 = FakeJob(self.run_dir, self.output_path, 'OKJob2', '2',
+                      {'2': 'COMPLETED'})
+
+        driver = JobDriver(max_workers=2)
+        obs = driver.run([ok, ok2])
+        driver.shutdown()
+
+        self.assertEqual(obs, [{'job_id': '1',
+                                'job_state': {'COMPLETED': 2}},
+                               {'job_id': '2', 'job_state': 'COMPLETED'}])
+        self.assertEqual(ok.finalized, obs[0])
+        self.assertEqual(ok2.finalized, obs[1])
+
+    def test_complete_locally(self):
+        class CachedJob(FakeJob):
+            # a Job whose results are all up to date.
+            def complete_locally(self, callback=None):
+                return {'job_id': None, 'job_state': 'COMPLETED'}
+
+            def submit(self, callback=None):
+                raise PipelineError("a completed job was submitted.")
+
+        cached = CachedJob(self.run_dir, self.output_path, 'CachedJob', '6',
+                           {})
+        ok = FakeJob(self.run_dir, self.output_path, 'OKJob', '7',
+                     {'7': 'COMPLETED'})
+
+        driver = JobDriver()
+        obs = driver.run([cached, ok])
+        driver.shutdown()
+
+        exp = {'job_id': None, 'job_state': 'COMPLETED'}
+        self.assertEqual(obs, [exp, {'job_id': '7',
+                                     'job_state': 'COMPLETED'}])
+        self.assertEqual(cached.finalized, exp)
+
+        # run() completes it the same way.
+        cached.finalized = None
+        self.assertEqual(cached.run(), exp)
+        self.assertEqual(cached.finalized, exp)
+
+    def test_submit_failures(self):
+        failed = FakeJob(self.run_dir, self.output_path, 'FailedJob', '4',
+                         {'4_1': 'COMPLETED', '4_2': 'FAILED'})
+        bad_post = FakeJob(self.run_dir, self.output_path, 'BadPostJob', '3',
+                           {'3': 'COMPLETED'})
+        dead = FakeJob(self.run_dir, self.output_path, 'DeadJob', '5',
+                       {'5': 'COMPLETED'})
+        dead._toggle_force_job_fail()
+
+        callback_results = []
+
+        def my_callback(jid=None, status=None):
+            callback_results.append((jid, status))
+
+        driver = JobDriver()
+        futures = [driver.submit(job, callback=my_callback) for job in
+                   [failed, bad_post, dead]]
+        driver.wait()
+
+        with self.assertRaisesRegex(JobFailedError,
+                                    r'job 4 exited with jobs in the following'
+                                    r' states: COMPLETED, FAILED\nsomething '
+                                    r'error: Generic Standin Error'):
+            futures[0].result()
+
+        with self.assertRaisesRegex(PipelineError, 'post-processing failed.'):
+            futures[1].result()
+
+        with self.assertRaisesRegex(JobFailedError, 'This job died.\nsomething'
+                                                    ' error: Generic Standin'):
+            futures[2].result()
+
+        self.assertIsNone(failed.finalized)
+        self.assertIn(('4', 'COMPLETED: 1, FAILED: 1'), callback_results)
+        self.assertIn(('3', 'COMPLETED'), callback_results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from click.testing import CliRunner
+from sequence_processing_pipeline.Executor import LocalExecutor
+from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.Metrics import (Metrics, load_metrics,
+                                                  summarize_metrics)
+from sequence_processing_pipeline.scripts.cli import metrics_summary
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree
+from json import loads
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('metrics_output')
+
+        self.job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                       self.output_path, 'MetricsJob', [], 1000)
+        self.metrics_path = join(self.job.log_path, 'metrics.jsonl')
+
+    def tearDown(self):
+        rmtree(self.output_path)
+
+    def _read(self):
+        with open(self.metrics_path, 'r') as f:
+            return [loads(x) for x in f]
+
+    def test_metrics(self):
+        metrics = Metrics(self.metrics_path, source='Test')
+
+        with metrics.timer('one', detail='a'):
+            pass
+
+        metrics.start('two', key='1')
+        self.assertFalse(metrics.stop('two'))
+        self.assertTrue(metrics.stop('two', key='1'))
+        self.assertFalse(metrics.stop('two', key='1'))
+
+        metrics.record('three', 10, 15, task_id=2)
+
+        obs = self._read()
+        self.assertEqual([x['phase'] for x in obs], ['one', 'two', 'three'])
+        self.assertEqual(obs[0]['detail'], 'a')
+        self.assertTrue(all([x['source'] == 'Test' for x in obs]))
+        self.assertEqual(obs[2], {'phase': 'three', 'source': 'Test',
+                                  'task_id': 2, 'start': 10, 'end': 15,
+                                  'elapsed': 5})
+
+    def test_job_phases(self):
+        self.job.executor = LocalExecutor(max_workers=1)
+        self.job.executor.polling_interval_in_seconds = 0.1
+
+        script_path = join(self.job.output_path, 'job.sh')
+        with open(script_path, 'w') as f:
+            f.write('#!/bin/bash\n#SBATCH --array 1-2\nsleep 0.2\n')
+
+        self.job.metrics.start('script_generation')
+        job_id = self.job.submit_job(script_path,
+                                     exec_from=self.job.log_path)['job_id']
+
+        obs = self._read()
+        self.assertEqual([x['phase'] for x in obs],
+                         ['script_generation', 'submit', 'queue_wait', 'run'])
+        self.assertTrue(all([x['source'] == 'MetricsJob' for x in obs]))
+        self.assertEqual(obs[2]['job_id'], job_id)
+        self.assertGreaterEqual(obs[3]['elapsed'], 0.3)
+
+    def test_summarize_metrics(self):
+        metrics = Metrics(self.metrics_path, source='NuQCJob')
+        metrics.record('fastp', 0, 10, task_id=1)
+        metrics.record('fastp', 0, 20, task_id=2)
+        metrics.record('demux', 20, 30, task_id=1)
+
+        with open(join(self.output_path, 'metrics.jsonl'), 'w') as f:
+            f.write('{"phase": "NuQCJob", "source": "Pipeline", "start": 0,'
+                    ' "end": 40, "elapsed": 40}\n\n')
+
+        obs = summarize_metrics(load_metrics([self.output_path]))
+
+        self.assertEqual(obs['source'].tolist(),
+                         ['NuQCJob', 'NuQCJob', 'Pipeline'])
+        self.assertEqual(obs['phase'].tolist(),
+                         ['fastp', 'demux', 'NuQCJob'])
+        self.assertEqual(obs['count'].tolist(), [2, 1, 1])
+        self.assertEqual(obs['total'].tolist(), [30, 10, 40])
+        self.assertEqual(obs['mean'].tolist(), [15, 10, 40])
+        self.assertEqual(obs['max'].tolist(), [20, 10, 40])
+        self.assertEqual(obs['share'].tolist(), [0.75, 0.25, 1.0])
+
+        self.assertTrue(summarize_metrics(load_metrics([])).empty)
+
+        result = CliRunner().invoke(metrics_summary, [self.metrics_path])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('fastp', result.output)
+        self.assertIn('0.75', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
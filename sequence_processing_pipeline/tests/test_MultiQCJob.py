@@ -1,9 +1,12 @@
 import unittest
+from sys import executable
 from os.path import join, exists
 from functools import partial
+from sequence_processing_pipeline.JobDriver import JobDriver
 from sequence_processing_pipeline.MultiQCJob import MultiQCJob
 from sequence_processing_pipeline.PipelineError import JobFailedError
-from os import makedirs, listdir
+from sequence_processing_pipeline.FileManifest import FileManifest
+from os import makedirs, listdir, utime
 from shutil import rmtree, move
 
 
@@ -122,15 +125,18 @@ class TestMultiQCJob(unittest.TestCase):
                "cd sequence_processing_pipeline/tests/data/output_dir2/"
                "MultiQCJob", "", "module load multiqc.2.0", "",
                "step=${SLURM_ARRAY_TASK_ID}",
-               "cmd0=$(head -n $step sequence_processing_pipeline/tests/data/"
-               "output_dir2/MultiQCJob/MultiQCJob.array-details | tail -n 1)",
-               "eval $cmd0", "echo \"Cmd Completed: $cmd0\" > logs/MultiQCJob_"
-               "$step.completed"]
+               f"{executable} {job.task_runner_path} --manifest sequence_"
+               "processing_pipeline/tests/data/output_dir2/MultiQCJob/"
+               "MultiQCJob.tasks.json --task $step --cores 16 "
+               "--threads-per-command 16 "
+               "--results logs/MultiQCJob_$step.results.json --completed "
+               "logs/MultiQCJob_$step.completed"]
 
         with open(job_script_path, 'r') as f:
             obs = f.readlines()
             obs = [x.strip() for x in obs]
 
+        self.assertEqual(len(obs), len(exp))
         for a, b in zip(obs, exp):
             self.assertEqual(a, b)
 
@@ -145,6 +151,65 @@ class TestMultiQCJob(unittest.TestCase):
         for a, b in zip(obs, exp):
             self.assertEqual(a, b)
 
+    def test_use_cache(self):
+        def make_job():
+            FileManifest.clear()
+            return MultiQCJob(self.qc_root_path, self.output_path,
+                              self.raw_fastq_files_path.replace('/project1',
+                                                                ''),
+                              self.processed_fastq_files_path,
+                              16, 16,
+                              'sequence_processing_pipeline/tests/bin/multiqc',
+                              [], self.qiita_job_id,
+                              'queue_name', 4, 23, '8g', 30,
+                              self.fastqc_root_path, 1000,
+                              "sequence_processing_pipeline/"
+                              "multiqc-bclconvert-config.yaml", False,
+                              use_cache=True)
+
+        fastqc_path = join(self.fastqc_root_path, 'fastqc', 'project1',
+                           'bclconvert')
+        makedirs(fastqc_path)
+        zip_path = join(fastqc_path, 'sample1_R1_001_fastqc.zip')
+        html_path = join(fastqc_path, 'sample1_R1_001_fastqc.html')
+        for file_path in [zip_path, html_path]:
+            with open(file_path, 'w') as f:
+                f.write('This is a file.')
+
+        job = make_job()
+        self.assertEqual(len(job.array_cmds), 1)
+        self.assertIn(fastqc_path, job.array_cmds[0])
+
+        # simulate the array task completing.
+        report_path = join(job.output_path, 'multiqc', 'project1')
+        makedirs(report_path)
+        with open(join(report_path, 'multiqc_report.html'), 'w') as f:
+            f.write('This is a report.')
+        with open(join(job.log_path, 'MultiQCJob_1.completed'), 'w') as f:
+            f.write('')
+        job.finalize({'job_id': '1'})
+        self.assertTrue(exists(join(job.output_path, 'MultiQCJob.cache.json')))
+
+        # nothing has changed, hence there's nothing to submit.
+        job = make_job()
+        self.assertEqual(job.tool_version,
+                         'Hello. I am a fake multiqc binary.')
+        self.assertEqual(job.array_cmds, [])
+        self.assertEqual(job.run(), {'job_id': None,
+                                     'job_state': 'COMPLETED'})
+
+        driver = JobDriver()
+        self.assertEqual(driver.run([make_job()]),
+                         [{'job_id': None, 'job_state': 'COMPLETED'}])
+        driver.shutdown()
+
+        # MultiQC doesn't read FastQC's HTML reports.
+        utime(html_path, (1, 1))
+        self.assertEqual(make_job().array_cmds, [])
+
+        utime(zip_path, (1, 1))
+        self.assertEqual(len(make_job().array_cmds), 1)
+
     def test_error_msg_from_logs(self):
         job = MultiQCJob(self.qc_root_path, self.output_path,
                          self.raw_fastq_files_path.replace('/project1', ''),
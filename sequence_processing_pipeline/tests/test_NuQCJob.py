@@ -2110,11 +2110,15 @@ class TestNuQCJob(unittest.TestCase):
         obs = job._generate_mmi_filter_cmds("/my_work_dir")
 
         exp = [
+            "phase_start minimap2",
             "minimap2 -2 -ax sr -t 2 db_path/mmi_1.db /my_work_dir/seqs."
             "interleaved.fastq -a | samtools fastq -@ 2 -f 12 -F 256 > "
             "/my_work_dir/foo",
+            "phase_end minimap2 mmi_1.db",
+            "phase_start minimap2",
             "minimap2 -2 -ax sr -t 2 db_path/mmi_2.db /my_work_dir/foo -a"
             " | samtools fastq -@ 2 -f 12 -F 256 > /my_work_dir/bar",
+            "phase_end minimap2 mmi_2.db",
             "mv /my_work_dir/bar /my_work_dir/seqs.interleaved.filter_"
             "alignment.fastq",
             "[ -e /my_work_dir/foo ] && rm /my_work_dir/foo",
@@ -2152,11 +2156,15 @@ class TestNuQCJob(unittest.TestCase):
         obs = job._generate_mmi_filter_cmds("/my_work_dir")
 
         exp = [
+            "phase_start minimap2",
             "minimap2 -2 -ax sr -y -t 2 db_path/mmi_1.db /my_work_dir/seqs."
             "interleaved.fastq -a | samtools fastq -@ 2 -f 12 -F 256 -T BX > "
             "/my_work_dir/foo",
+            "phase_end minimap2 mmi_1.db",
+            "phase_start minimap2",
             "minimap2 -2 -ax sr -y -t 2 db_path/mmi_2.db /my_work_dir/foo -a"
             " | samtools fastq -@ 2 -f 12 -F 256 -T BX > /my_work_dir/bar",
+            "phase_end minimap2 mmi_2.db",
             "mv /my_work_dir/bar /my_work_dir/seqs.interleaved.filter_"
             "alignment.fastq",
             "[ -e /my_work_dir/foo ] && rm /my_work_dir/foo",
@@ -2194,11 +2202,15 @@ class TestNuQCJob(unittest.TestCase):
         obs = job._generate_mmi_filter_cmds("/my_work_dir")
 
         exp = [
+            "phase_start minimap2",
             "minimap2 -2 -ax sr -y -t 2 db_path/mmi_1.db /my_work_dir/seqs."
             "interleaved.fastq -a | samtools fastq -@ 2 -f 12 -F 256 -T BX > "
             "/my_work_dir/foo",
+            "phase_end minimap2 mmi_1.db",
+            "phase_start minimap2",
             "minimap2 -2 -ax sr -y -t 2 db_path/mmi_2.db /my_work_dir/foo -a"
             " | samtools fastq -@ 2 -f 12 -F 256 -T BX > /my_work_dir/bar",
+            "phase_end minimap2 mmi_2.db",
             "mv /my_work_dir/bar /my_work_dir/seqs.interleaved.filter_"
             "alignment.fastq",
             "[ -e /my_work_dir/foo ] && rm /my_work_dir/foo",
@@ -0,0 +1,115 @@
+import unittest
+from sequence_processing_pipeline.FileManifest import FileManifest
+from sequence_processing_pipeline.ResultCache import ResultCache
+from os import makedirs, utime
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.root = self.path('result_cache_test')
+        self.input_dir = join(self.root, 'inputs')
+        makedirs(self.input_dir)
+
+        self.input_path = join(self.input_dir, 'a.fastq.gz')
+        self.output_path = join(self.root, 'a_fastqc.zip')
+        self.cache_path = join(self.root, 'cache.json')
+
+        for some_path in [self.input_path, self.output_path]:
+            with open(some_path, 'w') as f:
+                f.write('contents')
+
+        FileManifest.clear()
+
+    def tearDown(self):
+        FileManifest.clear()
+        rmtree(self.root)
+
+    def _touch(self, some_path):
+        utime(some_path, (1, 1))
+
+    def _write(self, some_path, contents):
+        with open(some_path, 'w') as f:
+            f.write(contents)
+
+    def test_key(self):
+        cache = ResultCache(self.cache_path)
+
+        key = cache.key('cmd', [self.input_path], 'v1')
+        self.assertEqual(cache.key('cmd', [self.input_path], 'v1'), key)
+        self.assertNotEqual(cache.key('cmd -x', [self.input_path], 'v1'), key)
+        self.assertNotEqual(cache.key('cmd', [self.input_path], 'v2'), key)
+
+        # directories are identified by the files they contain.
+        key = cache.key('cmd', [self.input_dir, join(self.root, 'nope')],
+                        'v1')
+        self._touch(self.input_path)
+        self.assertNotEqual(cache.key('cmd', [self.input_dir,
+                                              join(self.root, 'nope')],
+                                      'v1'), key)
+
+    def test_ignore_suffixes(self):
+        cache = ResultCache(self.cache_path, ignore_suffixes=['.html'])
+        html_path = join(self.input_dir, 'a_fastqc.html')
+        self._write(html_path, 'report')
+
+        key = cache.key('cmd', [self.input_dir], 'v1')
+
+        # files w/an ignored suffix don't change the key.
+        self._touch(html_path)
+        FileManifest.clear()
+        self.assertEqual(cache.key('cmd', [self.input_dir], 'v1'), key)
+
+        self._touch(self.input_path)
+        FileManifest.clear()
+        self.assertNotEqual(cache.key('cmd', [self.input_dir], 'v1'), key)
+
+    def test_checksums(self):
+        cache = ResultCache(self.cache_path, checksums=True)
+
+        key = cache.key('cmd', [self.input_path], 'v1')
+
+        # touching a file doesn't change its key; changing it does.
+        self._touch(self.input_path)
+        self.assertEqual(cache.key('cmd', [self.input_path], 'v1'), key)
+
+        self._write(self.input_path, 'CONTENTS')
+        self.assertNotEqual(cache.key('cmd', [self.input_path], 'v1'), key)
+
+        # checksums are cached for each size and mtime seen.
+        self.assertEqual(len(cache.checksum_cache), 3)
+
+    def test_is_cached(self):
+        cache = ResultCache(self.cache_path)
+        key = cache.key('cmd', [self.input_path], 'v1')
+
+        self.assertFalse(cache.is_cached(key))
+        cache.add(key, 'cmd', [self.output_path])
+        self.assertTrue(cache.is_cached(key))
+        cache.save()
+
+        cache = ResultCache(self.cache_path)
+        self.assertTrue(cache.is_cached(key))
+        self.assertEqual(cache.entries[key]['command'], 'cmd')
+
+        # outputs that have changed or are missing are not up to date.
+        self._write(self.output_path, 'changed')
+        self.assertFalse(cache.is_cached(key))
+
+        cache.add(key, 'cmd', [self.output_path])
+        self.assertTrue(cache.is_cached(key))
+        rmtree(self.input_dir)
+        self.assertTrue(cache.is_cached(key))
+
+        cache.add(key, 'cmd', [self.output_path, self.cache_path])
+        self.assertTrue(cache.is_cached(key))
+        self._write(self.cache_path, '')
+        self.assertFalse(cache.is_cached(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from click.testing import CliRunner
+from sequence_processing_pipeline.SeqCounter import (count_seqs,
+                                                     count_seqs_parallel,
+                                                     count_seqs_w_histograms,
+                                                     estimate_seqs)
+from sequence_processing_pipeline.aggregate_counts import load_count_records
+from sequence_processing_pipeline.scripts.cli import count_seqs as cli_count
+from os import makedirs
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree
+import gzip
+import numpy as np
+
+
+class TestSeqCounter(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('seq_counter_output')
+        makedirs(self.output_path, exist_ok=True)
+
+        self.fastq = ('@r1 comment\nACGTN\n+\nIIIII\n'
+                      '@r2\nGGGG\n+r2\n####\n'
+                      '@r3\nACGTNACGTN\n+\nIIIIIIIIII\n')
+
+        self.gz_path = join(self.output_path, 'a_R1_001.fastq.gz')
+        with gzip.open(self.gz_path, 'wt') as f:
+            f.write(self.fastq)
+
+        self.fastq_path = join(self.output_path, 'b_R1_001.fastq')
+        with open(self.fastq_path, 'w') as f:
+            f.write(self.fastq * 2)
+
+    def tearDown(self):
+        rmtree(self.output_path)
+
+    def test_count_seqs(self):
+        self.assertEqual(count_seqs(self.gz_path), (3, 19))
+        self.assertEqual(count_seqs(self.fastq_path), (6, 38))
+
+        # lines split across blocks are counted once.
+        for block_size in [1, 3, 7, 64]:
+            self.assertEqual(count_seqs(self.gz_path, block_size=block_size),
+                             (3, 19))
+
+        # the last line doesn't need to be followed by a newline.
+        with open(self.fastq_path, 'w') as f:
+            f.write(self.fastq.strip())
+        self.assertEqual(count_seqs(self.fastq_path, block_size=5), (3, 19))
+
+        with open(self.fastq_path, 'w') as f:
+            f.write(self.fastq + '@r4\nACGT\n')
+        with self.assertRaisesRegex(ValueError, 'truncated record'):
+            count_seqs(self.fastq_path)
+
+        # empty files contain no reads.
+        with gzip.open(self.gz_path, 'wt') as f:
+            f.write('')
+        self.assertEqual(count_seqs(self.gz_path), (0, 0))
+
+    def test_count_seqs_parallel(self):
+        paths = [self.gz_path, self.fastq_path, self.gz_path]
+        exp = [(3, 19), (6, 38), (3, 19)]
+
+        self.assertEqual(count_seqs_parallel(paths), exp)
+        self.assertEqual(count_seqs_parallel(paths, processes=2), exp)
+
+    def test_count_seqs_w_histograms(self):
+        for block_size in [1, 7, 64, 1024]:
+            obs = count_seqs_w_histograms(self.gz_path, block_size=block_size)
+            self.assertEqual(obs[:2], (3, 19))
+
+            histograms = obs[2]
+            self.assertEqual(histograms['length'].tolist(),
+                             [0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 1])
+            # 'I' is Q40 and '#' is Q2.
+            exp = np.zeros(94, dtype=int)
+            exp[2] = 1
+            exp[40] = 2
+            self.assertEqual(histograms['mean_quality'].tolist(),
+                             exp.tolist())
+            self.assertEqual(histograms['q30_bases'], 15)
+
+        # the last line doesn't need to be followed by a newline.
+        with open(self.fastq_path, 'w') as f:
+            f.write(self.fastq.strip())
+        self.assertEqual(count_seqs_w_histograms(self.fastq_path)[:2],
+                         (3, 19))
+
+        with open(self.fastq_path, 'w') as f:
+            f.write(self.fastq + '@r4\nACGT\n')
+        with self.assertRaisesRegex(ValueError, 'truncated record'):
+            count_seqs_w_histograms(self.fastq_path, block_size=5)
+
+        self.assertEqual(
+            [x[:2] for x in count_seqs_parallel([self.gz_path, self.gz_path],
+                                                processes=2,
+                                                histograms=True)],
+            [(3, 19), (3, 19)])
+
+    def test_cli(self):
+        results_path = join(self.output_path, 'seq_counts.jsonl')
+        result = CliRunner().invoke(cli_count, [self.gz_path,
+                                                self.fastq_path,
+                                                '--results', results_path,
+                                                '--histograms-dir',
+                                                self.output_path])
+        self.assertEqual(result.exit_code, 0)
+
+        self.assertEqual(load_count_records(results_path),
+                         {self.gz_path: (3, 19), self.fastq_path: (6, 38)})
+
+        with np.load(join(self.output_path,
+                          'b_R1_001.fastq.npz')) as histograms:
+            self.assertEqual(int(histograms['q30_bases']), 30)
+            self.assertEqual(histograms['length'][10], 2)
+
+    def test_estimate_seqs(self):
+        records = []
+        for i in range(20000):
+            # reads of varying length.
+            length = [151, 150, 35][i % 3]
+            records.append(f'@read{i:05d}\n' + 'ACGT' * (length // 4) +
+                           'A' * (length % 4) + '\n+\n' + 'F' * length +
+                           '\n')
+        data = ''.join(records).encode()
+
+        with open(self.fastq_path, 'wb') as f:
+            f.write(data)
+        exp = count_seqs(self.fastq_path)
+
+        # a single gzip member.
+        with gzip.open(self.gz_path, 'wb') as f:
+            f.write(data)
+
+        # many gzip members, as bgzip writes.
+        multi_path = join(self.output_path, 'c_R1_001.fastq.gz')
+        with open(multi_path, 'wb') as f:
+            for i in range(0, len(data), 10000):
+                f.write(gzip.compress(data[i:i + 10000]))
+
+        for file_path in [self.fastq_path, self.gz_path, multi_path]:
+            obs = estimate_seqs(file_path, sample_size=16384)
+            self.assertAlmostEqual(obs[0] / exp[0], 1, delta=0.01)
+            self.assertAlmostEqual(obs[1] / exp[1], 1, delta=0.01)
+
+        # files smaller than a sample are counted.
+        self.assertEqual(estimate_seqs(self.gz_path), exp)
+        self.assertEqual(count_seqs_parallel([self.gz_path], estimate=True),
+                         [exp])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
-from os.path import join
+from os.path import exists, join
+from sequence_processing_pipeline.JobDriver import JobDriver
+from sequence_processing_pipeline.PipelineError import PipelineError
 from sequence_processing_pipeline.SeqCountsJob import SeqCountsJob
 from functools import partial
+from os import makedirs
+from shutil import rmtree
+import gzip
+import numpy as np
 import unittest
 import pandas as pd
 from pandas.testing import assert_frame_equal
@@ -76,6 +82,203 @@ class TestSeqCountsJob(unittest.TestCase):
         # best description of the error so return it to the user.
         assert_frame_equal(obs, exp, check_like=True)
 
+    def test_in_process(self):
+        fastq_path = self.path('data', 'seq_counts_in_process')
+        makedirs(fastq_path, exist_ok=True)
+        self.addCleanup(rmtree, fastq_path)
+
+        file_paths = []
+        for i, orientation in enumerate(['R1', 'R2']):
+            file_path = join(fastq_path, f'sample1_S1_L001_{orientation}_'
+                                         '001.fastq.gz')
+            with gzip.open(file_path, 'wt') as f:
+                f.write('@r1\nACGT\n+\nIIII\n' * (i + 1))
+            file_paths.append(file_path)
+
+        files_to_count_path = join(fastq_path, 'files_to_count.txt')
+        with open(files_to_count_path, 'w') as f:
+            f.write('\n'.join(file_paths) + '\n')
+
+        job = SeqCountsJob(self.run_dir, fastq_path, self.queue_name,
+                           self.node_count, self.wall_time_limit, self.jmem,
+                           self.modules_to_load, self.qiita_job_id,
+                           self.max_array_length, files_to_count_path,
+                           self.dummy_sample_sheet, in_process_bytes=1024,
+                           processes=2)
+
+        self.assertTrue(job._count_in_process())
+        job.in_process_bytes = 10
+        self.assertFalse(job._count_in_process())
+
+        job._count_files()
+
+        obs = job._aggregate_counts_by_file()
+        self.assertEqual(obs['sample1_S1_L001_R1_001.fastq.gz'],
+                         {'seq_counts': 1, 'base_pairs': 4})
+        self.assertEqual(obs['sample1_S1_L001_R2_001.fastq.gz'],
+                         {'seq_counts': 2, 'base_pairs': 8})
+
+        # JobDriver counts in-process too, rather than submitting an array.
+        job.in_process_bytes = 1024
+        driver = JobDriver()
+        self.assertEqual(driver.run([job]),
+                         [{'job_id': None, 'job_state': 'COMPLETED'}])
+        driver.shutdown()
+        self.assertTrue(exists(join(job.output_path, 'SeqCounts.csv')))
+
+    def test_count_cache(self):
+        fastq_path = self.path('data', 'seq_counts_cache')
+        makedirs(fastq_path, exist_ok=True)
+        self.addCleanup(rmtree, fastq_path)
+
+        file_paths = []
+        for i, orientation in enumerate(['R1', 'R2']):
+            file_path = join(fastq_path, f'sample1_S1_L001_{orientation}_'
+                                         '001.fastq.gz')
+            with gzip.open(file_path, 'wt') as f:
+                f.write('@r1\nACGT\n+\nIIII\n' * (i + 1))
+            file_paths.append(file_path)
+
+        files_to_count_path = join(fastq_path, 'files_to_count.txt')
+        with open(files_to_count_path, 'w') as f:
+            f.write('\n'.join(file_paths) + '\n')
+
+        cache_path = join(fastq_path, 'counts.sqlite')
+
+        def make_job():
+            return SeqCountsJob(self.run_dir, fastq_path, self.queue_name,
+                                self.node_count, self.wall_time_limit,
+                                self.jmem, self.modules_to_load,
+                                self.qiita_job_id, self.max_array_length,
+                                files_to_count_path, self.dummy_sample_sheet,
+                                in_process_bytes=1024,
+                                count_cache_path=cache_path)
+
+        job = make_job()
+        self.assertEqual(job.files_to_submit, file_paths)
+        job._count_files()
+        job._aggregate_counts_by_file()
+
+        # a file counted previously is not submitted again.
+        with gzip.open(file_paths[1], 'wt') as f:
+            f.write('@r1\nACGT\n+\nIIII\n' * 3)
+
+        job = make_job()
+        self.assertEqual(job.files_to_submit, [file_paths[1]])
+        self.assertEqual(job.file_count, 1)
+
+        obs = job._generate_job_script()
+        with open(obs, 'r') as f:
+            self.assertIn(join(job.output_path, 'files_to_count.txt'),
+                          f.read())
+
+        job._count_files()
+        obs = job._aggregate_counts_by_file()
+        self.assertEqual(obs['sample1_S1_L001_R1_001.fastq.gz'],
+                         {'seq_counts': 1, 'base_pairs': 4})
+        self.assertEqual(obs['sample1_S1_L001_R2_001.fastq.gz'],
+                         {'seq_counts': 3, 'base_pairs': 12})
+
+        # when every file has a cached count, nothing is submitted.
+        job = make_job()
+        self.assertEqual(job.files_to_submit, [])
+        job.in_process_bytes = 0
+        with self.assertRaisesRegex(PipelineError, 'no files to submit'):
+            job.submit()
+
+        driver = JobDriver()
+        self.assertEqual(driver.run([job]),
+                         [{'job_id': None, 'job_state': 'COMPLETED'}])
+        driver.shutdown()
+        self.assertTrue(exists(join(job.output_path, 'SeqCounts.csv')))
+
+    def test_histograms(self):
+        fastq_path = self.path('data', 'seq_counts_histograms')
+        makedirs(fastq_path, exist_ok=True)
+        self.addCleanup(rmtree, fastq_path)
+
+        file_path = join(fastq_path, 'sample1_S1_L001_R1_001.fastq.gz')
+        with gzip.open(file_path, 'wt') as f:
+            f.write('@r1\nACGT\n+\nII##\n')
+
+        files_to_count_path = join(fastq_path, 'files_to_count.txt')
+        with open(files_to_count_path, 'w') as f:
+            f.write(file_path + '\n')
+
+        job = SeqCountsJob(self.run_dir, fastq_path, self.queue_name,
+                           self.node_count, self.wall_time_limit, self.jmem,
+                           self.modules_to_load, self.qiita_job_id,
+                           self.max_array_length, files_to_count_path,
+                           self.dummy_sample_sheet, histograms=True)
+
+        # array tasks count w/the pipeline's counter rather than seqtk.
+        with open(job._generate_job_script(), 'r') as f:
+            obs = f.read()
+        self.assertIn('scripts.cli count-seqs --results '
+                      f'{job.results_path} --histograms-dir '
+                      f'{job.histograms_path} ${{my_file}}', obs)
+        self.assertNotIn('seqtk', obs)
+
+        job._count_files()
+
+        with np.load(join(job.histograms_path,
+                          'sample1_S1_L001_R1_001.fastq.gz.npz')) as obs:
+            self.assertEqual(obs['length'][4], 1)
+            self.assertEqual(obs['mean_quality'][21], 1)
+            self.assertEqual(int(obs['q30_bases']), 2)
+
+        self.assertEqual(job._aggregate_counts_by_file(),
+                         {'sample1_S1_L001_R1_001.fastq.gz':
+                          {'seq_counts': 1, 'base_pairs': 4}})
+
+    def test_estimate(self):
+        fastq_path = self.path('data', 'seq_counts_estimate')
+        makedirs(fastq_path, exist_ok=True)
+        self.addCleanup(rmtree, fastq_path)
+
+        file_path = join(fastq_path, 'sample1_S1_L001_R1_001.fastq.gz')
+        with gzip.open(file_path, 'wt') as f:
+            f.write('@r1\nACGT\n+\nIIII\n' * 3)
+
+        files_to_count_path = join(fastq_path, 'files_to_count.txt')
+        with open(files_to_count_path, 'w') as f:
+            f.write(file_path + '\n')
+
+        job = SeqCountsJob(self.run_dir, fastq_path, self.queue_name,
+                           self.node_count, self.wall_time_limit, self.jmem,
+                           self.modules_to_load, self.qiita_job_id,
+                           self.max_array_length, files_to_count_path,
+                           self.dummy_sample_sheet, estimate=True,
+                           count_cache_path=join(fastq_path, 'counts.db'))
+
+        # estimates are made in-process, regardless of size.
+        self.assertTrue(job._count_in_process())
+
+        job._count_files()
+        self.assertTrue(job.results_path.endswith(
+            'seq_counts.approximate.jsonl'))
+
+        self.assertEqual(job._aggregate_counts_by_file(),
+                         {'sample1_S1_L001_R1_001.fastq.gz':
+                          {'seq_counts': 3, 'base_pairs': 12}})
+        self.assertEqual(job.estimated_files,
+                         {'sample1_S1_L001_R1_001.fastq.gz'})
+
+        # estimates are never cached.
+        self.assertIsNone(job.count_cache.get(file_path))
+
+        with self.assertRaisesRegex(PipelineError, "can't be submitted"):
+            job.submit()
+
+        # JobDriver estimates in-process too, and the results are labeled
+        # approximate.
+        driver = JobDriver()
+        self.assertEqual(driver.run([job]),
+                         [{'job_id': None, 'job_state': 'COMPLETED'}])
+        driver.shutdown()
+        obs = pd.read_csv(join(job.output_path, 'SeqCounts.csv'))
+        self.assertIn('approximate', obs.columns)
+
 
 if __name__ == '__main__':
     unittest.main()
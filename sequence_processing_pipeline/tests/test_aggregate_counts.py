@@ -0,0 +1,57 @@
+import unittest
+from sequence_processing_pipeline.aggregate_counts import (aggregate_counts,
+                                                           load_count_records)
+from os import makedirs
+from os.path import abspath, join
+from functools import partial
+from shutil import rmtree, copytree
+
+
+class TestAggregateCounts(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('aggregate_counts_output')
+        makedirs(self.output_path, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.output_path)
+
+    def test_load_count_records(self):
+        results_path = join(self.output_path, 'seq_counts.jsonl')
+        with open(results_path, 'w') as f:
+            f.write('{"file": "/a/b.fastq.gz", "seq_counts": 1, '
+                    '"base_pairs": 10}\n'
+                    '\n'
+                    '{"file": "/a/c.fastq.gz", "seq_counts": 2, '
+                    '"base_pairs": 20}\n'
+                    # the file was counted again.
+                    '{"file": "/a/b.fastq.gz", "seq_counts": 3, '
+                    '"base_pairs": 30}\n'
+                    # a partial record.
+                    '{"file": "/a/d.fastq.gz", "seq_')
+
+        self.assertEqual(load_count_records(results_path),
+                         {'/a/b.fastq.gz': (3, 30),
+                          '/a/c.fastq.gz': (2, 20)})
+
+        obs = aggregate_counts(self.output_path)
+        self.assertEqual(obs, {'/a': {
+            'b.fastq.gz': {'seq_counts': 3, 'base_pairs': 30},
+            'c.fastq.gz': {'seq_counts': 2, 'base_pairs': 20}}})
+
+    def test_aggregate_logs(self):
+        # logs are parsed when there is no results file.
+        copytree(self.path('seq_counts_logs'),
+                 join(self.output_path, 'logs'))
+
+        obs = aggregate_counts(self.output_path)
+        self.assertEqual(len(obs), 1)
+        counts = list(obs.values())[0]
+        self.assertEqual(counts['Test_8_22_2014_R2_example_S2_L007_R1_001'
+                                '.fastq.gz'],
+                         {'seq_counts': 64464162, 'base_pairs': 8345327641})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ from sequence_processing_pipeline.Commands import (split_similar_size_bins,
                                                    demux)
 import io
 from os.path import join
+from zipfile import ZipFile
 
 
 class CommandTests(unittest.TestCase):
@@ -175,6 +176,46 @@ class CommandTests(unittest.TestCase):
             self.assertFalse(os.path.exists(join(tmp, 'a_R1.fastq.gz')))
             self.assertFalse(os.path.exists(join(tmp, 'a_R2.fastq.gz')))
 
+    def test_demux_w_stats(self):
+        with TemporaryDirectory() as tmp:
+            id_map = [
+                ["1", "a_R1", "a_R2", "Project_12345"],
+                ["2", "b_R1", "b_R2", "Project_12345"]
+            ]
+
+            infile_data = '\n'.join(['@1::MUX::foo/1', 'ATGC', '+', '!!!!',
+                                     '@1::MUX::foo/2', 'ATGC', '+', '!!!!',
+                                     '@2::MUX::baz/1', 'ATGC', '+', 'IIII',
+                                     '@2::MUX::baz/2', 'ATGC', '+', '!!!!',
+                                     '@2::MUX::bing/1 BX:Z:TATGACATATGCGGCCCT',
+                                     'GGCCA', '+', 'IIIII'])
+            infile = io.StringIO(infile_data)
+
+            stats_dir = join(tmp, 'qc_stats')
+            demux(id_map, infile, tmp, 1, 2, stats_dir=stats_dir)
+
+            # demuxed files are unchanged.
+            obs = gzip.open(join(tmp, 'Project_12345', 'b_R1.fastq.gz'),
+                            'rt').read()
+            self.assertEqual(obs, '@baz/1\nATGC\n+\nIIII\n'
+                                  '@bing/1 BX:Z:TATGACATATGCGGCCCT\nGGCCA'
+                                  '\n+\nIIIII')
+
+            # reports are only written for the files demuxed by this task.
+            self.assertEqual(sorted(os.listdir(join(stats_dir,
+                                                    'Project_12345'))),
+                             ['b_R1_fastqc.html', 'b_R1_fastqc.zip',
+                              'b_R2_fastqc.html', 'b_R2_fastqc.zip'])
+
+            with ZipFile(join(stats_dir, 'Project_12345',
+                              'b_R1_fastqc.zip')) as z:
+                obs = z.read('b_R1_fastqc/fastqc_data.txt').decode()
+
+            self.assertIn('Filename\tb_R1.fastq.gz\n', obs)
+            self.assertIn('Total Sequences\t2\n', obs)
+            self.assertIn('Sequence length\t4-5\n', obs)
+            self.assertIn('%GC\t67\n', obs)
+
 
 if __name__ == '__main__':
     unittest.main()
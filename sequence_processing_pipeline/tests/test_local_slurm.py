@@ -0,0 +1,122 @@
+import unittest
+from sequence_processing_pipeline.Executor import SlurmExecutor
+from sequence_processing_pipeline.Job import Job
+from sequence_processing_pipeline.PipelineError import JobFailedError
+from sequence_processing_pipeline.scripts.local_slurm import (
+    install, benchmark_report, Scheduler, _write_json)
+from os import environ, pathsep, stat
+from os.path import abspath, join, dirname, exists
+from functools import partial
+from shutil import rmtree
+from tempfile import mkdtemp
+
+
+class TestLocalSlurm(unittest.TestCase):
+    def setUp(self):
+        package_root = abspath('./sequence_processing_pipeline')
+        self.path = partial(join, package_root, 'tests', 'data')
+        self.output_path = self.path('local_slurm_output')
+        self.bin_dir = mkdtemp()
+        self.state_dir = mkdtemp()
+        install(self.bin_dir)
+
+        self.environ = dict(environ)
+        environ['PATH'] = self.bin_dir + pathsep + environ['PATH']
+        environ['PYTHONPATH'] = dirname(package_root)
+        environ['LOCAL_SLURM_STATE_DIR'] = self.state_dir
+        environ['LOCAL_SLURM_LATENCY'] = '0.5'
+        environ['LOCAL_SLURM_SLOTS'] = '2'
+        environ['LOCAL_SLURM_IDLE_TIMEOUT'] = '1'
+
+        self.delay = SlurmExecutor.submission_delay_in_seconds
+        self.interval = Job.polling_interval_in_seconds
+        SlurmExecutor.submission_delay_in_seconds = 0
+        Job.polling_interval_in_seconds = 0.2
+
+        self.job = Job(self.path('211021_A00000_0000_SAMPLE'),
+                       self.output_path, 'LocalSlurmJob', [], 1000)
+
+    def tearDown(self):
+        environ.clear()
+        environ.update(self.environ)
+        SlurmExecutor.submission_delay_in_seconds = self.delay
+        Job.polling_interval_in_seconds = self.interval
+        for some_path in [self.output_path, self.bin_dir, self.state_dir]:
+            rmtree(some_path)
+
+    def _write_script(self, name, lines):
+        script_path = join(self.job.output_path, name)
+        with open(script_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return script_path
+
+    def test_local_slurm(self):
+        # one task at a time, as FastQCJob's %pool_size would throttle it.
+        script_path = self._write_script('array.sh', [
+            '#!/bin/bash',
+            '#SBATCH --array 1-3%1',
+            f'#SBATCH --output {self.job.log_path}/%x_%A_%a.out',
+            'sleep 0.3',
+            'echo ${SLURM_ARRAY_TASK_ID}'])
+
+        obs = self.job.submit_job(script_path,
+                                  job_parameters='--parsable -J throttled',
+                                  exec_from=self.job.log_path)
+        self.assertEqual(obs, {'job_id': '1',
+                               'job_state': {'COMPLETED': 3}})
+
+        for task_id in range(1, 4):
+            with open(join(self.job.log_path,
+                           f'throttled_1_{task_id}.out')) as f:
+                self.assertEqual(f.read(), f'{task_id}\n')
+
+        script_path = self._write_script('fail.sh', [
+            '#!/bin/bash',
+            'exit 1'])
+
+        with self.assertRaisesRegex(JobFailedError,
+                                    'job 2 exited with status FAILED'):
+            self.job.submit_job(script_path, exec_from=self.job.log_path)
+
+        obs = self.job._system_call('sacct -j 1 --format JobID,State')
+        self.assertEqual(obs['stdout'], 'JobID|State\n1_1|COMPLETED\n'
+                                        '1_2|COMPLETED\n1_3|COMPLETED\n')
+
+        report = benchmark_report(self.state_dir)
+        self.assertEqual(report['critical_path'], ['1', '2'])
+
+        throttled = report['jobs'][0]
+        self.assertEqual(throttled['task_count'], 3)
+        self.assertGreaterEqual(throttled['queue_wait'], 0.5)
+        # tasks ran one after another.
+        self.assertGreaterEqual(throttled['makespan'],
+                                0.5 + throttled['busy_time'])
+        self.assertGreaterEqual(throttled['scheduling_overhead'],
+                                throttled['busy_time'] -
+                                throttled['longest_task'])
+
+        # job files hold the submitter's environment.
+        self.assertEqual(stat(join(self.state_dir, 'job-1.json')).st_mode &
+                         0o777, 0o600)
+
+    def test_has_new_jobs(self):
+        _write_json(join(self.state_dir, 'job-1.json'),
+                    {'job_id': '1', 'task_ids': [None]})
+        state_path = join(self.state_dir, 'job-1.state.json')
+
+        # checking for new jobs must not claim them; only the scheduler
+        # holding the lock may do so.
+        sched = Scheduler(self.state_dir, 1)
+        self.assertTrue(sched.has_new_jobs())
+        self.assertFalse(exists(state_path))
+
+        # a scheduler that takes over still sees the job as new.
+        sched = Scheduler(self.state_dir, 1)
+        self.assertTrue(sched.load_new_jobs())
+        self.assertTrue(exists(state_path))
+        self.assertFalse(sched.has_new_jobs())
+        self.assertFalse(Scheduler(self.state_dir, 1).has_new_jobs())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from sequence_processing_pipeline.scripts.task_runner import (main,
+                                                              load_commands,
+                                                              run_commands)
+from os.path import exists, join
+from json import dumps, load
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+
+class TestTaskRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.manifest_path = join(self.tmp_dir, 'tasks.json')
+        self.results_path = join(self.tmp_dir, 'Job_1.results.json')
+        self.completed_path = join(self.tmp_dir, 'Job_1.completed')
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def _write_manifest(self, manifest):
+        with open(self.manifest_path, 'w') as f:
+            f.write(dumps(manifest))
+
+    def test_load_commands(self):
+        self._write_manifest({'1': ['a', 'b'], '2': ['c']})
+        self.assertEqual(load_commands(self.manifest_path, 1), ['a', 'b'])
+        self.assertEqual(load_commands(self.manifest_path, '2'), ['c'])
+
+        with self.assertRaisesRegex(ValueError, 'task 3 is not in'):
+            load_commands(self.manifest_path, 3)
+
+    def test_run_commands(self):
+        start = time()
+        obs = run_commands(['sleep 0.5', 'sleep 0.5', 'exit 3',
+                            'python -c "x = bytearray(50 * 1024 * 1024)"'], 4)
+
+        # commands are run concurrently.
+        self.assertLess(time() - start, 1)
+
+        self.assertEqual([x['index'] for x in obs], [0, 1, 2, 3])
+        self.assertEqual([x['return_code'] for x in obs], [0, 0, 3, 0])
+        self.assertGreaterEqual(obs[0]['elapsed'], 0.5)
+        self.assertGreater(obs[3]['max_rss_kb'], 50 * 1024)
+
+        start = time()
+        run_commands(['sleep 0.3', 'sleep 0.3'], 1)
+        self.assertGreaterEqual(time() - start, 0.6)
+
+    def test_main(self):
+        out_path = join(self.tmp_dir, 'out')
+        self._write_manifest({'1': [f'echo a > {out_path}',
+                                    f'echo b >> {out_path}'],
+                              '2': ['exit 1', 'true']})
+
+        args = ['--manifest', self.manifest_path, '--task', '1', '--cores',
+                '4', '--threads-per-command', '4', '--results',
+                self.results_path, '--completed', self.completed_path]
+
+        self.assertEqual(main(args), 0)
+
+        # a single command at a time is run in order.
+        with open(out_path, 'r') as f:
+            self.assertEqual(f.read(), 'a\nb\n')
+
+        with open(self.results_path, 'r') as f:
+            obs = load(f)
+
+        self.assertEqual(obs['task'], 1)
+        self.assertEqual(obs['max_concurrent'], 1)
+        self.assertEqual(obs['failed'], 0)
+        self.assertEqual([x['command'] for x in obs['commands']],
+                         [f'echo a > {out_path}', f'echo b >> {out_path}'])
+        self.assertTrue(exists(self.completed_path))
+
+        # failures are recorded and no .completed file is written.
+        results_path = join(self.tmp_dir, 'Job_2.results.json')
+        completed_path = join(self.tmp_dir, 'Job_2.completed')
+        self.assertEqual(main(['--manifest', self.manifest_path, '--task',
+                               '2', '--cores', '2', '--results', results_path,
+                               '--completed', completed_path]), 0)
+
+        with open(results_path, 'r') as f:
+            obs = load(f)
+
+        self.assertEqual(obs['max_concurrent'], 2)
+        self.assertEqual(obs['failed'], 1)
+        self.assertEqual(obs['commands'][0]['return_code'], 1)
+        self.assertFalse(exists(completed_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
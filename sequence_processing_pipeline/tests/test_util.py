@@ -1,5 +1,5 @@
 import unittest
-from sequence_processing_pipeline.util import iter_paired_files
+from sequence_processing_pipeline.util import iter_paired_files, PrefixIndex
 
 
 class TestUtil(unittest.TestCase):
@@ -41,5 +41,30 @@ class TestUtil(unittest.TestCase):
             list(iter_paired_files(files))
 
 
+class TestPrefixIndex(unittest.TestCase):
+    def test_longest_match(self):
+        index = PrefixIndex(['T_LS_7_15_15B', 'T_LS_7_15_15B_SRE', 'ab'])
+
+        self.assertEqual(index.longest_match('T_LS_7_15_15B_SRE_S1_L001_R1_'
+                                             '001.fastq.gz'),
+                         'T_LS_7_15_15B_SRE')
+        self.assertEqual(index.longest_match('T_LS_7_15_15B_S2_L001_R1_001.'
+                                             'fastq.gz'), 'T_LS_7_15_15B')
+        self.assertEqual(index.longest_match('abc'), 'ab')
+        self.assertIsNone(index.longest_match('a'))
+        self.assertIsNone(PrefixIndex([]).longest_match('abc'))
+
+    def test_matches(self):
+        index = PrefixIndex(['A', 'A_B', 'AB', 'A_B_S1'], delimiter='_')
+
+        self.assertEqual(index.matches('A_B_S1_L001_R1_001.fastq.gz'),
+                         ['A_B_S1', 'A_B', 'A'])
+        self.assertEqual(index.matches('AB_S1_L001_R1_001.fastq.gz'),
+                         ['AB'])
+        self.assertEqual(index.longest_match('AB_S1'), 'AB')
+        self.assertEqual(index.matches('A_B'), ['A'])
+        self.assertEqual(index.matches('ABC_S1'), [])
+
+
 if __name__ == '__main__':
     unittest.main()
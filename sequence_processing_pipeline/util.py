@@ -82,3 +82,45 @@ def iter_paired_files(files):
             raise ValueError(f"Unable to match:\n{r1_fp}\n{r2_fp}")
 
         yield (r1_fp, r2_fp)
+
+
+class PrefixIndex:
+    def __init__(self, prefixes, delimiter=''):
+        """
+        Matches strings to the prefixes they begin with.
+
+        Prefixes are grouped by length, hence matching a string costs one
+        dictionary lookup for each distinct prefix length rather than one
+        comparison for each prefix.
+        :param prefixes: A list of prefixes e.g.: sample-ids.
+        :param delimiter: An optional string that must immediately follow a
+                          prefix for it to match e.g.: '_'.
+        """
+        self.prefixes = set(prefixes)
+        self.delimiter = delimiter
+        # longest first.
+        self.lengths = sorted({len(x) for x in self.prefixes}, reverse=True)
+
+    def matches(self, s):
+        """
+        Returns all prefixes that s begins with.
+        :param s: A string e.g.: a file name.
+        :return: A list of matching prefixes, longest first.
+        """
+        return [s[:length] for length in self.lengths
+                if self._matches_at(s, length)]
+
+    def longest_match(self, s):
+        """
+        Returns the longest prefix that s begins with.
+        :param s: A string e.g.: a file name.
+        :return: The longest matching prefix or None if no prefix matches.
+        """
+        for length in self.lengths:
+            if self._matches_at(s, length):
+                return s[:length]
+        return None
+
+    def _matches_at(self, s, length):
+        return (len(s) >= length and s[:length] in self.prefixes and
+                s.startswith(self.delimiter, length))
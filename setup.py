@@ -47,5 +47,13 @@ setup(name='sequence-processing-pipeline',
         ],
       entry_points={
           'console_scripts': ['demux=sequence_processing_pipeline.scripts.cli'
-                              ':demux'],
+                              ':demux',
+                              'metrics_summary=sequence_processing_pipeline.'
+                              'scripts.cli:metrics_summary',
+                              'fastq_qc=sequence_processing_pipeline.'
+                              'scripts.cli:fastq_qc',
+                              'fastp_summary=sequence_processing_pipeline.'
+                              'scripts.cli:fastp_summary',
+                              'count_seqs=sequence_processing_pipeline.'
+                              'scripts.cli:count_seqs'],
       })